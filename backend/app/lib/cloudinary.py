@@ -1,13 +1,19 @@
-import cloudinary
-import os
-from dotenv import load_dotenv
+from app.lib.settings import settings
 
-load_dotenv()
+_sdk = None
 
-cloudinary.config(
-    cloud_name=os.environ.get("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.environ.get("CLOUDINARY_API_KEY"),
-    api_secret=os.environ.get("CLOUDINARY_API_SECRET")
-)
+def get_cloudinary():
+    """The cloudinary SDK, imported and configured on first use rather than at startup."""
+    global _sdk
 
-# cloudinary = cloudinary
\ No newline at end of file
+    if _sdk is None:
+        import cloudinary
+        import cloudinary.utils
+
+        cloudinary.config(
+            cloud_name=settings.cloudinary_cloud_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret
+        )
+        _sdk = cloudinary
+    return _sdk
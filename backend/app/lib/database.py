@@ -1,37 +1,165 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 import os
-from dotenv import load_dotenv
+import threading
+import time
 
-load_dotenv()
+from app.lib.settings import settings
 
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
-DATABASE_NAME = os.getenv("DATABASE_NAME", "llmanim")
+# per process: with gunicorn the server sees up to workers * MONGODB_MAX_POOL_SIZE connections
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "0"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "20000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "0"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "0"))
+MONGODB_READ_PREFERENCE = os.getenv("MONGODB_READ_PREFERENCE", "primary")
+MONGODB_WRITE_CONCERN = os.getenv("MONGODB_WRITE_CONCERN", "majority")
 
 async_client = None
 
-async def connect_to_mongo():
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters per server, fed by pymongo's pool events.
+    Events fire on motor's executor threads, hence the lock; a checkout's
+    wait is timed from its start event on the same thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_started = threading.local()
+        self.pools = {}
+
+    def stats(self) -> list:
+        with self._lock:
+            pools = [dict(pool) for pool in self.pools.values()]
+        for pool in pools:
+            pool["idle"] = pool["open"] - pool["in_use"]
+            pool["utilization"] = pool["in_use"] / pool["max_pool_size"] if pool["max_pool_size"] else None
+            pool["avg_wait_ms"] = pool["wait_ms_total"] / pool["checkouts"] if pool["checkouts"] else 0.0
+        return pools
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self.pools:
+            self.pools[key] = {
+                "address": key, "max_pool_size": MONGODB_MAX_POOL_SIZE, "open": 0, "in_use": 0, "waiting": 0,
+                "checkouts": 0, "checkout_failures": 0, "wait_ms_total": 0.0, "max_wait_ms": 0.0, "cleared": 0
+            }
+        return self.pools[key]
+
+    def _update(self, address, **deltas):
+        with self._lock:
+            pool = self._pool(address)
+            for name, delta in deltas.items():
+                pool[name] += delta
+
+    def _end_wait(self, address, **deltas):
+        started = getattr(self._checkout_started, "value", None)
+        self._checkout_started.value = None
+        waited = (time.perf_counter() - started) * 1000 if started else 0.0
+        with self._lock:
+            pool = self._pool(address)
+            for name, delta in deltas.items():
+                pool[name] += delta
+            pool["waiting"] -= 1
+            pool["wait_ms_total"] += waited
+            pool["max_wait_ms"] = max(pool["max_wait_ms"], waited)
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)["max_pool_size"] = event.options.get("maxPoolSize", MONGODB_MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.value = time.perf_counter()
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._end_wait(event.address, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._end_wait(event.address, checkouts=1, in_use=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+pool_metrics = PoolMetrics()
+
+def motor_client(url: str, **options):
+    # motor is imported on first connect rather than with this module
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(url, **options)
+
+async def connect_to_mongo(ping: bool = True):
+    """
+    Create the client. Without ping nothing waits on the server: the
+    client connects in the background, and the API reports itself ready
+    only once it has (see app.services.readiness).
+    """
     global async_client
-    
+
     try:
-        async_client = AsyncIOMotorClient(MONGODB_URL)
+        write_concern = int(MONGODB_WRITE_CONCERN) if MONGODB_WRITE_CONCERN.isdigit() else MONGODB_WRITE_CONCERN
+        async_client = motor_client(
+            settings.mongodb_url,
+            maxPoolSize=MONGODB_MAX_POOL_SIZE,
+            minPoolSize=MONGODB_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS or None,
+            connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS or None,
+            waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS or None,
+            readPreference=MONGODB_READ_PREFERENCE,
+            w=write_concern,
+            event_listeners=[pool_metrics]
+        )
+
+        if ping:
+            await async_client.admin.command('ping')
 
-        await async_client.admin.command('ping')
-        
         return async_client
     except Exception as e:
         raise e
 
 async def close_mongo_connection():
     global async_client
-    
+
     if async_client:
         async_client.close()
-    pass
+    async_client = None
 
 def get_database():
     if not async_client:
         raise Exception("Database not connected. Call connect_to_mongo() first.")
-    return async_client[DATABASE_NAME]
+    return async_client[settings.database_name]
 
 def is_database_connected():
     return async_client is not None
+
+def get_pool_stats() -> dict:
+    return {
+        "max_pool_size": MONGODB_MAX_POOL_SIZE,
+        "read_preference": MONGODB_READ_PREFERENCE,
+        "write_concern": MONGODB_WRITE_CONCERN,
+        "pools": pool_metrics.stats()
+    }
@@ -0,0 +1,24 @@
+import os
+
+from dotenv import load_dotenv
+
+class Settings:
+    """
+    Credentials and service endpoints, read once per process. .env is
+    loaded here, before anything else reads the environment, so import
+    this module first; the tuning knobs each module reads at import time
+    come from the same environment.
+    """
+
+    def __init__(self):
+        self.mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+        self.database_name = os.getenv("DATABASE_NAME", "llmanim")
+        self.gemini_api_key = os.getenv("GEMINI_API_KEY", "")
+        # talk to a Gemini-compatible REST endpoint (a proxy, or the benchmark's fake server) instead of Google's
+        self.gemini_api_endpoint = os.getenv("GEMINI_API_ENDPOINT", "").rstrip("/")
+        self.cloudinary_cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME", "")
+        self.cloudinary_api_key = os.getenv("CLOUDINARY_API_KEY", "")
+        self.cloudinary_api_secret = os.getenv("CLOUDINARY_API_SECRET", "")
+
+load_dotenv()
+settings = Settings()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List, Annotated
+from typing import Optional, List, Dict, Annotated
 from datetime import datetime
 from bson import ObjectId
 
@@ -17,13 +17,37 @@ def validate_object_id(v):
 class AnimationModel(BaseModel):
     cloudinary_url: str
     cloudinary_public_id: Optional[str] = None
+    # "cloudinary", "s3" or "local"; records written before backends existed are on Cloudinary
+    storage_backend: str = "cloudinary"
     duration: Optional[float] = None
     format: str = "mp4"
+    quality: Optional[str] = None
+    # set by post-processing; all empty when ffmpeg was unavailable
+    width: Optional[int] = None
+    height: Optional[int] = None
+    faststart: bool = False
+    poster_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    hls_url: Optional[str] = None
+    # the background upload gave up; the url is a local copy that will not last
+    upload_failed: bool = False
+
+class RenderCacheEntry(BaseModel):
+    cache_key: str
+    class_name: str
+    render_settings: Dict[str, str] = {}
+    animation: AnimationModel
+    created_at: datetime
+    last_used_at: datetime
+    hits: int = 0
 
 class MessageMetadata(BaseModel):
     prompt: Optional[str] = None
     generation_time: Optional[float] = None
     manim_code: Optional[str] = None
+    # seconds per pipeline stage (span name), and the trace holding the full breakdown
+    stages: Optional[Dict[str, float]] = None
+    trace_id: Optional[str] = None
 
 class MessageModel(BaseModel):
     id: Optional[str] = Field(default_factory=lambda: str(ObjectId()), alias="_id")
@@ -87,6 +111,7 @@ class MessageResponse(BaseModel):
     sender: str
     timestamp: datetime
     animation: Optional[AnimationModel] = None
+    metadata: Optional[MessageMetadata] = None
 
 class ChatSessionResponse(BaseModel):
     session_id: str
@@ -95,6 +120,11 @@ class ChatSessionResponse(BaseModel):
     updated_at: datetime
     message_count: int
     messages: List[MessageResponse] = []
+    # cursor for the next page of messages, None on the last page
+    next_cursor: Optional[str] = None
+    # with latest or before: cursor for the page of older messages, None once at the first
+    previous_cursor: Optional[str] = None
 
 class SessionListResponse(BaseModel):
-    sessions: List[ChatSessionResponse] 
\ No newline at end of file
+    sessions: List[ChatSessionResponse]
+    next_cursor: Optional[str] = None 
\ No newline at end of file
@@ -0,0 +1,91 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+from enum import Enum
+import uuid
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class JobModel(BaseModel):
+    job_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: JobStatus = JobStatus.QUEUED
+    payload: Dict[str, Any] = {}
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    error_details: Optional[List[Dict[str, Any]]] = None
+    events: List[Dict[str, Any]] = []
+    trace_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED)
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_position: Optional[int] = None
+    error: Optional[str] = None
+    error_details: Optional[List[Dict[str, Any]]] = None
+    trace_id: Optional[str] = None
+
+class GenerateJobResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+    session_id: Optional[str] = None
+    message_id: str
+
+class RenderJobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    # gave up after max_attempts workers lost it; kept for inspection
+    DEAD = "dead"
+
+class RenderJobModel(BaseModel):
+    """One render in the render_jobs collection, the lease queue between API nodes and render workers."""
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), alias="_id")
+    command: str = "render"
+    code: str
+    class_name: str
+    quality: str = "draft"
+    client: str = "anonymous"
+    lane: int = 0
+    # post-process on the render host and send the media back with the mp4
+    postprocess: bool = False
+    status: RenderJobStatus = RenderJobStatus.QUEUED
+    attempts: int = 0
+    max_attempts: int = 3
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    available_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # finished jobs are removed by a TTL index on this; dead ones keep it unset
+    expire_at: Optional[datetime] = None
+    progress: Optional[Dict[str, Any]] = None
+    # the attempt whose chunks in render_outputs hold the result
+    output_owner: Optional[str] = None
+    output_chunks: Optional[int] = None
+    media: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    error_reason: Optional[str] = None
+    error_limit: Optional[float] = None
+
+    class Config:
+        populate_by_name = True
+        use_enum_values = True
+        validate_default = True
@@ -1,6 +1,17 @@
 from pydantic import BaseModel
 from typing import Optional
+from enum import Enum
+
+class RenderQuality(str, Enum):
+    DRAFT = "draft"
+    MEDIUM = "medium"
+    HIGH = "high"
+    UHD = "4k"
 
 class PromptRequest(BaseModel):
     prompt: str
     session_id: Optional[str] = None
+    bypass_cache: bool = False
+    quality: RenderQuality = RenderQuality.DRAFT
+    progressive: bool = False
+    auto_repair: bool = True
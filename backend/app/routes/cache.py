@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from app.services.render_cache import render_cache
+from app.services.llm_cache import llm_cache
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the generation caches."""
+    return {"render": render_cache.stats(), "llm": llm_cache.stats()}
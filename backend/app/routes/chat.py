@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
 
-from app.services.chat_service import ChatService
+from app.lib.database import get_pool_stats
+from app.services.chat_service import (
+    ChatService, InvalidCursorError, get_chat_service, SESSION_PAGE_SIZE, MESSAGE_PAGE_SIZE, MAX_PAGE_SIZE
+)
 from app.models.chat_models import (
     CreateSessionRequest,
     CreateSessionResponse,
@@ -12,11 +15,16 @@ from app.models.chat_models import (
 
 router = APIRouter()
 
+def require_chat_service() -> ChatService:
+    try:
+        return get_chat_service()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @router.post("/sessions", response_model=CreateSessionResponse)
-async def create_session(request: CreateSessionRequest):
+async def create_session(request: CreateSessionRequest, chat_service: ChatService = Depends(require_chat_service)):
 
     try:
-        chat_service = ChatService()
         session = await chat_service.create_session(request.title)
 
         return CreateSessionResponse(
@@ -28,10 +36,14 @@ async def create_session(request: CreateSessionRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sessions", response_model=SessionListResponse)
-async def get_all_sessions():
+async def get_all_sessions(
+    limit: int = Query(SESSION_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    chat_service: ChatService = Depends(require_chat_service)
+):
+    """List sessions, most recently updated first; pass next_cursor back as cursor for the next page."""
     try:
-        chat_service = ChatService()
-        sessions = await chat_service.get_all_sessions()
+        sessions, next_cursor = await chat_service.list_sessions(limit, cursor)
         session_responses = []
         
         for session in sessions:
@@ -44,20 +56,37 @@ async def get_all_sessions():
                 messages=[]  
             ))
         
-        return SessionListResponse(sessions=session_responses)
+        return SessionListResponse(sessions=session_responses, next_cursor=next_cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/sessions/{session_id}", response_model=ChatSessionResponse)
-async def get_session(session_id: str):
-    """Get a specific chat session with all messages."""
+async def get_session(
+    session_id: str,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    before: Optional[str] = None,
+    latest: bool = False,
+    lightweight: bool = False,
+    chat_service: ChatService = Depends(require_chat_service)
+):
+    """
+    Get a chat session with one page of its messages, oldest first. With
+    latest the page is the newest messages, and with before the ones
+    preceding that cursor; either returns previous_cursor for older pages.
+    Lightweight pages leave out the generated code in each message's metadata.
+    """
     try:
-        chat_service = ChatService()
         session = await chat_service.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        messages = await chat_service.get_session_messages(session_id)
+        backward = latest or before is not None
+        messages, page_cursor = await chat_service.list_messages(
+            session_id, limit, before if backward else cursor, lightweight, backward=backward
+        )
         message_responses = []
         
         for message in messages:
@@ -66,7 +95,8 @@ async def get_session(session_id: str):
                 content=message.content,
                 sender=message.sender,
                 timestamp=message.timestamp,
-                animation=message.animation
+                animation=message.animation,
+                metadata=message.metadata
             ))
         
         return ChatSessionResponse(
@@ -75,18 +105,21 @@ async def get_session(session_id: str):
             created_at=session.created_at,
             updated_at=session.updated_at,
             message_count=session.message_count,
-            messages=message_responses
+            messages=message_responses,
+            next_cursor=None if backward else page_cursor,
+            previous_cursor=page_cursor if backward else None
         )
     except HTTPException:
         raise
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(session_id: str):
+async def delete_session(session_id: str, chat_service: ChatService = Depends(require_chat_service)):
     """Delete a chat session and all its messages."""
     try:
-        chat_service = ChatService()
         success = await chat_service.delete_session(session_id)
         if not success:
             raise HTTPException(status_code=404, detail="Session not found")
@@ -98,10 +131,11 @@ async def delete_session(session_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/sessions/{session_id}/title")
-async def update_session_title(session_id: str, title: str):
+async def update_session_title(
+    session_id: str, title: str, chat_service: ChatService = Depends(require_chat_service)
+):
     """Update the title of a chat session."""
     try:
-        chat_service = ChatService()
         success = await chat_service.update_session_title(session_id, title)
         if not success:
             raise HTTPException(status_code=404, detail="Session not found")
@@ -113,17 +147,15 @@ async def update_session_title(session_id: str, title: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/cleanup")
-async def cleanup_database():
+async def cleanup_database(chat_service: ChatService = Depends(require_chat_service)):
     """Clean up problematic null _id entries."""
     try:
-        chat_service = ChatService()
-        sessions_deleted = await chat_service.sessions_collection.delete_many({"_id": None})
-        messages_deleted = await chat_service.messages_collection.delete_many({"_id": None})
-        
-        return {
-            "message": "Database cleaned up successfully",
-            "sessions_deleted": sessions_deleted.deleted_count,
-            "messages_deleted": messages_deleted.deleted_count
-        }
+        deleted = await chat_service.cleanup_null_ids()
+        return {"message": "Database cleaned up successfully", **deleted}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/pool")
+async def get_connection_pool_stats():
+    """MongoDB connection pool settings and per-server utilization for this process."""
+    return get_pool_stats()
@@ -1,160 +1,100 @@
-import cloudinary.uploader
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import JSONResponse
-import re
+import os
 import uuid
+from typing import Optional
 
+from app.models.chat_models import MessageModel
 from app.models.schema import PromptRequest
-from app.services.gemini import get_manim_code_from_prompt
-from app.services.manim import extract_class_name, save_code_to_file, render_manim_video
-from app.services.chat_service import ChatService
-from app.models.chat_models import AnimationModel, MessageMetadata
-from app.lib.database import is_database_connected
-
-import time
-import cloudinary
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-cloudinary.config(
-    cloud_name=os.environ.get("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.environ.get("CLOUDINARY_API_KEY"),
-    api_secret=os.environ.get("CLOUDINARY_API_SECRET")
-)
+from app.models.job_models import GenerateJobResponse
+from app.services.chat_service import ChatService, get_optional_chat_service
+from app.services.jobs import get_job_queue
+from app.services.manim import DEFAULT_QUALITY
+from app.services.scheduler import AdmissionRejected, QUALITY_LANES, QUALITY_COSTS
 
 router = APIRouter()
 
-def clean_code(code):
-    """
-    Clean the code to remove non-Python elements while preserving
-    important structures like class definitions.
-    """
-    code_block_pattern = r'```(?:python)?\s*(.*?)\s*```'
-    code_blocks = re.findall(code_block_pattern, code, re.DOTALL)
-    
-    if code_blocks:
-        cleaned_code = max(code_blocks, key=len)
-    else:
-        lines = code.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            if re.match(r'^\d+\.\s+\*\*', line.strip()):
-                continue
-                
-            if line.strip().startswith(('# ', '## ', '### ')) and ':' in line:
-                continue
-                
-            line = re.sub(r'\*\*(.*?)\*\*', r'\1', line)  
-            line = re.sub(r'`(.*?)`', r'\1', line)        
-            
-            cleaned_lines.append(line)
-            
-        cleaned_code = '\n'.join(cleaned_lines)
-    
-    if "from manim import" not in cleaned_code:
-        cleaned_code = "from manim import *\n" + cleaned_code
-    
-    if not re.search(r'class\s+\w+\s*\(\s*\w*Scene\w*\s*\)', cleaned_code):
-        cleaned_code += '\n\nclass DefaultScene(Scene):\n    def construct(self):\n        self.add(Text("Default Scene"))\n'
-    
-    return cleaned_code
-
-
-
-
-@router.post("/generate")
-async def generate_video(request: PromptRequest):
-
+# behind a proxy, the client is the first X-Forwarded-For address rather than the proxy itself
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+def client_key(http_request: Request) -> str:
+    """Who a request counts against for fair sharing and per-client limits."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = http_request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+    return http_request.client.host if http_request.client else "anonymous"
+
+@router.post("/generate", status_code=202, response_model=GenerateJobResponse)
+async def generate_video(
+    request: PromptRequest,
+    http_request: Request,
+    chat_service: Optional[ChatService] = Depends(get_optional_chat_service)
+):
+    """Queue an animation job and return its id straight away, or 429 with Retry-After when overloaded."""
     try:
-        start_time = time.time()
         session_id = request.session_id
         user_message_id = str(uuid.uuid4())
         ai_message_id = str(uuid.uuid4())
-        
+        new_session = False
 
-        
-        if is_database_connected():
+        if chat_service:
             try:
-                chat_service = ChatService()
                 if not session_id:
                     session = await chat_service.create_session("New Animation Chat")
                     session_id = session.session_id
-                
-                await chat_service.add_message(
-                    session_id=session_id,
-                    message_id=user_message_id,
-                    content=request.prompt,
-                    sender="user"
-                )
+                    new_session = True
             except Exception as e:
                 session_id = None
 
-        enhanced_prompt = (
-            f"{request.prompt}\n\n"
-            "Generate ONLY valid Python code for a Manim animation. "
-            "The code must include a class that inherits from Scene (or a Scene subclass like ThreeDScene). "
-            "Include all necessary imports. "
-            "Do not include explanations, markdown formatting, or installation instructions. "
-            "The output should be directly executable as a Python file."
-        )
-        raw_code = get_manim_code_from_prompt(enhanced_prompt)
-        code = clean_code(raw_code)
-        class_name = extract_class_name(code)
-        script_path, file_id = save_code_to_file(code)
-        video_path = render_manim_video(script_path, class_name,file_id)
-        
-        documentUrl = ""
-        cloudinary_public_id = None
-        file = f"videos/outputs/videos/0/480p15/Animation.mp4"
-        if file:
-            object_key = str(time.time()) + "/"+ file
-            upload_result = cloudinary.uploader.upload(file, public_id=object_key, resource_type="video")
-            documentUrl = upload_result["secure_url"]
-            cloudinary_public_id = upload_result["public_id"]
-        
-        generation_time = time.time() - start_time
-        
-        animation = AnimationModel(
-            cloudinary_url=documentUrl,
-            cloudinary_public_id=cloudinary_public_id,
-            duration=None, 
-            format="mp4"
-        )
-        
-        metadata = MessageMetadata(
-            prompt=request.prompt,
-            generation_time=generation_time,
-            manim_code=code
-        )
-        
-        if is_database_connected() and session_id:
+        quality = request.quality.value
+        # as in run_generation_job: a draft-quality request has no separate draft to render
+        progressive = request.progressive and quality != DEFAULT_QUALITY
+        # a progressive job's draft comes first, so it queues in the draft lane
+        first_quality = DEFAULT_QUALITY if progressive else quality
+        cost = QUALITY_COSTS[quality] + (QUALITY_COSTS[DEFAULT_QUALITY] if progressive else 0)
+        client = client_key(http_request)
+        job = get_job_queue().submit({
+            "prompt": request.prompt,
+            "client": client,
+            "session_id": session_id,
+            "message_id": ai_message_id,
+            "bypass_cache": request.bypass_cache,
+            "quality": quality,
+            "progressive": request.progressive,
+            "auto_repair": request.auto_repair
+        }, client=client, lane=QUALITY_LANES[first_quality], cost=cost)
+
+        if session_id and chat_service:
             try:
-                await chat_service.add_message(
+                # stored once admitted, so the prompt survives the job being cancelled, failing or lost to a restart
+                await chat_service.add_messages(session_id, [MessageModel(
                     session_id=session_id,
-                    message_id=ai_message_id,
-                    content="I've created an animation based on your request!",
-                    sender="ai",
-                    animation=animation,
-                    metadata=metadata
-                )
+                    message_id=user_message_id,
+                    content=request.prompt,
+                    sender="user",
+                    timestamp=job.created_at
+                )])
             except Exception as e:
                 pass
-        
 
-        
-        return JSONResponse({
-            "video_url": documentUrl,
-            "session_id": session_id,
-            "message_id": ai_message_id,
-            "generation_time": generation_time
-        })
+        return JSONResponse(status_code=202, content=GenerateJobResponse(
+            job_id=job.job_id,
+            status=job.status,
+            session_id=session_id,
+            message_id=ai_message_id
+        ).model_dump(mode="json"))
 
+    except AdmissionRejected as e:
+        if new_session:
+            # the session was made for this request alone
+            try:
+                await chat_service.delete_session(session_id)
+            except Exception as e:
+                pass
+        raise HTTPException(
+            status_code=429, detail={"error": str(e), "reason": e.reason, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-
-
-
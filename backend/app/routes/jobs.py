@@ -0,0 +1,112 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import json
+
+from app.models.job_models import JobResponse, JobStatus
+from app.services.jobs import get_job_queue
+from app.services.render_workers import get_render_pool
+
+router = APIRouter()
+
+SSE_HEARTBEAT_SECONDS = 15
+CANCEL_SETTLE_SECONDS = 5
+
+@router.get("/workers")
+async def get_worker_stats():
+    """Size and health of the render worker pool."""
+    return get_render_pool().stats()
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job_status(job_id: str):
+    """Get the current status of a generation job."""
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return JobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        queue_position=queue.queue_position(job_id) if job.status == JobStatus.QUEUED else None,
+        error=job.error,
+        error_details=job.error_details,
+        trace_id=job.trace_id
+    )
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Get the result of a finished job, or 202 while it is still pending."""
+    job = get_job_queue().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.status == JobStatus.CANCELLED:
+        raise HTTPException(status_code=409, detail={"error": job.error, "details": job.error_details})
+
+    if job.status == JobStatus.FAILED:
+        if job.error_details:
+            raise HTTPException(status_code=422, detail={"error": job.error, "details": job.error_details})
+        raise HTTPException(status_code=500, detail=job.error)
+
+    if job.status != JobStatus.COMPLETED:
+        content = {"job_id": job.job_id, "status": job.status.value}
+        if job.result:
+            # progressive jobs expose the draft while the final render runs
+            content["draft"] = job.result
+        return JSONResponse(status_code=202, content=content)
+
+    return JSONResponse(job.result)
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; a running render is killed."""
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not queue.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status.value}")
+    # a running job settles once its task has unwound and the render is killed
+    try:
+        await asyncio.wait_for(wait_until_finished(job_id), timeout=CANCEL_SETTLE_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    return await get_job_status(job_id)
+
+async def wait_until_finished(job_id: str):
+    async for event in get_job_queue().subscribe(job_id):
+        pass
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, cancel_on_disconnect: bool = False):
+    """
+    Stream the job's stage events (code, render progress, upload, result) as
+    server-sent events. With cancel_on_disconnect, closing the stream before
+    the job finishes cancels it.
+    """
+    queue = get_job_queue()
+    job = queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        try:
+            async for event in queue.subscribe(job_id, heartbeat=SSE_HEARTBEAT_SECONDS):
+                if event["stage"] == "heartbeat":
+                    # comment line keeps proxies from closing an idle connection
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            if cancel_on_disconnect and not job.is_finished:
+                queue.cancel(job_id, reason="client_disconnected")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,68 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.lib.database import pool_metrics
+from app.services.generation import code_flights, render_flights
+from app.services.jobs import get_job_queue
+from app.services.metrics import counter, gauge, stage_duration, http_request_duration, jobs_finished
+from app.services.render_cache import render_cache
+from app.services.render_workers import get_render_pool
+from app.services.llm_cache import llm_cache
+from app.services.readiness import boot
+
+router = APIRouter()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition of stage latencies, queue depth, cache and pool state."""
+    lines = stage_duration.render() + http_request_duration.render() + jobs_finished.render()
+
+    try:
+        queue = get_job_queue().stats()
+        lines += gauge("llmanim_job_queue_depth", "Jobs waiting for a slot.", [({}, queue["queued"])])
+        lines += gauge("llmanim_jobs_running", "Jobs currently running.", [({}, queue["running"])])
+        lines += gauge("llmanim_job_clients", "Clients with jobs queued or running.", [({}, queue["clients"])])
+        lines += gauge("llmanim_job_estimated_wait_seconds", "Estimated wait for a new job.", [({}, queue["estimated_wait"])])
+        lines += counter("llmanim_jobs_rejected_total", "Generate requests turned away by admission control.", [({}, queue["rejected"])])
+    except Exception as e:
+        pass
+
+    try:
+        pool = get_render_pool().stats()
+        lines += gauge("llmanim_render_workers", "Render worker processes by state.", [
+            ({"state": "alive"}, pool["alive"]), ({"state": "idle"}, pool["idle"])
+        ])
+        lines += counter("llmanim_render_workers_recycled_total", "Render workers recycled since startup.", [({}, pool["recycled"])])
+        lines += gauge("llmanim_renders_waiting", "Renders waiting for a worker.", [({}, pool["waiting"])])
+    except Exception as e:
+        pass
+
+    render = render_cache.stats()
+    llm = llm_cache.stats()
+    lines += gauge("llmanim_cache_hit_ratio", "Hit ratio of the generation caches.", [
+        ({"cache": "render"}, render["hit_rate"]), ({"cache": "llm"}, llm["hit_rate"])
+    ])
+    lines += counter("llmanim_cache_lookups_total", "Cache lookups since startup.", [
+        ({"cache": "render"}, render["memory_hits"] + render["db_hits"] + render["misses"]),
+        ({"cache": "llm"}, sum(llm["hits"].values()) + llm["misses"])
+    ])
+
+    lines += counter("llmanim_coalesced_jobs_total", "Jobs that joined an identical in-flight code generation or render.", [
+        ({"stage": "code"}, code_flights.joined), ({"stage": "render"}, render_flights.joined)
+    ])
+
+    lines += gauge("llmanim_boot_seconds", "Seconds from process start to the end of imports, of startup, and to first ready.", [
+        ({"phase": name[:-len("_seconds")]}, value) for name, value in boot.items() if value is not None
+    ])
+
+    pools = pool_metrics.stats()
+    lines += gauge("llmanim_mongo_connections_in_use", "Checked out MongoDB connections per server.", [
+        ({"address": pool["address"]}, pool["in_use"]) for pool in pools
+    ])
+    lines += gauge("llmanim_mongo_connections_open", "Open MongoDB connections per server.", [
+        ({"address": pool["address"]}, pool["open"]) for pool in pools
+    ])
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
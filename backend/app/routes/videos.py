@@ -0,0 +1,131 @@
+from email.utils import formatdate
+import os
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from app.services.postprocess import content_type
+from app.services.storage import VIDEOS_ROOT
+
+router = APIRouter()
+
+VIDEO_CHUNK_SIZE = int(os.getenv("VIDEO_CHUNK_SIZE", str(1024 * 1024)))
+VIDEO_CACHE_MAX_AGE = int(os.getenv("VIDEO_CACHE_MAX_AGE", "86400"))
+# with nginx in front, e.g. "/_protected_videos", nginx serves the file itself (sendfile + ranges)
+VIDEO_ACCEL_REDIRECT = os.getenv("VIDEO_ACCEL_REDIRECT", "")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single "bytes=" range into an inclusive (start, end) pair.
+    Returns None when the whole file should be sent, including for
+    multi-range requests, which the server is allowed to ignore.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            # suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+class VideoFileResponse(Response):
+    """
+    Sends a byte range of a file. Servers advertising the ASGI zerocopy
+    extension get the file descriptor and use sendfile; otherwise the
+    range is streamed in VIDEO_CHUNK_SIZE reads off the event loop.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.start = start
+        self.length = end - start + 1
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD" or self.length <= 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopy" in extensions:
+                await send({"type": "http.response.zerocopy", "file": f, "offset": self.start, "count": self.length})
+                return
+
+            remaining = self.length
+            offset = self.start
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, f.fileno(), min(VIDEO_CHUNK_SIZE, remaining), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # the file shrank under us; end the response rather than hang
+                await send({"type": "http.response.body", "body": b""})
+
+@router.api_route("/videos/{file_path:path}", methods=["GET", "HEAD"])
+async def serve_video(file_path: str, request: Request):
+    """Serve a rendered or locally stored video, or its poster, preview or HLS files, with HTTP Range support."""
+    root = os.path.realpath(VIDEOS_ROOT)
+    path = os.path.realpath(os.path.join(root, file_path))
+    if not path.startswith(root + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": f"public, max-age={VIDEO_CACHE_MAX_AGE}"
+    }
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if VIDEO_ACCEL_REDIRECT:
+        relative = os.path.relpath(path, root).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{VIDEO_ACCEL_REDIRECT.rstrip('/')}/{relative}"
+        return Response(headers=headers)
+
+    headers["Content-Type"] = content_type(path)
+    size = stat.st_size
+
+    if_range = request.headers.get("if-range")
+    try:
+        byte_range = parse_range(request.headers.get("range"), size) if if_range in (None, etag) else None
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return VideoFileResponse(path, 0, size - 1, 200, headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return VideoFileResponse(path, start, end, 206, headers)
@@ -1,6 +1,10 @@
 from datetime import datetime
+import asyncio
+import base64
+import json
+import os
 import uuid
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from bson import ObjectId
 
 from app.lib.database import get_database
@@ -11,12 +15,52 @@ from app.models.chat_models import (
     MessageMetadata
 )
 
+CHAT_STORAGE_LAYOUT = os.getenv("CHAT_STORAGE_LAYOUT", "flat")
+MESSAGE_BUCKET_SIZE = int(os.getenv("MESSAGE_BUCKET_SIZE", "50"))
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "50"))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# the session list only renders these, so full documents are never pulled for it
+SESSION_LIST_PROJECTION = {"session_id": 1, "title": 1, "created_at": 1, "updated_at": 1, "message_count": 1}
+# the generated code is by far the largest field and the chat view never shows it
+MESSAGE_LIGHTWEIGHT_PROJECTION = {"metadata.manim_code": 0}
+
+class InvalidCursorError(Exception):
+    pass
+
+def encode_cursor(value: datetime, document_id: str) -> str:
+    """Opaque token for the last item of a page: its sort key and _id as a tie-breaker."""
+    payload = json.dumps([value.isoformat(), str(document_id)]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        value, document_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(value), document_id
+    except Exception:
+        raise InvalidCursorError("Invalid pagination cursor")
+
+def keyset_filter(field: str, direction: int, cursor: str) -> dict:
+    """Match documents strictly after the cursor in (field, _id) order."""
+    value, document_id = decode_cursor(cursor)
+    op = "$gt" if direction > 0 else "$lt"
+    return {"$or": [{field: {op: value}}, {field: value, "_id": {op: document_id}}]}
+
 class ChatService:
     def __init__(self):
         self.db = get_database()
         self.sessions_collection = self.db.sessions
         self.messages_collection = self.db.messages
 
+    async def ensure_indexes(self):
+        """Indexes backing every query below; create_index is a no-op when they already exist."""
+        await self.sessions_collection.create_index("session_id", unique=True)
+        # _id is part of the sort so keyset pages are stable when timestamps tie
+        await self.sessions_collection.create_index([("updated_at", -1), ("_id", -1)])
+        await self.messages_collection.create_index([("session_id", 1), ("timestamp", 1), ("_id", 1)])
+        await self.messages_collection.create_index("message_id")
+
     async def create_session(self, title: Optional[str] = None) -> ChatSessionModel:
         """Create a new chat session."""
         session_id = str(uuid.uuid4())
@@ -46,13 +90,14 @@ class ChatService:
             return ChatSessionModel(**session_dict)
         return None
 
-    async def get_all_sessions(self) -> List[ChatSessionModel]:
-    
-        sessions = []
-        cursor = self.sessions_collection.find().sort("updated_at", -1)
-        async for session_dict in cursor:
-            sessions.append(ChatSessionModel(**session_dict))
-        return sessions
+    async def list_sessions(
+        self, limit: int = SESSION_PAGE_SIZE, cursor: Optional[str] = None
+    ) -> Tuple[List[ChatSessionModel], Optional[str]]:
+        """One page of sessions, most recently updated first, and the cursor of the next page."""
+        query = keyset_filter("updated_at", -1, cursor) if cursor else {}
+        results = self.sessions_collection.find(query, SESSION_LIST_PROJECTION).sort([("updated_at", -1), ("_id", -1)])
+        documents = await results.limit(limit + 1).to_list(limit + 1)
+        return self._page(documents, limit, "updated_at", ChatSessionModel)
 
     async def add_message(
         self, 
@@ -73,45 +118,93 @@ class ChatService:
             animation=animation,
             metadata=metadata
         )
-        
-        # Insert message
-        message_dict = message.dict(by_alias=True)
-        # Ensure _id is not None
-        if message_dict.get('_id') is None:
-            message_dict['_id'] = str(ObjectId())
-        await self.messages_collection.insert_one(message_dict)
-        
-        # Update session
-        update_operations = {
-            "$set": {
-                "updated_at": datetime.utcnow()
-            },
-            "$inc": {"message_count": 1}
-        }
-        
-        # Update title if this is the first message
-        if sender == "user":
-            session = await self.get_session(session_id)
-            if session and session.message_count == 0:
-                # Use first 50 characters of user message as title
-                title = content[:50] + "..." if len(content) > 50 else content
-                update_operations["$set"]["title"] = title
-        
-        await self.sessions_collection.update_one(
-            {"session_id": session_id},
-            update_operations
-        )
-        
+        await self.add_messages(session_id, [message])
         return message
 
-    async def get_session_messages(self, session_id: str) -> List[MessageModel]:
-     
-        messages = []
-        cursor = self.messages_collection.find({"session_id": session_id}).sort("timestamp", 1)
-        async for message_dict in cursor:
-            messages.append(MessageModel(**message_dict))
+    async def add_messages(self, session_id: str, messages: List[MessageModel]) -> List[MessageModel]:
+        """
+        Store several messages of one session in a single batched insert.
+        The session counters are updated by one conditional update sent
+        alongside it, so an append costs a single round trip of latency.
+        """
+        if not messages:
+            return messages
+
+        message_dicts = []
+        for message in messages:
+            message_dict = message.dict(by_alias=True)
+            # Ensure _id is not None
+            if message_dict.get('_id') is None:
+                message_dict['_id'] = str(ObjectId())
+            message_dicts.append(message_dict)
+
+        await asyncio.gather(
+            self._store_messages(session_id, message_dicts),
+            self.sessions_collection.update_one({"session_id": session_id}, self._append_update(messages))
+        )
         return messages
 
+    async def _store_messages(self, session_id: str, message_dicts: List[dict]):
+        await self.messages_collection.insert_many(message_dicts)
+
+    @staticmethod
+    def _append_update(messages: List[MessageModel]) -> list:
+        # an aggregation-pipeline update reads message_count and decides on the
+        # title inside the same write, so two first messages cannot race
+        count = {"$ifNull": ["$message_count", 0]}
+        fields = {
+            "updated_at": datetime.utcnow(),
+            "message_count": {"$add": [count, len(messages)]}
+        }
+
+        first_user_message = next((message for message in messages if message.sender == "user"), None)
+        if first_user_message:
+            # Use first 50 characters of the first user message as title
+            content = first_user_message.content
+            title = content[:50] + "..." if len(content) > 50 else content
+            # $literal so a prompt starting with "$" is not read as a field path
+            fields["title"] = {"$cond": [{"$eq": [count, 0]}, {"$literal": title}, "$title"]}
+
+        return [{"$set": fields}]
+
+    async def list_messages(
+        self,
+        session_id: str,
+        limit: int = MESSAGE_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        lightweight: bool = True,
+        backward: bool = False
+    ) -> Tuple[List[MessageModel], Optional[str]]:
+        """
+        One page of a session's messages in chronological order, and the
+        cursor of the next page. Backward pages hold the newest messages
+        before the cursor (the newest of all without one), and their cursor
+        leads further back.
+        """
+        direction = -1 if backward else 1
+        query = {"session_id": session_id}
+        if cursor:
+            query.update(keyset_filter("timestamp", direction, cursor))
+        projection = MESSAGE_LIGHTWEIGHT_PROJECTION if lightweight else None
+        results = self.messages_collection.find(query, projection).sort([("timestamp", direction), ("_id", direction)])
+        documents = await results.limit(limit + 1).to_list(limit + 1)
+        return self._chronological(self._page(documents, limit, "timestamp", MessageModel), backward)
+
+    @staticmethod
+    def _chronological(page: Tuple[list, Optional[str]], backward: bool) -> Tuple[list, Optional[str]]:
+        # a backward page was read newest first
+        messages, next_cursor = page
+        return (messages[::-1] if backward else messages), next_cursor
+
+    @staticmethod
+    def _page(documents: List[dict], limit: int, sort_field: str, model):
+        # one extra document was fetched to tell whether another page exists
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(documents[-1][sort_field], documents[-1]["_id"])
+        return [model(**document) for document in documents], next_cursor
+
     async def delete_session(self, session_id: str) -> bool:
     
         # Delete messages first
@@ -121,10 +214,177 @@ class ChatService:
         result = await self.sessions_collection.delete_one({"session_id": session_id})
         return result.deleted_count > 0
 
+    async def cleanup_null_ids(self) -> dict:
+        """Remove sessions and messages stored with a null _id; returns how many of each went."""
+        sessions = await self.sessions_collection.delete_many({"_id": None})
+        messages = await self.messages_collection.delete_many({"_id": None})
+        return {"sessions_deleted": sessions.deleted_count, "messages_deleted": messages.deleted_count}
+
     async def update_session_title(self, session_id: str, title: str) -> bool:
     
         result = await self.sessions_collection.update_one(
             {"session_id": session_id},
             {"$set": {"title": title, "updated_at": datetime.utcnow()}}
         )
-        return result.modified_count > 0 
\ No newline at end of file
+        return result.modified_count > 0
+
+    async def update_message_animation(
+        self,
+        message_id: str,
+        animation: AnimationModel,
+        expected_url: Optional[str] = None
+    ) -> bool:
+
+        query = {"message_id": message_id}
+        # compare-and-set: only replace the animation the caller last wrote
+        if expected_url is not None:
+            query["animation.cloudinary_url"] = expected_url
+        result = await self.messages_collection.update_one(
+            query,
+            {"$set": {"animation": animation.dict()}}
+        )
+        return result.modified_count > 0
+
+def new_bucket(session_id: str, message_dicts: List[dict]) -> dict:
+    """A message_buckets document holding the given messages, oldest first."""
+    return {
+        "_id": str(ObjectId()),
+        "session_id": session_id,
+        "count": len(message_dicts),
+        "start_ts": message_dicts[0]["timestamp"],
+        "end_ts": message_dicts[-1]["timestamp"],
+        "messages": message_dicts
+    }
+
+class BucketedChatService(ChatService):
+    """
+    Stores a session's messages in message_buckets documents of up to
+    MESSAGE_BUCKET_SIZE messages each, so loading a conversation reads a
+    few documents instead of one per message. Every query is scoped by
+    session_id, which makes it a clean shard key. Sessions stay in their
+    own collection, as in the flat layout.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buckets_collection = self.db.message_buckets
+
+    async def ensure_indexes(self):
+        await super().ensure_indexes()
+        await self.buckets_collection.create_index([("session_id", 1), ("start_ts", 1), ("_id", 1)])
+        await self.buckets_collection.create_index([("session_id", 1), ("end_ts", 1), ("_id", 1)])
+        await self.buckets_collection.create_index("messages.message_id")
+
+    async def _store_messages(self, session_id: str, message_dicts: List[dict]):
+        # append to a bucket that still has room, or upsert a new one; the
+        # count filter keeps a bucket from growing past its size
+        await self.buckets_collection.update_one(
+            {"session_id": session_id, "count": {"$lte": MESSAGE_BUCKET_SIZE - len(message_dicts)}},
+            {
+                "$push": {"messages": {"$each": message_dicts}},
+                "$inc": {"count": len(message_dicts)},
+                "$min": {"start_ts": message_dicts[0]["timestamp"]},
+                "$max": {"end_ts": message_dicts[-1]["timestamp"]},
+                "$setOnInsert": {"_id": str(ObjectId())}
+            },
+            upsert=True
+        )
+
+    async def list_messages(
+        self,
+        session_id: str,
+        limit: int = MESSAGE_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        lightweight: bool = True,
+        backward: bool = False
+    ) -> Tuple[List[MessageModel], Optional[str]]:
+        # buckets are read in paging order of their leading edge: start_ts going
+        # forward, end_ts going back; one whose trailing edge is short of the
+        # cursor holds nothing past it
+        direction = -1 if backward else 1
+        leading, trailing = ("end_ts", "start_ts") if backward else ("start_ts", "end_ts")
+        query = {"session_id": session_id}
+        after = None
+        if cursor:
+            after = decode_cursor(cursor)
+            query[trailing] = {"$lte" if backward else "$gte": after[0]}
+        projection = {"messages.metadata.manim_code": 0} if lightweight else None
+
+        def key(message: dict) -> tuple:
+            return message["timestamp"], message["_id"]
+
+        documents = []
+        async for bucket in self.buckets_collection.find(query, projection).sort([(leading, direction), ("_id", direction)]):
+            # concurrent appends can leave two partly filled buckets with interleaved
+            # messages, so a page is only complete once the next bucket starts past it
+            if len(documents) > limit:
+                edge = documents[limit]["timestamp"]
+                if bucket[leading] < edge if backward else bucket[leading] > edge:
+                    break
+            documents.extend(
+                message for message in bucket["messages"]
+                if not after or (key(message) < after if backward else key(message) > after)
+            )
+            documents.sort(key=key, reverse=backward)
+        return self._chronological(self._page(documents, limit, "timestamp", MessageModel), backward)
+
+    async def delete_session(self, session_id: str) -> bool:
+        await self.buckets_collection.delete_many({"session_id": session_id})
+        result = await self.sessions_collection.delete_one({"session_id": session_id})
+        return result.deleted_count > 0
+
+    async def cleanup_null_ids(self) -> dict:
+        # messages live inside buckets here; the flat collection may still hold unmigrated ones
+        result = await super().cleanup_null_ids()
+        async for bucket in self.buckets_collection.find({"messages._id": None}, {"messages._id": 1}):
+            count = sum(1 for message in bucket["messages"] if message.get("_id") is None)
+            await self.buckets_collection.update_one(
+                {"_id": bucket["_id"]},
+                {"$pull": {"messages": {"_id": None}}, "$inc": {"count": -count}}
+            )
+            result["messages_deleted"] += count
+        return result
+
+    async def update_message_animation(
+        self,
+        message_id: str,
+        animation: AnimationModel,
+        expected_url: Optional[str] = None
+    ) -> bool:
+        match = {"message_id": message_id}
+        if expected_url is not None:
+            match["animation.cloudinary_url"] = expected_url
+        result = await self.buckets_collection.update_one(
+            {"messages": {"$elemMatch": match}},
+            {"$set": {"messages.$.animation": animation.dict()}}
+        )
+        return result.modified_count > 0
+
+def build_chat_service(layout: str = CHAT_STORAGE_LAYOUT) -> ChatService:
+    available = {"flat": ChatService, "bucketed": BucketedChatService}
+    if layout not in available:
+        raise ValueError(f"Unknown CHAT_STORAGE_LAYOUT '{layout}', expected one of {', '.join(available)}")
+    return available[layout]()
+
+chat_service: Optional[ChatService] = None
+
+def start_chat_service() -> ChatService:
+    """Create the app-scoped service once the database has answered a ping."""
+    global chat_service
+
+    chat_service = build_chat_service()
+    return chat_service
+
+def stop_chat_service():
+    global chat_service
+
+    chat_service = None
+
+def get_chat_service() -> ChatService:
+    if not chat_service:
+        raise Exception("Database not available yet. Chat history is unavailable.")
+    return chat_service
+
+def get_optional_chat_service() -> Optional[ChatService]:
+    """For callers that keep working, without chat history, when the database is down."""
+    return chat_service
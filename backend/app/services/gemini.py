@@ -1,27 +1,118 @@
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+import asyncio
+import random
+from types import SimpleNamespace
+import httpx
+from google.api_core import exceptions as google_exceptions
 
-load_dotenv()
+from app.lib.settings import settings
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.0-flash")
+MODEL_NAME = "gemini-2.0-flash"
+CODE_INSTRUCTIONS = (
+    "Generate valid Python code for a Manim animation. "
+    "The code must define a class that inherits from Scene or a Scene subclass. "
+    "Include all necessary imports like 'from manim import *'. "
+    "The class must have a construct method. "
+    "Provide only the executable Python code with no explanations or markdown."
+)
 
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
 
-def get_manim_code_from_prompt(prompt):
+TRANSIENT_ERRORS = (
+    asyncio.TimeoutError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+)
+
+class RESTGenerativeModel:
+    """
+    generateContent over plain HTTP against settings.gemini_api_endpoint. Mirrors the
+    part of GenerativeModel used here, and raises the same google.api_core
+    exceptions so the retry policy applies unchanged.
+    """
+
+    def __init__(self, endpoint: str, model_name: str, api_key: str):
+        self.url = f"{endpoint}/v1beta/models/{model_name}:generateContent"
+        self.api_key = api_key
+        self._client = None
+
+    async def generate_content_async(self, prompt: str, request_options: dict = None):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=GEMINI_TIMEOUT)
+        response = await self._client.post(
+            self.url,
+            headers={"x-goog-api-key": self.api_key},
+            json={"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        )
+        if response.status_code >= 400:
+            raise google_exceptions.from_http_status(response.status_code, response.text)
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        return SimpleNamespace(text="".join(part.get("text", "") for part in parts))
+
+model = None
+
+def get_model():
+    """
+    The Gemini client, created on first use: google.generativeai is one
+    of the slowest imports in the app, so startup leaves it to warm_up.
+    """
+    global model
+
+    if model is None:
+        if settings.gemini_api_endpoint:
+            model = RESTGenerativeModel(settings.gemini_api_endpoint, MODEL_NAME, settings.gemini_api_key)
+        else:
+            import google.generativeai as genai
+
+            genai.configure(api_key=settings.gemini_api_key)
+            model = genai.GenerativeModel(MODEL_NAME)
+    return model
+
+async def warm_up():
+    """Import and configure the client off the event loop, so the first request does not pay for it."""
+    await asyncio.to_thread(get_model)
+
+_llm_slots = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+class LLMOverloadedError(Exception):
+    pass
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, GEMINI_RETRY_BASE_DELAY * (2 ** attempt))
+
+async def _generate_with_retries(prompt: str) -> str:
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            response = await asyncio.wait_for(
+                get_model().generate_content_async(prompt, request_options={"timeout": GEMINI_TIMEOUT}),
+                timeout=GEMINI_TIMEOUT
+            )
+            return response.text
+        except TRANSIENT_ERRORS:
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(retry_delay(attempt))
+
+async def get_manim_code_from_prompt(prompt):
     """Get Manim code from Gemini based on the prompt."""
+    # shed load instead of queueing forever when every slot is busy
     try:
-        enhanced_prompt = (
-            f"{prompt}\n\n"
-            "Generate valid Python code for a Manim animation. "
-            "The code must define a class that inherits from Scene or a Scene subclass. "
-            "Include all necessary imports like 'from manim import *'. "
-            "The class must have a construct method. "
-            "Provide only the executable Python code with no explanations or markdown."
-        )
-        
-        response = model.generate_content(enhanced_prompt)
-        
-        return response.text
+        await asyncio.wait_for(_llm_slots.acquire(), timeout=GEMINI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise LLMOverloadedError("Too many concurrent LLM requests, try again later.")
+
+    try:
+        enhanced_prompt = f"{prompt}\n\n{CODE_INSTRUCTIONS}"
+
+        return await _generate_with_retries(enhanced_prompt)
     except Exception as e:
-        raise Exception(f"Error getting code from Gemini: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error getting code from Gemini: {str(e)}")
+    finally:
+        _llm_slots.release()
@@ -0,0 +1,452 @@
+import asyncio
+import os
+import re
+import time
+from datetime import datetime
+from typing import Optional
+
+from app.models.chat_models import AnimationModel, MessageMetadata, MessageModel
+from app.models.job_models import JobModel
+from app.services.chat_service import ChatService, get_optional_chat_service
+from app.services.gemini import get_manim_code_from_prompt, MODEL_NAME, CODE_INSTRUCTIONS
+from app.services.jobs import get_job_queue
+from app.services.llm_cache import llm_cache, llm_cache_key
+from app.services.postprocess import postprocess, media_assets, media_fields, content_type
+from app.services.manim import extract_class_name, save_code_to_file, cleanup_render_artifacts, render_settings, DEFAULT_QUALITY
+from app.services.render_workers import get_render_pool
+from app.services.storage import (
+    storage, local_video_url, UPLOAD_IN_BACKGROUND, UPLOAD_BACKGROUND_RETRIES, UPLOAD_BACKGROUND_RETRY_DELAY
+)
+from app.services.validation import (
+    validate_scene_code, dry_run_error, build_repair_prompt, CodeValidationError,
+    VALIDATION_DRY_RUN, VALIDATION_REPAIR_ATTEMPTS
+)
+from app.services.render_cache import render_cache, render_cache_key
+from app.services.single_flight import SingleFlight
+from app.services.tracing import span, current_trace
+
+# identical in-flight work is done once: code by prompt and options, renders by render cache key
+code_flights = SingleFlight()
+render_flights = SingleFlight()
+
+def clean_code(code):
+    """
+    Clean the code to remove non-Python elements while preserving
+    important structures like class definitions.
+    """
+    code_block_pattern = r'```(?:python)?\s*(.*?)\s*```'
+    code_blocks = re.findall(code_block_pattern, code, re.DOTALL)
+
+    if code_blocks:
+        cleaned_code = max(code_blocks, key=len)
+    else:
+        lines = code.split('\n')
+        cleaned_lines = []
+
+        for line in lines:
+            if re.match(r'^\d+\.\s+\*\*', line.strip()):
+                continue
+
+            if line.strip().startswith(('# ', '## ', '### ')) and ':' in line:
+                continue
+
+            line = re.sub(r'\*\*(.*?)\*\*', r'\1', line)
+            line = re.sub(r'`(.*?)`', r'\1', line)
+
+            cleaned_lines.append(line)
+
+        cleaned_code = '\n'.join(cleaned_lines)
+
+    if "from manim import" not in cleaned_code:
+        cleaned_code = "from manim import *\n" + cleaned_code
+
+    if not re.search(r'class\s+\w+\s*\(\s*\w*Scene\w*\s*\)', cleaned_code):
+        cleaned_code += '\n\nclass DefaultScene(Scene):\n    def construct(self):\n        self.add(Text("Default Scene"))\n'
+
+    return cleaned_code
+
+GENERATION_INSTRUCTIONS = (
+    "Generate ONLY valid Python code for a Manim animation. "
+    "The code must include a class that inherits from Scene (or a Scene subclass like ThreeDScene). "
+    "Include all necessary imports. "
+    "Do not include explanations, markdown formatting, or installation instructions. "
+    "The output should be directly executable as a Python file."
+)
+
+def job_client(job: JobModel) -> str:
+    return job.payload.get("client", "anonymous")
+
+def build_prompt(prompt: str) -> str:
+    return f"{prompt}\n\n{GENERATION_INSTRUCTIONS}"
+
+async def dry_run(job: JobModel, code: str, class_name: str):
+    script_path, file_id = save_code_to_file(code)
+    try:
+        async with span("code.dry_run", scene=class_name):
+            failure = await get_render_pool().dry_run(script_path, class_name, file_id, client=job_client(job))
+    finally:
+        await asyncio.to_thread(cleanup_render_artifacts, script_path, file_id)
+    if failure:
+        raise dry_run_error(failure)
+
+async def prepare_code(job: JobModel, prompt: str, raw_code: str) -> tuple[str, str, str]:
+    """
+    Clean and validate the LLM output before it reaches a render worker.
+    On failure Gemini gets the structured errors back for a repair attempt.
+    Returns the raw response that passed, the cleaned code and the scene name.
+    """
+    attempts = VALIDATION_REPAIR_ATTEMPTS if job.payload.get("auto_repair", True) else 0
+    for attempt in range(attempts + 1):
+        async with span("code.clean"):
+            code = clean_code(raw_code)
+            class_name = extract_class_name(code)
+        try:
+            async with span("code.validate", attempt=attempt):
+                validate_scene_code(code, class_name)
+            if VALIDATION_DRY_RUN:
+                await dry_run(job, code, class_name)
+            return raw_code, code, class_name
+        except CodeValidationError as e:
+            get_job_queue().publish(job, "validation_failed", details=e.details, attempt=attempt)
+            if attempt == attempts:
+                raise
+            async with span("llm.repair", model=MODEL_NAME, attempt=attempt):
+                raw_code = await get_manim_code_from_prompt(build_repair_prompt(prompt, code, e))
+
+def animation_from_upload(asset: dict, quality: str) -> AnimationModel:
+    return AnimationModel(
+        cloudinary_url=asset["url"],
+        cloudinary_public_id=asset["public_id"],
+        storage_backend=asset["backend"],
+        format="mp4",
+        quality=quality,
+        **asset.get("media", {})
+    )
+
+def local_asset(video_path: str, media: dict, media_dir: str) -> dict:
+    """The asset dict for serving a video and its media from local disk through /videos."""
+    urls = {name: local_video_url(os.path.join(media_dir, name)) for name in media_assets(media)}
+    return {
+        "url": local_video_url(video_path), "public_id": None, "backend": "local",
+        "media": media_fields(media, urls)
+    }
+
+async def save_to_storage(path: str, key: str, media: dict, media_dir: str) -> dict:
+    """Upload the mp4 and its post-processed media side by side; a media file that fails to upload is left out."""
+    names = media_assets(media)
+    async with span("upload", backend=storage.name, files=1 + len(names)):
+        asset, *uploaded = await asyncio.gather(
+            storage.save_video(path, key),
+            *(storage.save_asset(os.path.join(media_dir, name), f"{key}/{name}", content_type(name)) for name in names),
+            return_exceptions=True
+        )
+    if isinstance(asset, BaseException):
+        raise asset
+    urls = {name: url for name, url in zip(names, uploaded) if isinstance(url, str)}
+    return {**asset, "media": media_fields(media, urls)}
+
+async def save_in_background(path: str, key: str, media: dict, media_dir: str) -> dict:
+    """save_to_storage, started over with backoff when it fails; the placeholder serves the local copy meanwhile."""
+    for attempt in range(UPLOAD_BACKGROUND_RETRIES + 1):
+        try:
+            return await save_to_storage(path, key, media, media_dir)
+        except Exception as e:
+            if attempt == UPLOAD_BACKGROUND_RETRIES:
+                raise
+            await asyncio.sleep(UPLOAD_BACKGROUND_RETRY_DELAY * 2 ** attempt)
+
+async def render_and_upload(
+    job: JobModel, code: str, class_name: str, quality: str, cache_key: str
+) -> tuple[AnimationModel, Optional[asyncio.Task]]:
+    """
+    Render the scene (unless the file tier already has it), post-process it
+    and hand the mp4 and its media to the storage backend. With UPLOAD_IN_BACKGROUND and a remote backend
+    the upload is left running and the animation points at the local
+    /videos copy until it finishes, which stays pinned in the file tier
+    until then.
+    """
+    queue = get_job_queue()
+    video_path = render_cache.get_file(cache_key)
+    media_dir = render_cache.media_dir(cache_key)
+    script_path, file_id = None, None
+
+    try:
+        if not video_path:
+            script_path, file_id = save_code_to_file(code)
+            queue.publish(job, "render_started", scene=class_name, quality=quality)
+            pool = get_render_pool()
+            on_progress = lambda progress: queue.publish(job, "render_progress", **progress)
+            async with span("render", scene=class_name, quality=quality):
+                if pool.postprocesses_remotely:
+                    # the render host post-processed it and its media came back into media_dir
+                    rendered_path, media = await pool.render_with_media(
+                        script_path, class_name, file_id, quality, media_dir,
+                        on_progress=on_progress, client=job_client(job)
+                    )
+                else:
+                    rendered_path = await pool.render(
+                        script_path, class_name, file_id, quality, on_progress=on_progress, client=job_client(job)
+                    )
+                    media = None
+            if media is None:
+                async with span("postprocess") as post:
+                    media = await postprocess(rendered_path, media_dir)
+                    post.set(hls="hls" in media)
+            video_path = await asyncio.to_thread(render_cache.store_file, cache_key, rendered_path)
+        else:
+            # files cached before post-processing existed (or whose media was lost) get it now
+            async with span("postprocess"):
+                media = await postprocess(video_path, media_dir, reuse=True)
+        queue.publish(job, "render_done", quality=quality)
+    finally:
+        if file_id:
+            await asyncio.to_thread(cleanup_render_artifacts, script_path, file_id)
+
+    queue.publish(job, "upload_started")
+    key = f"{time.time()}/{cache_key}"
+    if UPLOAD_IN_BACKGROUND and storage.remote:
+        render_cache.pin(cache_key)
+        upload = asyncio.create_task(save_in_background(video_path, key, media, media_dir))
+        upload.add_done_callback(lambda _: render_cache.unpin(cache_key))
+        placeholder = animation_from_upload(local_asset(video_path, media, media_dir), quality)
+        return placeholder, upload
+
+    animation = animation_from_upload(await save_to_storage(video_path, key, media, media_dir), quality)
+    queue.publish(job, "upload_done", video_url=animation.cloudinary_url)
+    return animation, None
+
+async def coalesced(job: JobModel, flights: SingleFlight, key: str, fn) -> tuple:
+    """
+    Run fn through flights, so concurrent jobs needing the same work share
+    one run. A job that joins another job's run gets that job's stage
+    events mirrored onto its own while it waits.
+    """
+    queue = get_job_queue()
+    owner = flights.owner(key)
+    if owner:
+        leader, since = owner
+        queue.follow(job, leader, since)
+    try:
+        return await flights.do(key, fn, owner=(job, len(job.events)))
+    finally:
+        if owner:
+            queue.unfollow(job, leader)
+
+async def get_or_render(
+    job: JobModel, code: str, class_name: str, quality: str
+) -> tuple[AnimationModel, bool, Optional[asyncio.Task], bool]:
+    """
+    Return the cached animation for this scene and quality, rendering it on
+    a miss. The third value is a task resolving to the uploaded animation
+    when the upload is still running in the background; the fourth is
+    whether the render was shared with a concurrent job.
+    """
+    cache_key = render_cache_key(code, class_name, render_settings(quality))
+    (animation, render_cached, pending), joined = await coalesced(
+        job, render_flights, cache_key, lambda: lookup_or_render(job, code, class_name, quality, cache_key)
+    )
+    return animation, render_cached, pending, joined
+
+async def lookup_or_render(
+    job: JobModel, code: str, class_name: str, quality: str, cache_key: str
+) -> tuple[AnimationModel, bool, Optional[asyncio.Task]]:
+    settings = render_settings(quality)
+    async with span("render_cache.lookup", quality=quality) as lookup:
+        animation = await render_cache.get(cache_key)
+        lookup.set(hit=animation is not None)
+    if animation:
+        get_job_queue().publish(job, "render_cached", video_url=animation.cloudinary_url, quality=quality)
+        return animation, True, None
+
+    animation, upload = await render_and_upload(job, code, class_name, quality, cache_key)
+    if not upload:
+        await render_cache.put(cache_key, class_name, settings, animation)
+        return animation, False, None
+
+    async def cache_when_uploaded() -> AnimationModel:
+        uploaded = animation_from_upload(await upload, quality)
+        await render_cache.put(cache_key, class_name, settings, uploaded)
+        return uploaded
+
+    return animation, False, asyncio.create_task(cache_when_uploaded())
+
+async def swap_in_uploaded(
+    job: JobModel, pending: asyncio.Task, placeholder: AnimationModel,
+    result: dict, chat_service: Optional[ChatService], message_id: str
+):
+    """
+    Replace the local placeholder URL with the CDN one once a background
+    upload lands, or mark the animation failed once it has given up, as the
+    local copy is no longer kept for it. Each swap only touches records
+    still pointing at its own placeholder, so a late draft upload never
+    overwrites the final video.
+    """
+    queue = get_job_queue()
+    try:
+        animation = await pending
+    except Exception as e:
+        queue.publish(job, "upload_failed", error=str(e), quality=placeholder.quality)
+        animation = placeholder.model_copy(update={"upload_failed": True})
+        if result.get("video_url") == placeholder.cloudinary_url:
+            result.update(upload_pending=False, upload_failed=True)
+    else:
+        queue.publish(job, "upload_done", video_url=animation.cloudinary_url, quality=animation.quality)
+        if result.get("video_url") == placeholder.cloudinary_url:
+            result.update(
+                video_url=animation.cloudinary_url, poster_url=animation.poster_url,
+                hls_url=animation.hls_url, upload_pending=False
+            )
+
+    if chat_service:
+        try:
+            async with span("mongo.update_animation"):
+                await chat_service.update_message_animation(
+                    message_id, animation, expected_url=placeholder.cloudinary_url
+                )
+        except Exception as e:
+            pass
+
+def code_flight_key(job: JobModel, llm_key: str) -> str:
+    # jobs that skip the cache or repairs must not be handed code produced under other rules
+    return f"{llm_key}:{bool(job.payload.get('bypass_cache'))}:{job.payload.get('auto_repair', True)}"
+
+async def generate_code(job: JobModel, prompt: str) -> tuple[str, str, bool, bool]:
+    """
+    Cached or fresh LLM code for the prompt, validated; returns the code,
+    the scene name, whether it was cached and whether it was shared with a
+    concurrent job asking for the same prompt.
+    """
+    llm_key = llm_cache_key(prompt, MODEL_NAME, GENERATION_INSTRUCTIONS + CODE_INSTRUCTIONS)
+    (code, class_name, code_cached), joined = await coalesced(
+        job, code_flights, code_flight_key(job, llm_key), lambda: fetch_code(job, prompt, llm_key)
+    )
+    return code, class_name, code_cached, joined
+
+async def fetch_code(job: JobModel, prompt: str, llm_key: str) -> tuple[str, str, bool]:
+    raw_code = None
+    if not job.payload.get("bypass_cache"):
+        async with span("llm.cache_lookup") as lookup:
+            raw_code = await llm_cache.get(llm_key)
+            lookup.set(hit=raw_code is not None)
+    code_cached = raw_code is not None
+    if not code_cached:
+        async with span("llm.generate", model=MODEL_NAME):
+            raw_code = await get_manim_code_from_prompt(build_prompt(prompt))
+
+    raw_code, code, class_name = await prepare_code(job, prompt, raw_code)
+    if not code_cached:
+        # only code that passed validation is worth serving again
+        await llm_cache.set(llm_key, raw_code)
+    get_job_queue().publish(job, "code_generated", code=code, scene=class_name, code_cached=code_cached)
+    return code, class_name, code_cached
+
+async def save_reply(
+    job: JobModel,
+    chat_service: ChatService,
+    animation: AnimationModel,
+    metadata: MessageMetadata
+):
+    """Store the AI reply; the user's prompt was stored when the job was submitted."""
+    session_id = job.payload["session_id"]
+    message = MessageModel(
+        session_id=session_id,
+        message_id=job.payload["message_id"],
+        content="I've created an animation based on your request!",
+        sender="ai",
+        timestamp=datetime.utcnow(),
+        animation=animation,
+        metadata=metadata
+    )
+
+    try:
+        async with span("mongo.save_messages", count=1):
+            await chat_service.add_messages(session_id, [message])
+    except Exception as e:
+        pass
+
+async def run_generation_job(job: JobModel) -> dict:
+    """
+    Full generate pipeline for one queued job: LLM call, validation, render
+    on a warm worker, upload, and the AI reply in the chat session.
+    """
+    start_time = time.time()
+    prompt = job.payload["prompt"]
+    session_id = job.payload.get("session_id")
+    ai_message_id = job.payload["message_id"]
+    quality = job.payload.get("quality", DEFAULT_QUALITY)
+    progressive = job.payload.get("progressive", False) and quality != DEFAULT_QUALITY
+
+    chat_service = get_optional_chat_service() if session_id else None
+    code, class_name, code_cached, code_shared = await generate_code(job, prompt)
+    # progressive jobs render a draft first so the user has something to watch
+    first_quality = DEFAULT_QUALITY if progressive else quality
+    animation, render_cached, pending, render_shared = await get_or_render(job, code, class_name, first_quality)
+
+    generation_time = time.time() - start_time
+
+    trace = current_trace()
+    metadata = MessageMetadata(
+        prompt=prompt,
+        generation_time=generation_time,
+        manim_code=code,
+        stages=trace.stages() if trace else None,
+        trace_id=trace.trace_id if trace else None
+    )
+
+    if chat_service:
+        await save_reply(job, chat_service, animation, metadata)
+
+    result = {
+        "video_url": animation.cloudinary_url,
+        "poster_url": animation.poster_url,
+        "hls_url": animation.hls_url,
+        "duration": animation.duration,
+        "upload_pending": pending is not None,
+        "quality": animation.quality,
+        "session_id": session_id,
+        "message_id": ai_message_id,
+        "generation_time": generation_time,
+        "render_cached": render_cached,
+        "code_cached": code_cached,
+        "coalesced": code_shared or render_shared,
+        "trace_id": metadata.trace_id,
+        "stages": metadata.stages
+    }
+
+    if pending:
+        # started only after the message exists, so the swap always finds it;
+        # the result dict is updated in place and is what the job stores
+        storage.run_in_background(swap_in_uploaded(job, pending, animation, result, chat_service, ai_message_id))
+
+    if not progressive:
+        return result
+
+    job.result = result
+    get_job_queue().publish(job, "draft_ready", result=result)
+
+    final_animation, final_cached, final_pending, final_shared = await get_or_render(job, code, class_name, quality)
+    if chat_service:
+        try:
+            async with span("mongo.update_animation"):
+                await chat_service.update_message_animation(ai_message_id, final_animation)
+        except Exception as e:
+            pass
+
+    final_result = {
+        **result,
+        "video_url": final_animation.cloudinary_url,
+        "poster_url": final_animation.poster_url,
+        "hls_url": final_animation.hls_url,
+        "duration": final_animation.duration,
+        "upload_pending": final_pending is not None,
+        "draft_video_url": animation.cloudinary_url,
+        "quality": quality,
+        "render_cached": final_cached,
+        "coalesced": result["coalesced"] or final_shared,
+        "generation_time": time.time() - start_time
+    }
+    if final_pending:
+        storage.run_in_background(
+            swap_in_uploaded(job, final_pending, final_animation, final_result, chat_service, ai_message_id)
+        )
+    return final_result
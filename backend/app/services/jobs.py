@@ -0,0 +1,286 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Any
+
+from app.models.job_models import JobModel, JobStatus
+from app.services.metrics import jobs_finished
+from app.services.render_workers import default_worker_count
+from app.services.scheduler import FairScheduler, AdmissionRejected, Ticket, half_of
+from app.services.tracing import start_trace, record_span
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "0"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "100"))
+# refuse new jobs once the estimated wait passes this many seconds; 0 only applies JOB_QUEUE_MAX_SIZE
+JOB_QUEUE_MAX_WAIT = float(os.getenv("JOB_QUEUE_MAX_WAIT", "0"))
+# running jobs per client; 0 means half of the job concurrency
+JOB_MAX_RUNNING_PER_CLIENT = int(os.getenv("JOB_MAX_RUNNING_PER_CLIENT", "0"))
+JOB_MAX_PENDING_PER_CLIENT = int(os.getenv("JOB_MAX_PENDING_PER_CLIENT", "10"))
+JOB_MAX_PENDING_PER_SESSION = int(os.getenv("JOB_MAX_PENDING_PER_SESSION", "4"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+
+TERMINAL_STAGES = ("completed", "failed", "cancelled")
+
+JobHandler = Callable[[JobModel], Awaitable[Dict[str, Any]]]
+
+class JobQueue:
+    """
+    Bounded in-process job queue. Jobs wait for one of `concurrency` slots
+    from a FairScheduler, which serves clients in turn (drafts first) and
+    turns new jobs away with AdmissionRejected when they would wait too
+    long; rendering itself happens on the render worker pool so the event
+    loop stays responsive.
+    """
+
+    def __init__(self, handler: JobHandler, concurrency: Optional[int] = None, max_size: int = JOB_QUEUE_MAX_SIZE):
+        self.handler = handler
+        # twice the render workers by default, so LLM calls and uploads for
+        # some jobs overlap with renders for others
+        self.concurrency = concurrency or JOB_CONCURRENCY or 2 * default_worker_count()
+        self.scheduler = FairScheduler(
+            self.concurrency,
+            max_per_client=JOB_MAX_RUNNING_PER_CLIENT or half_of(self.concurrency),
+            max_waiting=max_size,
+            max_wait=JOB_QUEUE_MAX_WAIT,
+            max_per_client_queued=JOB_MAX_PENDING_PER_CLIENT
+        )
+        self.max_size = max_size
+        self.jobs: Dict[str, JobModel] = {}
+        self.subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._tickets: Dict[str, Ticket] = {}
+        self._dispatchers: set[asyncio.Task] = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_reasons: Dict[str, str] = {}
+        # job id -> jobs that joined work it is running (see follow)
+        self._followers: Dict[str, List[JobModel]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        dispatchers, self._dispatchers = self._dispatchers, set()
+        for task in dispatchers:
+            task.cancel()
+        await asyncio.gather(*dispatchers, return_exceptions=True)
+
+    def submit(self, payload: Dict[str, Any], client: str = "anonymous", lane: int = 0, cost: float = 1.0) -> JobModel:
+        """
+        Queue a job for client in the given priority lane, charged cost in
+        fair queuing. Raises AdmissionRejected, with a retry_after hint,
+        when the queue or the client's or session's share is full.
+        """
+        self._evict_expired()
+        session_id = payload.get("session_id")
+        if session_id and JOB_MAX_PENDING_PER_SESSION:
+            pending = sum(
+                1 for job in self.jobs.values() if not job.is_finished and job.payload.get("session_id") == session_id
+            )
+            if pending >= JOB_MAX_PENDING_PER_SESSION:
+                self.scheduler.rejected += 1
+                raise AdmissionRejected(
+                    f"Too many animations in progress in this chat (limit {JOB_MAX_PENDING_PER_SESSION}).",
+                    "session_limit", max(1, round(self.scheduler.service_time))
+                )
+
+        ticket = self.scheduler.enqueue(client, lane, cost)
+        job = JobModel(payload=payload)
+        self.jobs[job.job_id] = job
+        self._tickets[job.job_id] = ticket
+        dispatcher = asyncio.create_task(self._dispatch(job, ticket))
+        self._dispatchers.add(dispatcher)
+        dispatcher.add_done_callback(self._dispatchers.discard)
+        self.publish(job, "queued", position=self.scheduler.position(ticket))
+        return job
+
+    def get(self, job_id: str) -> Optional[JobModel]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str, reason: str = "cancelled_by_user") -> bool:
+        """
+        Cancel a queued or running job. A running job's task is cancelled,
+        which kills its render worker's process group. Returns False if the
+        job is unknown or already finished.
+        """
+        job = self.jobs.get(job_id)
+        if not job or job.is_finished:
+            return False
+        task = self._running.get(job_id)
+        if task:
+            self._cancel_reasons[job_id] = reason
+            task.cancel()
+        else:
+            # still queued; give up its place, and its dispatcher skips finished jobs
+            ticket = self._tickets.pop(job_id, None)
+            if ticket:
+                self.scheduler.cancel(ticket)
+            self._cancelled(job, reason)
+        return True
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        ticket = self._tickets.get(job_id)
+        return self.scheduler.position(ticket) if ticket else None
+
+    def publish(self, job: JobModel, stage: str, **data):
+        """Record a stage event on the job and fan it out to live subscribers."""
+        event = {"stage": stage, "timestamp": datetime.utcnow().isoformat(), **data}
+        job.events.append(event)
+        for subscriber in self.subscribers.get(job.job_id, []):
+            subscriber.put_nowait(event)
+        for follower in self._followers.get(job.job_id, []):
+            self.publish(follower, stage, **data)
+
+    def follow(self, follower: JobModel, leader: JobModel, since: int = 0):
+        """
+        Mirror the leader's stage events onto a job that is waiting on shared
+        work the leader runs, replaying those published since index since.
+        """
+        for event in leader.events[since:]:
+            if event["stage"] not in TERMINAL_STAGES:
+                self.publish(follower, **event)
+        self._followers.setdefault(leader.job_id, []).append(follower)
+
+    def unfollow(self, follower: JobModel, leader: JobModel):
+        followers = self._followers.get(leader.job_id, [])
+        if follower in followers:
+            followers.remove(follower)
+        if not followers:
+            self._followers.pop(leader.job_id, None)
+
+    async def subscribe(self, job_id: str, heartbeat: Optional[float] = None) -> AsyncIterator[dict]:
+        """
+        Yield the job's past events, then live ones until it finishes. With
+        heartbeat set, a heartbeat event is yielded after that many idle seconds.
+        """
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+
+        # registering and snapshotting without an await in between means every
+        # event is either in the snapshot or in the subscriber queue, never both
+        subscriber: asyncio.Queue = asyncio.Queue()
+        self.subscribers.setdefault(job_id, []).append(subscriber)
+        past_events = list(job.events)
+        try:
+            for event in past_events:
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield {"stage": "heartbeat"}
+                    continue
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+        finally:
+            self.subscribers[job_id].remove(subscriber)
+            if not self.subscribers[job_id]:
+                del self.subscribers[job_id]
+
+    async def _dispatch(self, job: JobModel, ticket: Ticket):
+        try:
+            await self.scheduler.wait(ticket)
+        except asyncio.CancelledError:
+            # withdrawn by cancel(), or the queue is stopping
+            return
+        try:
+            if not job.is_finished:
+                await self._run(job)
+        finally:
+            self.scheduler.release(ticket)
+            self._tickets.pop(job.job_id, None)
+
+    def stats(self) -> dict:
+        scheduler = self.scheduler.stats()
+        return {
+            "queued": scheduler["waiting"],
+            "running": sum(1 for job in self.jobs.values() if job.status == JobStatus.RUNNING),
+            "max_size": self.max_size,
+            "concurrency": self.concurrency,
+            "clients": scheduler["clients"],
+            "estimated_wait": scheduler["estimated_wait"],
+            "rejected": scheduler["rejected"]
+        }
+
+    async def _run(self, job: JobModel):
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.utcnow()
+        async with start_trace("job", job_id=job.job_id) as root:
+            job.trace_id = root.trace.trace_id
+            record_span("queue_wait", unix_ns(job.created_at), unix_ns(job.started_at))
+            # the handler runs as its own task so one job can be cancelled without its consumer
+            task = asyncio.create_task(self.handler(job))
+            self._running[job.job_id] = task
+            try:
+                self.publish(job, "started")
+                job.result = await task
+                job.status = JobStatus.COMPLETED
+                job.finished_at = datetime.utcnow()
+                jobs_finished.inc(status="completed")
+                self.publish(job, "completed", result=job.result)
+            except asyncio.CancelledError:
+                reason = self._cancel_reasons.pop(job.job_id, None)
+                if not reason:
+                    # the queue itself is shutting down
+                    self._fail(job, "Job cancelled")
+                    raise
+                root.error = reason
+                self._cancelled(job, reason)
+            except Exception as e:
+                root.error = str(e)
+                self._fail(job, str(e), getattr(e, "details", None))
+            finally:
+                self._running.pop(job.job_id, None)
+                self._cancel_reasons.pop(job.job_id, None)
+
+    def _fail(self, job: JobModel, error: str, details: Optional[List[dict]] = None):
+        jobs_finished.inc(status="failed")
+        job.status = JobStatus.FAILED
+        job.error = error
+        job.error_details = details
+        job.finished_at = datetime.utcnow()
+        self.publish(job, "failed", error=error, details=details)
+
+    def _cancelled(self, job: JobModel, reason: str):
+        jobs_finished.inc(status="cancelled")
+        job.status = JobStatus.CANCELLED
+        job.error = f"Job cancelled ({reason})"
+        job.error_details = [{"type": reason, "message": job.error}]
+        job.finished_at = datetime.utcnow()
+        self.publish(job, "cancelled", error=job.error, details=job.error_details)
+
+    def _evict_expired(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_RESULT_TTL)
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.is_finished and job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+def unix_ns(moment: datetime) -> int:
+    # job timestamps are naive UTC
+    return int(moment.replace(tzinfo=timezone.utc).timestamp() * 1e9)
+
+job_queue: Optional[JobQueue] = None
+
+async def start_job_queue(handler: JobHandler) -> JobQueue:
+    global job_queue
+
+    job_queue = JobQueue(handler)
+    await job_queue.start()
+    return job_queue
+
+async def stop_job_queue():
+    global job_queue
+
+    if job_queue:
+        await job_queue.stop()
+    job_queue = None
+
+def get_job_queue() -> JobQueue:
+    if not job_queue:
+        raise Exception("Job queue not started. Call start_job_queue() first.")
+    return job_queue
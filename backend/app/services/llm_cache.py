@@ -0,0 +1,143 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from app.lib.database import get_database, is_database_connected
+
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_BACKENDS = os.getenv("LLM_CACHE_BACKENDS", "memory")
+
+def normalize_prompt(prompt: str) -> str:
+    """Fold case and whitespace so trivially different prompts share an entry."""
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+def llm_cache_key(prompt: str, model_name: str, template: str) -> str:
+    digest = hashlib.sha256()
+    for part in (normalize_prompt(prompt), model_name, template):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class ResponseCacheBackend:
+    """Interface for one tier of the LLM response cache."""
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, response: str):
+        raise NotImplementedError
+
+class MemoryResponseCache(ResponseCacheBackend):
+    name = "memory"
+
+    def __init__(self, max_entries: int = LLM_CACHE_MEMORY_ENTRIES, ttl: int = LLM_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[str]:
+        cached = self.entries.get(key)
+        if not cached:
+            return None
+        response, stored_at = cached
+        if time.time() - stored_at >= self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    async def set(self, key: str, response: str):
+        self.entries[key] = (response, time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class MongoResponseCache(ResponseCacheBackend):
+    name = "mongo"
+
+    def __init__(self, ttl: int = LLM_CACHE_TTL):
+        self.ttl = ttl
+
+    @property
+    def collection(self):
+        return get_database().llm_cache
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("created_at", expireAfterSeconds=self.ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        if not is_database_connected():
+            return None
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        entry = await self.collection.find_one({"_id": key, "created_at": {"$gte": cutoff}}, {"response": 1})
+        return entry["response"] if entry else None
+
+    async def set(self, key: str, response: str):
+        if not is_database_connected():
+            return
+        await self.collection.replace_one(
+            {"_id": key},
+            {"_id": key, "response": response, "created_at": datetime.utcnow()},
+            upsert=True
+        )
+
+class LLMResponseCache:
+    """
+    Read-through over an ordered list of tiers. A hit in a slower tier is
+    copied into the faster ones; a failing tier is treated as a miss.
+    """
+
+    def __init__(self, backends: List[ResponseCacheBackend]):
+        self.backends = backends
+        self.hits = {backend.name: 0 for backend in backends}
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        for index, backend in enumerate(self.backends):
+            try:
+                response = await backend.get(key)
+            except Exception as e:
+                response = None
+            if response is not None:
+                self.hits[backend.name] += 1
+                for faster in self.backends[:index]:
+                    await faster.set(key, response)
+                return response
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: str):
+        for backend in self.backends:
+            try:
+                await backend.set(key, response)
+            except Exception as e:
+                pass
+
+    async def ensure_indexes(self):
+        for backend in self.backends:
+            if hasattr(backend, "ensure_indexes"):
+                await backend.ensure_indexes()
+
+    def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+def build_llm_cache(spec: str = LLM_CACHE_BACKENDS) -> LLMResponseCache:
+    available = {"memory": MemoryResponseCache, "mongo": MongoResponseCache}
+    names = [name.strip() for name in spec.split(",") if name.strip()]
+    return LLMResponseCache([available[name]() for name in names if name in available])
+
+llm_cache = build_llm_cache()
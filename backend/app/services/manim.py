@@ -1,13 +1,21 @@
 import os
-import subprocess
+import shutil
 import re
 import uuid
+import importlib.util
+from typing import Callable, Optional
+
+from app.services import scene_cache
 
 TEMP_SCRIPT_DIR = "videos/scripts"
 VIDEO_OUTPUT_DIR = "videos/outputs"
-
-os.makedirs(TEMP_SCRIPT_DIR, exist_ok=True)
-os.makedirs(VIDEO_OUTPUT_DIR, exist_ok=True)
+DEFAULT_QUALITY = "draft"
+QUALITY_PRESETS = {
+    "draft": "low_quality",      # 854x480 @ 15fps
+    "medium": "medium_quality",  # 1280x720 @ 30fps
+    "high": "high_quality",      # 1920x1080 @ 60fps
+    "4k": "fourk_quality",       # 3840x2160 @ 60fps
+}
 
 def extract_class_name(code):
     """
@@ -51,22 +59,87 @@ def save_code_to_file(code: str) -> tuple[str, str]:
     
     return script_path, file_id
 
-def render_manim_video(script_path: str, class_name: str, file_id: str) -> str:
-    
-    output_path = os.path.join(VIDEO_OUTPUT_DIR, f"Animation.mp4")
+def render_settings(quality: str = DEFAULT_QUALITY) -> dict:
+    """Manim config that decides what a render looks like; also part of the render cache key."""
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown render quality: {quality}")
+    return {"quality": QUALITY_PRESETS[quality], "format": "mp4"}
 
-    command = [
-        "manim", "-pql", script_path, class_name,
-        "-o", f"Animation.mp4",
-        "--media_dir", VIDEO_OUTPUT_DIR,
-        "--verbosity", "DEBUG"  
-    ]
+def get_media_dir(file_id: str) -> str:
+    """Each render gets its own media dir so concurrent jobs never share output paths."""
+    return os.path.join(VIDEO_OUTPUT_DIR, file_id)
+
+def load_scene_class(script_path: str, class_name: str):
+    # a fresh module name per script, never registered in sys.modules, so
+    # one job's definitions cannot leak into the next job on the same worker
+    spec = importlib.util.spec_from_file_location(f"llmanim_scene_{uuid.uuid4().hex}", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, class_name)
+
+def render_scene(
+    script_path: str,
+    class_name: str,
+    file_id: str,
+    quality: str = DEFAULT_QUALITY,
+    on_animation: Optional[Callable[[dict], None]] = None,
+    dry_run: bool = False
+) -> Optional[str]:
+    """
+    Render a scene inside the calling process, which is expected to have
+    manim imported already (see render_workers). Returns the path manim's
+    file writer produced, or None for a dry run, which only runs construct.
+
+    Partial movies and compiled Tex are shared across renders through
+    scene_cache, so re-rendering an edited scene only redoes the play()
+    calls that changed.
+    """
+    from manim import tempconfig
+
+    partial_dir = os.path.join(get_media_dir(file_id), "partial_movie_files")
+    store = scene_cache.partial_store(quality, class_name)
+    options = {
+        **render_settings(quality),
+        "media_dir": get_media_dir(file_id),
+        "output_file": file_id,
+        "progress_bar": "none",
+        "verbosity": "WARNING",
+        "dry_run": dry_run,
+        "partial_movie_dir": partial_dir,
+        "tex_dir": scene_cache.TEX_DIR,
+        # the private partial dir is discarded after the job; the shared store has its own eviction
+        "max_files_cached": -1,
+    }
+    if not dry_run:
+        scene_cache.link_cached_partials(store, partial_dir)
+
+    with tempconfig(options):
+        scene = load_scene_class(script_path, class_name)()
+
+        if on_animation:
+            play = scene.play
+            counter = {"index": 0}
 
-    result = subprocess.run(command, capture_output=True, text=True)
+            def reporting_play(*animations, **kwargs):
+                index = counter["index"]
+                description = ", ".join(str(animation) for animation in animations)[:200]
+                on_animation({"animation": index, "description": description, "percent": 0})
+                play(*animations, **kwargs)
+                on_animation({"animation": index, "description": description, "percent": 100})
+                counter["index"] += 1
 
-    if result.returncode != 0:
-        raise Exception(f"Manim rendering failed:\n{result.stderr}")
+            scene.play = reporting_play
 
-    return output_path
+        scene.render()
 
+        if dry_run:
+            return None
+        scene_cache.publish_partials(partial_dir, store)
+        scene_cache.maybe_evict()
+        return str(scene.renderer.file_writer.movie_file_path)
 
+def cleanup_render_artifacts(script_path: str, file_id: str):
+    """Remove the per-job script and media dir (linked partial movies, texts, final mp4)."""
+    if script_path and os.path.isfile(script_path):
+        os.remove(script_path)
+    shutil.rmtree(get_media_dir(file_id), ignore_errors=True)
@@ -0,0 +1,86 @@
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# seconds; spans range from millisecond cache lookups to multi-minute 4k renders
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # per label set: bucket counts, sum, count
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            series = self.series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _labels(self.labels + ("le",), key + (repr(float(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+def gauge(name: str, help: str, samples: Iterable[Tuple[dict, float]]) -> List[str]:
+    """Render a gauge computed at scrape time from (labels, value) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return lines
+
+def counter(name: str, help: str, samples: Iterable[Tuple[dict, float]]) -> List[str]:
+    """Render a counter kept elsewhere (a monotonic total since startup) from (labels, value) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} counter"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.keys(), labels.values())} {value}")
+    return lines
+
+stage_duration = Histogram(
+    "llmanim_stage_duration_seconds", "Duration of each generation stage (span).", ("stage", "outcome")
+)
+http_request_duration = Histogram(
+    "llmanim_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+jobs_finished = Counter("llmanim_jobs_finished_total", "Generation jobs that reached a final state.", ("status",))
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import mimetypes
+import os
+import shutil
+import uuid
+from typing import Optional
+
+from app.services.render_workers import RENDER_NICE
+
+POSTPROCESS_ENABLED = os.getenv("POSTPROCESS_ENABLED", "true").lower() == "true"
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+POSTPROCESS_TIMEOUT = float(os.getenv("POSTPROCESS_TIMEOUT", "120"))
+POSTPROCESS_CONCURRENCY = int(os.getenv("POSTPROCESS_CONCURRENCY", "2"))
+POSTPROCESS_THREADS = int(os.getenv("POSTPROCESS_THREADS", "2"))
+# where the poster frame is taken, as a fraction of the duration; manim scenes often open and close on a blank frame
+POSTER_POSITION = float(os.getenv("POSTER_POSITION", "0.5"))
+PREVIEW_FORMAT = os.getenv("PREVIEW_FORMAT", "webp")
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", "320"))
+PREVIEW_FPS = int(os.getenv("PREVIEW_FPS", "10"))
+PREVIEW_SECONDS = float(os.getenv("PREVIEW_SECONDS", "3"))
+# scenes at least this long also get an HLS ladder; 0 turns HLS off
+HLS_MIN_DURATION = float(os.getenv("HLS_MIN_DURATION", "20"))
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+HLS_LADDER = [int(height) for height in os.getenv("HLS_LADDER", "1080,720,480").split(",") if height]
+
+MEDIA_FILE = "media.json"
+HLS_DIR = "hls"
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".webp": "image/webp"
+}
+
+_slots: Optional[asyncio.Semaphore] = None
+
+class PostProcessError(Exception):
+    pass
+
+async def run_ffmpeg(binary: str, *args: str) -> bytes:
+    """Run ffmpeg or ffprobe at the render workers' niceness; returns stdout, raises PostProcessError on failure or timeout."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            binary, *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=lambda: os.nice(RENDER_NICE)
+        )
+    except OSError as e:
+        raise PostProcessError(f"Could not run {binary}: {e}")
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), POSTPROCESS_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise PostProcessError(f"{binary} timed out after {POSTPROCESS_TIMEOUT:g}s")
+    finally:
+        if process.returncode is None:
+            process.kill()
+    if process.returncode:
+        raise PostProcessError(f"{binary} exited with {process.returncode}: {stderr.decode(errors='replace')[-500:]}")
+    return stdout
+
+async def probe(path: str) -> dict:
+    output = await run_ffmpeg(
+        FFPROBE_BINARY, "-v", "error", "-show_entries", "format=duration:stream=codec_type,width,height",
+        "-of", "json", path
+    )
+    info = json.loads(output)
+    streams = info.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    return {
+        "duration": float(info.get("format", {}).get("duration", 0)) or None,
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "audio": any(stream.get("codec_type") == "audio" for stream in streams)
+    }
+
+async def faststart(path: str):
+    """Remux in place with the moov atom up front, so players can start before the whole file has arrived."""
+    temp_path = f"{os.path.splitext(path)[0]}.{uuid.uuid4().hex}.mp4"
+    try:
+        await run_ffmpeg(
+            FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", path,
+            "-map", "0", "-c", "copy", "-movflags", "+faststart", temp_path
+        )
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+async def extract_poster(path: str, output: str, duration: float):
+    await run_ffmpeg(
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", f"{duration * POSTER_POSITION:.3f}", "-i", path, "-frames:v", "1", "-q:v", "3", output
+    )
+
+async def make_preview(path: str, output: str, duration: float):
+    """A short, small, silent loop of the whole scene, sped up to fit in PREVIEW_SECONDS."""
+    speed = min(1.0, PREVIEW_SECONDS / duration)
+    frames = f"setpts={speed:.4f}*PTS,fps={PREVIEW_FPS},scale={PREVIEW_WIDTH}:-2:flags=lanczos"
+    if PREVIEW_FORMAT == "gif":
+        encode = ["-filter_complex", f"[0:v]{frames},split[a][b];[a]palettegen[p];[b][p]paletteuse"]
+    else:
+        encode = ["-vf", frames, "-c:v", "libwebp", "-quality", "50", "-compression_level", "4"]
+    await run_ffmpeg(
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", path,
+        *encode, "-an", "-loop", "0", "-t", f"{PREVIEW_SECONDS:g}", "-threads", str(POSTPROCESS_THREADS), output
+    )
+
+async def segment_hls(path: str, output_dir: str, height: int, audio: bool) -> list[str]:
+    """
+    Encode an fMP4 HLS ladder: the source height plus every HLS_LADDER rung
+    below it, with keyframes on segment boundaries so players can switch
+    renditions between segments. Returns the files written.
+    """
+    heights = sorted({height, *(rung for rung in HLS_LADDER if rung < height)}, reverse=True)
+    count = len(heights)
+    scale = ";".join(f"[s{i}]scale=-2:{rung}[v{i}]" for i, rung in enumerate(heights))
+    args = ["-filter_complex", f"[0:v]split={count}{''.join(f'[s{i}]' for i in range(count))};{scale}"]
+    for i in range(count):
+        args += ["-map", f"[v{i}]"] + (["-map", "0:a"] if audio else [])
+    streams = " ".join(f"v:{i},a:{i}" if audio else f"v:{i}" for i in range(count))
+
+    os.makedirs(output_dir, exist_ok=True)
+    await run_ffmpeg(
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", path, *args,
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p",
+        "-sc_threshold", "0", "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        *(["-c:a", "aac", "-b:a", "128k"] if audio else ["-an"]),
+        "-threads", str(POSTPROCESS_THREADS),
+        "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init_%v.mp4",
+        "-hls_segment_filename", os.path.join(output_dir, "stream_%v_%03d.m4s"),
+        "-master_pl_name", "master.m3u8", "-var_stream_map", streams,
+        os.path.join(output_dir, "stream_%v.m3u8")
+    )
+    return sorted(os.listdir(output_dir))
+
+async def postprocess(video_path: str, output_dir: str, reuse: bool = False) -> dict:
+    """
+    Make a freshly rendered mp4 ready to stream: faststart it in place, then
+    write a poster, an animated preview and, for long scenes, an HLS ladder
+    into output_dir. Returns what was produced (also kept in output_dir as
+    media.json, which reuse=True returns as is). Every step is optional: a
+    step that fails is left out, and without ffmpeg the result is empty and
+    the raw mp4 is served as before.
+    """
+    global _slots
+
+    if reuse:
+        try:
+            with open(os.path.join(output_dir, MEDIA_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    if not POSTPROCESS_ENABLED:
+        return {}
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(POSTPROCESS_CONCURRENCY)
+    async with _slots:
+        media = {"faststart": False}
+        try:
+            await faststart(video_path)
+            media["faststart"] = True
+        except PostProcessError as e:
+            pass
+
+        try:
+            media.update(await probe(video_path))
+        except (PostProcessError, ValueError) as e:
+            return media
+
+        # build next to output_dir and swap it in whole, so readers never see a half-written one
+        build_dir = f"{output_dir}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(build_dir)
+        try:
+            duration = media["duration"] or 0
+            if duration:
+                try:
+                    await extract_poster(video_path, os.path.join(build_dir, "poster.jpg"), duration)
+                    media["poster"] = "poster.jpg"
+                except PostProcessError as e:
+                    pass
+                try:
+                    name = f"preview.{PREVIEW_FORMAT}"
+                    await make_preview(video_path, os.path.join(build_dir, name), duration)
+                    media["preview"] = name
+                except PostProcessError as e:
+                    pass
+            if HLS_MIN_DURATION and duration >= HLS_MIN_DURATION and media["height"]:
+                try:
+                    files = await segment_hls(video_path, os.path.join(build_dir, HLS_DIR), media["height"], media["audio"])
+                    media["hls"] = f"{HLS_DIR}/master.m3u8"
+                    media["hls_files"] = [f"{HLS_DIR}/{name}" for name in files]
+                except PostProcessError as e:
+                    shutil.rmtree(os.path.join(build_dir, HLS_DIR), ignore_errors=True)
+
+            with open(os.path.join(build_dir, MEDIA_FILE), "w") as f:
+                json.dump(media, f)
+            await asyncio.to_thread(shutil.rmtree, output_dir, True)
+            os.makedirs(os.path.dirname(output_dir), exist_ok=True)
+            os.replace(build_dir, output_dir)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, build_dir, True)
+        return media
+
+def media_assets(media: dict) -> list[str]:
+    """Files under the output dir that have to be published alongside the mp4, relative to it."""
+    names = [media[name] for name in ("poster", "preview") if media.get(name)]
+    return names + media.get("hls_files", [])
+
+def content_type(name: str) -> str:
+    extension = os.path.splitext(name)[1]
+    return CONTENT_TYPES.get(extension) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+def media_fields(media: dict, urls: dict) -> dict:
+    """
+    AnimationModel fields for a post-processed video, given the published
+    url of each asset. An HLS ladder is only offered when every one of its
+    files made it.
+    """
+    hls_complete = media.get("hls") and all(urls.get(name) for name in media.get("hls_files", []))
+    return {
+        "duration": media.get("duration"),
+        "width": media.get("width"),
+        "height": media.get("height"),
+        "faststart": media.get("faststart", False),
+        "poster_url": urls.get(media.get("poster")),
+        "preview_url": urls.get(media.get("preview")),
+        "hls_url": urls.get(media["hls"]) if hls_complete else None
+    }
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Optional
+
+from app.lib.database import get_database, is_database_connected
+from app.services import gemini
+from app.services.chat_service import get_optional_chat_service, start_chat_service
+from app.services.llm_cache import llm_cache
+from app.services.render_cache import render_cache
+from app.services.render_farm import ensure_farm_indexes
+from app.services.render_workers import RENDER_BACKEND, get_render_pool
+from app.services.storage import storage
+
+# each dependency gets this long to answer a readiness check
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "2"))
+# load balancers poll /ready every few seconds; one result serves them all for this long
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "2"))
+DATABASE_RETRY_MAX_DELAY = float(os.getenv("DATABASE_RETRY_MAX_DELAY", "30"))
+
+# seconds from the first line of main.py to the end of imports, of the startup hook, and to the first ready answer
+boot = {"import_seconds": None, "startup_seconds": None, "ready_seconds": None}
+
+database_prepared = False
+_boot_started: Optional[float] = None
+_tasks: set[asyncio.Task] = set()
+_last_report: Optional[tuple[float, dict]] = None
+
+def mark_boot(phase: str, started: float):
+    global _boot_started
+
+    _boot_started = started
+    boot[f"{phase}_seconds"] = time.perf_counter() - started
+
+async def prepare_database():
+    """
+    Create indexes once MongoDB answers, retrying with backoff. Startup does
+    not wait for it, so a missing database delays readiness instead of the
+    process coming up. Chat history is only switched on after the first
+    ping, so until then chat routes answer 503 at once and jobs run
+    without it instead of each waiting out the server selection timeout.
+    """
+    global database_prepared
+
+    delay = 1.0
+    while not database_prepared:
+        try:
+            await get_database().command("ping")
+            if not get_optional_chat_service():
+                start_chat_service()
+            await render_cache.ensure_indexes()
+            await llm_cache.ensure_indexes()
+            chat_service = get_optional_chat_service()
+            if chat_service:
+                await chat_service.ensure_indexes()
+            if RENDER_BACKEND == "farm":
+                await ensure_farm_indexes()
+            database_prepared = True
+        except Exception as e:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DATABASE_RETRY_MAX_DELAY)
+
+async def warm_up_llm():
+    try:
+        await gemini.warm_up()
+    except Exception as e:
+        # the first generation raises the same error where it can be reported
+        pass
+
+def start_preparation():
+    """Run what startup no longer waits for: index creation and the Gemini client import."""
+    for preparation in (prepare_database(), warm_up_llm()):
+        task = asyncio.create_task(preparation)
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+def stop_preparation():
+    for task in _tasks:
+        task.cancel()
+
+async def check_database(timeout: float) -> Optional[str]:
+    if not is_database_connected():
+        return "not connected"
+    await get_database().command("ping")
+    if not database_prepared:
+        return "indexes are still being created"
+    return None
+
+async def check_renderers(timeout: float) -> Optional[str]:
+    return await get_render_pool().check(timeout)
+
+async def run_check(check: Awaitable, timeout: float) -> str:
+    try:
+        problem = await asyncio.wait_for(check, timeout)
+    except asyncio.TimeoutError:
+        return f"no answer within {timeout:g}s"
+    except Exception as e:
+        return str(e) or repr(e)
+    return problem or "ok"
+
+async def readiness() -> dict:
+    """
+    Whether this process can serve a generation right now: MongoDB answers
+    and has its indexes, a render worker (or render host) is up, and the
+    storage backend accepts uploads. A ready answer is reused for
+    READY_CACHE_SECONDS; a process that is not ready yet is checked afresh
+    every time, so it starts taking traffic as soon as it can.
+    """
+    global _last_report
+
+    if _last_report and time.monotonic() - _last_report[0] < READY_CACHE_SECONDS:
+        return _last_report[1]
+
+    names = ["database", "render_workers", "storage"]
+    results = await asyncio.gather(*(
+        run_check(check(READY_CHECK_TIMEOUT), READY_CHECK_TIMEOUT)
+        for check in (check_database, check_renderers, storage.check)
+    ))
+    checks = dict(zip(names, results))
+    ready = all(result == "ok" for result in results)
+    if ready and boot["ready_seconds"] is None and _boot_started is not None:
+        mark_boot("ready", _boot_started)
+
+    report = {"ready": ready, "checks": checks, "boot": dict(boot)}
+    _last_report = (time.monotonic(), report) if ready else None
+    return report
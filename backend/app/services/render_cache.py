@@ -0,0 +1,192 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.lib.database import get_database, is_database_connected
+from app.models.chat_models import AnimationModel, RenderCacheEntry
+
+RENDER_CACHE_TTL = int(os.getenv("RENDER_CACHE_TTL", str(7 * 24 * 3600)))
+RENDER_CACHE_MEMORY_ENTRIES = int(os.getenv("RENDER_CACHE_MEMORY_ENTRIES", "512"))
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "videos/cache")
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+def normalize_code(code: str) -> str:
+    """
+    Canonical form of a scene script. Parsing through ast drops comments and
+    formatting differences; code that does not parse falls back to a
+    whitespace-normalized copy.
+    """
+    try:
+        return ast.dump(ast.parse(code), annotate_fields=False)
+    except SyntaxError:
+        lines = [line.rstrip() for line in code.replace("\r\n", "\n").split("\n")]
+        return "\n".join(line for line in lines if line)
+
+def render_cache_key(code: str, class_name: str, render_settings: dict) -> str:
+    digest = hashlib.sha256()
+    for part in (normalize_code(code), class_name, json.dumps(render_settings, sort_keys=True)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class RenderCache:
+    """
+    Three tiers: an in-process LRU of uploaded results, the render_cache
+    collection in Mongo (shared across workers, expired with a TTL index),
+    and a size-capped directory of rendered mp4s (with their post-processed
+    media) so a result whose upload is lost can still skip the render.
+    """
+
+    def __init__(self):
+        self.memory: "OrderedDict[str, tuple[AnimationModel, float]]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.file_hits = 0
+        self.misses = 0
+        # files a placeholder url still serves while their upload runs; eviction skips them
+        self.pinned: dict[str, int] = {}
+
+    @property
+    def collection(self):
+        return get_database().render_cache
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("last_used_at", expireAfterSeconds=RENDER_CACHE_TTL)
+
+    async def get(self, key: str) -> Optional[AnimationModel]:
+        cached = self.memory.get(key)
+        if cached:
+            animation, stored_at = cached
+            if time.time() - stored_at < RENDER_CACHE_TTL:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return animation
+            del self.memory[key]
+
+        if is_database_connected():
+            cutoff = datetime.utcnow() - timedelta(seconds=RENDER_CACHE_TTL)
+            try:
+                entry = await self.collection.find_one_and_update(
+                    {"_id": key, "last_used_at": {"$gte": cutoff}},
+                    {"$set": {"last_used_at": datetime.utcnow()}, "$inc": {"hits": 1}},
+                    projection={"animation": 1}
+                )
+            except Exception as e:
+                # the cache is an optimisation; a database hiccup is just a miss
+                entry = None
+            if entry:
+                animation = AnimationModel(**entry["animation"])
+                self._remember(key, animation)
+                self.db_hits += 1
+                return animation
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, class_name: str, render_settings: dict, animation: AnimationModel):
+        self._remember(key, animation)
+        if not is_database_connected():
+            return
+
+        now = datetime.utcnow()
+        entry = RenderCacheEntry(
+            cache_key=key,
+            class_name=class_name,
+            render_settings=render_settings,
+            animation=animation,
+            created_at=now,
+            last_used_at=now
+        )
+        try:
+            await self.collection.replace_one({"_id": key}, {"_id": key, **entry.model_dump()}, upsert=True)
+        except Exception as e:
+            pass
+
+    def get_file(self, key: str) -> Optional[str]:
+        path = os.path.join(RENDER_CACHE_DIR, f"{key}.mp4")
+        if not os.path.isfile(path):
+            return None
+        os.utime(path)
+        self.file_hits += 1
+        return path
+
+    def media_dir(self, key: str) -> str:
+        """Where post-processing keeps the poster, preview and HLS ladder of a cached mp4; evicted with it."""
+        return os.path.join(RENDER_CACHE_DIR, "media", key)
+
+    def pin(self, key: str):
+        self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        self.pinned[key] -= 1
+        if not self.pinned[key]:
+            del self.pinned[key]
+
+    def store_file(self, key: str, video_path: str) -> str:
+        """Move a finished render into the file tier and evict oldest files over the size cap."""
+        os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+        path = os.path.join(RENDER_CACHE_DIR, f"{key}.mp4")
+        shutil.move(video_path, path)
+        self._evict_files(keep=path)
+        return path
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        hits = self.memory_hits + self.db_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "file_hits": self.file_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory)
+        }
+
+    def _remember(self, key: str, animation: AnimationModel):
+        self.memory[key] = (animation, time.time())
+        self.memory.move_to_end(key)
+        while len(self.memory) > RENDER_CACHE_MEMORY_ENTRIES:
+            self.memory.popitem(last=False)
+
+    def _evict_files(self, keep: Optional[str] = None):
+        files = []
+        for entry in os.scandir(RENDER_CACHE_DIR):
+            if entry.is_file() and entry.path != keep:
+                key = entry.name.rsplit(".", 1)[0]
+                if key in self.pinned:
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size + self._tree_size(self.media_dir(key)), entry.path, key))
+
+        total = sum(size for _, size, _, _ in files)
+        if keep and os.path.isfile(keep):
+            key = os.path.basename(keep).rsplit(".", 1)[0]
+            total += os.path.getsize(keep) + self._tree_size(self.media_dir(key))
+        for _, size, path, key in sorted(files):
+            if total <= RENDER_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(self.media_dir(key), ignore_errors=True)
+
+    @staticmethod
+    def _tree_size(root: str) -> int:
+        total = 0
+        for directory, _, names in os.walk(root):
+            for name in names:
+                try:
+                    total += os.path.getsize(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+        return total
+
+render_cache = RenderCache()
@@ -0,0 +1,506 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from bson import Binary
+from pymongo import ReturnDocument
+
+from app.lib.database import get_database
+from app.models.job_models import RenderJobModel, RenderJobStatus
+from app.services.manim import get_media_dir, save_code_to_file, cleanup_render_artifacts
+from app.services.postprocess import postprocess, media_assets, MEDIA_FILE
+from app.services.render_workers import (
+    RenderWorkerPool, RenderFailed, RenderLimitExceeded, RenderWorkerCrashed
+)
+from app.services.scheduler import QUALITY_LANES
+
+RENDER_FARM_LEASE_SECONDS = float(os.getenv("RENDER_FARM_LEASE_SECONDS", "30"))
+RENDER_FARM_HEARTBEAT_SECONDS = float(os.getenv("RENDER_FARM_HEARTBEAT_SECONDS", "10"))
+RENDER_FARM_MAX_ATTEMPTS = int(os.getenv("RENDER_FARM_MAX_ATTEMPTS", "3"))
+RENDER_FARM_RETRY_DELAY = float(os.getenv("RENDER_FARM_RETRY_DELAY", "5"))
+RENDER_FARM_POLL_INTERVAL = float(os.getenv("RENDER_FARM_POLL_INTERVAL", "0.5"))
+# how long an API node waits for a render, queueing included
+RENDER_FARM_WAIT_TIMEOUT = float(os.getenv("RENDER_FARM_WAIT_TIMEOUT", "900"))
+RENDER_FARM_RETENTION = int(os.getenv("RENDER_FARM_RETENTION", str(24 * 3600)))
+# rendered files travel back through Mongo in chunks below the 16 MB document limit
+RENDER_FARM_CHUNK_BYTES = int(os.getenv("RENDER_FARM_CHUNK_BYTES", str(8 * 1024 * 1024)))
+RENDER_FARM_DRAIN_SECONDS = float(os.getenv("RENDER_FARM_DRAIN_SECONDS", "60"))
+
+# the name the mp4 goes by among a job's output files; post-processed media keeps its own relative names
+VIDEO_OUTPUT = "video.mp4"
+FINISHED = [RenderJobStatus.DONE, RenderJobStatus.FAILED, RenderJobStatus.CANCELLED, RenderJobStatus.DEAD]
+STATS_REFRESH_SECONDS = 5
+
+def render_jobs():
+    return get_database().render_jobs
+
+def render_outputs():
+    return get_database().render_outputs
+
+def render_hosts():
+    return get_database().render_hosts
+
+async def ensure_farm_indexes():
+    await render_jobs().create_index([("status", 1), ("lane", 1), ("created_at", 1)])
+    await render_jobs().create_index([("status", 1), ("lease_expires_at", 1)])
+    await render_jobs().create_index("expire_at", expireAfterSeconds=0)
+    await render_outputs().create_index([("job_id", 1), ("owner", 1), ("file", 1), ("n", 1)])
+    # outputs are deleted once fetched; this catches those whose API node went away
+    await render_outputs().create_index("created_at", expireAfterSeconds=RENDER_FARM_RETENTION)
+    await render_hosts().create_index("seen_at", expireAfterSeconds=int(3 * RENDER_FARM_LEASE_SECONDS))
+
+class RenderFarm:
+    """
+    Render backend for API nodes with RENDER_BACKEND=farm, standing in for
+    the local RenderWorkerPool. Each render becomes a document in
+    render_jobs that render workers on other hosts (render_worker.py)
+    claim under a lease; this side polls it for progress and the outcome
+    and fetches the rendered mp4 from render_outputs.
+    """
+
+    # render_with_media has the render host post-process too, so API nodes never run ffmpeg
+    postprocesses_remotely = True
+
+    def __init__(self):
+        self.submitted = 0
+        self._stats = {"size": 0, "alive": 0, "idle": 0, "recycled": 0, "crashed": 0, "limited": 0, "waiting": 0}
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # indexes are created by readiness.prepare_database once MongoDB answers
+        self._refresher = asyncio.create_task(self._refresh_stats())
+
+    async def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def render(
+        self,
+        script_path: str,
+        class_name: str,
+        file_id: str,
+        quality: str,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        client: str = "anonymous"
+    ) -> str:
+        job = await self._run("render", script_path, class_name, quality, client, on_progress)
+        path = os.path.join(get_media_dir(file_id), f"{file_id}.mp4")
+        await self._fetch_output(job, path)
+        return path
+
+    async def render_with_media(
+        self,
+        script_path: str,
+        class_name: str,
+        file_id: str,
+        quality: str,
+        media_dir: str,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        client: str = "anonymous"
+    ) -> tuple[str, dict]:
+        """
+        Render and post-process on a render host. The media files come back
+        into media_dir, media.json included, as postprocess would have left
+        them; returns the mp4's path and the media.
+        """
+        job = await self._run("render", script_path, class_name, quality, client, on_progress, postprocess=True)
+        path = os.path.join(get_media_dir(file_id), f"{file_id}.mp4")
+        await self._fetch_output(job, path, media_dir)
+        return path, job.get("media") or {}
+
+    async def dry_run(self, script_path: str, class_name: str, file_id: str, client: str = "anonymous") -> Optional[str]:
+        try:
+            await self._run("dry_run", script_path, class_name, "draft", client)
+        except RenderFailed as e:
+            return str(e)
+        return None
+
+    async def check(self, timeout: float) -> Optional[str]:
+        """Renders can only be served while some render host is reporting in."""
+        recent = datetime.utcnow() - timedelta(seconds=3 * RENDER_FARM_HEARTBEAT_SECONDS)
+        if await render_hosts().count_documents({"seen_at": {"$gte": recent}}):
+            return None
+        return "no render host has reported in recently"
+
+    def stats(self) -> dict:
+        return {**self._stats, "backend": "farm", "submitted": self.submitted}
+
+    async def _run(
+        self, command: str, script_path: str, class_name: str, quality: str, client: str,
+        on_progress: Optional[Callable[[dict], None]] = None, postprocess: bool = False
+    ) -> dict:
+        with open(script_path) as f:
+            code = f.read()
+        job = RenderJobModel(
+            command=command, code=code, class_name=class_name, quality=quality, client=client,
+            # dry runs gate a render, so they go first
+            lane=-1 if command == "dry_run" else QUALITY_LANES.get(quality, 0),
+            max_attempts=RENDER_FARM_MAX_ATTEMPTS, postprocess=postprocess
+        )
+        await render_jobs().insert_one(job.model_dump(by_alias=True))
+        self.submitted += 1
+
+        try:
+            return await asyncio.wait_for(self._wait(job.id, on_progress), timeout=RENDER_FARM_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            await self._cancel(job.id)
+            raise RenderLimitExceeded(
+                "render_timeout", f"No render worker finished the job within {RENDER_FARM_WAIT_TIMEOUT:g}s",
+                RENDER_FARM_WAIT_TIMEOUT
+            )
+        except asyncio.CancelledError:
+            # the worker holding it sees this on its next heartbeat and kills the render
+            await self._cancel(job.id)
+            raise
+
+    async def _wait(self, job_id: str, on_progress: Optional[Callable[[dict], None]]) -> dict:
+        progress = None
+        while True:
+            await asyncio.sleep(RENDER_FARM_POLL_INTERVAL)
+            job = await render_jobs().find_one({"_id": job_id}, projection={"code": 0})
+            if not job:
+                raise RenderWorkerCrashed("The render job disappeared from the queue")
+            if on_progress and job.get("progress") and job["progress"] != progress:
+                progress = job["progress"]
+                on_progress(progress)
+
+            status = job["status"]
+            if status == RenderJobStatus.DONE:
+                return job
+            if status == RenderJobStatus.FAILED:
+                if job.get("error_reason"):
+                    raise RenderLimitExceeded(job["error_reason"], job["error"], job.get("error_limit"))
+                raise RenderFailed(job["error"])
+            if status == RenderJobStatus.DEAD:
+                raise RenderWorkerCrashed(f"Render failed on {job['attempts']} workers: {job.get('error')}")
+            if status == RenderJobStatus.CANCELLED:
+                raise RenderWorkerCrashed("The render job was cancelled")
+
+    async def _cancel(self, job_id: str):
+        now = datetime.utcnow()
+        try:
+            await render_jobs().update_one(
+                {"_id": job_id, "status": {"$in": [RenderJobStatus.QUEUED, RenderJobStatus.RUNNING]}},
+                {"$set": {
+                    "status": RenderJobStatus.CANCELLED, "finished_at": now,
+                    "expire_at": now + timedelta(seconds=RENDER_FARM_RETENTION)
+                }}
+            )
+            await render_outputs().delete_many({"job_id": job_id})
+        except Exception as e:
+            pass
+
+    async def _fetch_output(self, job: dict, path: str, media_dir: Optional[str] = None):
+        """
+        Read the chunks of the attempt that completed the job; a host that
+        lost its lease may have left others. The mp4 goes to path and any
+        media files to media_dir, swapped in whole.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        build_dir = f"{media_dir}.{uuid.uuid4().hex}.tmp" if media_dir else None
+        chunks = 0
+        current, f = None, None
+        try:
+            query = {"job_id": job["_id"], "owner": job.get("output_owner")}
+            async for chunk in render_outputs().find(query).sort([("file", 1), ("n", 1)]):
+                if chunk["file"] != current:
+                    if f:
+                        f.close()
+                    current = chunk["file"]
+                    target = path if current == VIDEO_OUTPUT else os.path.join(build_dir, current)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    f = open(target, "wb")
+                await asyncio.to_thread(f.write, chunk["data"])
+                chunks += 1
+            if f:
+                f.close()
+            if not chunks or chunks != job.get("output_chunks"):
+                raise RenderWorkerCrashed("The render worker's output is missing")
+
+            if media_dir:
+                os.makedirs(build_dir, exist_ok=True)
+                with open(os.path.join(build_dir, MEDIA_FILE), "w") as media_file:
+                    json.dump(job.get("media") or {}, media_file)
+                await asyncio.to_thread(shutil.rmtree, media_dir, True)
+                os.makedirs(os.path.dirname(media_dir), exist_ok=True)
+                os.replace(build_dir, media_dir)
+        finally:
+            if f:
+                f.close()
+            if build_dir:
+                await asyncio.to_thread(shutil.rmtree, build_dir, True)
+        await render_outputs().delete_many({"job_id": job["_id"]})
+
+    async def _refresh_stats(self):
+        """Aggregate what the render hosts report, for /api/workers and /metrics."""
+        while True:
+            try:
+                hosts = await render_hosts().find().to_list(length=None)
+                waiting = await render_jobs().count_documents({"status": RenderJobStatus.QUEUED})
+                self._stats = {
+                    name: sum(host["stats"].get(name, 0) for host in hosts)
+                    for name in ("size", "alive", "idle", "recycled", "crashed", "limited")
+                }
+                self._stats.update(hosts=len(hosts), waiting=waiting)
+            except Exception as e:
+                pass
+            await asyncio.sleep(STATS_REFRESH_SECONDS)
+
+class RenderFarmWorker:
+    """
+    The render host side: claims jobs from render_jobs, oldest first within
+    the highest priority lane, as long as its local pool has capacity, and
+    renders them on it. Claims are leases kept alive by heartbeats; a job
+    whose lease lapses (its host crashed or stalled) is requeued by any
+    worker, up to max_attempts, after which it is dead-lettered. Every
+    write about a job is fenced on this worker still holding the lease.
+    """
+
+    def __init__(self, pool: RenderWorkerPool, worker_id: Optional[str] = None):
+        self.pool = pool
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.running: dict[str, asyncio.Task] = {}
+        self._background: set[asyncio.Task] = set()
+        self._last_reap = 0.0
+
+    async def run(self, stopping: asyncio.Event):
+        """Claim and render until stopping is set, then drain what is in flight."""
+        housekeeping = asyncio.create_task(self._housekeeping())
+        try:
+            while not stopping.is_set():
+                job = None
+                if len(self.running) < self.pool.size:
+                    try:
+                        job = await self._claim()
+                    except Exception as e:
+                        pass
+                if job:
+                    task = asyncio.create_task(self._execute(job))
+                    self.running[job["_id"]] = task
+                    task.add_done_callback(lambda _, job_id=job["_id"]: self.running.pop(job_id, None))
+                    continue
+                try:
+                    await asyncio.wait_for(stopping.wait(), timeout=RENDER_FARM_POLL_INTERVAL * 2)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            housekeeping.cancel()
+
+        await self._drain()
+
+    async def _housekeeping(self):
+        """Report this host and reap lapsed leases on a timer, busy or not."""
+        while True:
+            await self._reap_expired()
+            await self._report()
+            await asyncio.sleep(RENDER_FARM_HEARTBEAT_SECONDS)
+
+    async def _drain(self):
+        """Give in-flight renders RENDER_FARM_DRAIN_SECONDS, then hand the rest back without spending an attempt."""
+        if self.running:
+            await asyncio.wait(list(self.running.values()), timeout=RENDER_FARM_DRAIN_SECONDS)
+        for job_id, task in list(self.running.items()):
+            task.cancel()
+            await self._update(job_id, {
+                "$set": {"status": RenderJobStatus.QUEUED, "lease_owner": None, "available_at": datetime.utcnow()},
+                "$inc": {"attempts": -1}
+            })
+        await asyncio.gather(*self.running.values(), *self._background, return_exceptions=True)
+        try:
+            await render_hosts().delete_one({"_id": self.worker_id})
+        except Exception as e:
+            pass
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await render_jobs().find_one_and_update(
+            {"status": RenderJobStatus.QUEUED, "available_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": RenderJobStatus.RUNNING, "lease_owner": self.worker_id, "started_at": now,
+                    "lease_expires_at": now + timedelta(seconds=RENDER_FARM_LEASE_SECONDS)
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("lane", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _reap_expired(self):
+        """Requeue jobs whose worker stopped heartbeating, or dead-letter them once out of attempts."""
+        if time.monotonic() - self._last_reap < RENDER_FARM_LEASE_SECONDS / 2:
+            return
+        self._last_reap = time.monotonic()
+        now = datetime.utcnow()
+        expired = {"status": RenderJobStatus.RUNNING, "lease_expires_at": {"$lt": now}}
+        try:
+            await render_jobs().update_many(
+                {**expired, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+                {"$set": {"status": RenderJobStatus.DEAD, "finished_at": now, "error": "Render worker lost the job (lease expired)"}}
+            )
+            await render_jobs().update_many(expired, {"$set": {
+                "status": RenderJobStatus.QUEUED, "lease_owner": None, "available_at": now,
+                "error": "Render worker lost the job (lease expired)"
+            }})
+        except Exception as e:
+            pass
+
+    async def _report(self):
+        try:
+            await render_hosts().replace_one(
+                {"_id": self.worker_id},
+                {"_id": self.worker_id, "stats": {**self.pool.stats(), "running": len(self.running)}, "seen_at": datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            pass
+
+    async def _execute(self, job: dict):
+        job_id = job["_id"]
+        script_path, file_id = await asyncio.to_thread(save_code_to_file, job["code"])
+        render = asyncio.create_task(self._render(job, script_path, file_id))
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, render))
+        try:
+            output = await render
+            if output:
+                await self._deliver(job, *output)
+            else:
+                await self._complete(job_id, {"status": RenderJobStatus.DONE})
+        except RenderLimitExceeded as e:
+            details = e.details[0]
+            await self._complete(job_id, {
+                "status": RenderJobStatus.FAILED, "error": str(e),
+                "error_reason": details["type"], "error_limit": details["limit"]
+            })
+        except RenderFailed as e:
+            # the scene's own error; another worker would hit it too
+            await self._complete(job_id, {"status": RenderJobStatus.FAILED, "error": str(e)})
+        except asyncio.CancelledError:
+            if not heartbeat.done() or not render.cancelled():
+                raise
+            # the heartbeat found the lease gone or the job cancelled; nothing to report
+        except Exception as e:
+            await self._retry(job, str(e))
+        finally:
+            heartbeat.cancel()
+            await asyncio.to_thread(cleanup_render_artifacts, script_path, file_id)
+
+    async def _render(self, job: dict, script_path: str, file_id: str) -> Optional[tuple[dict, dict]]:
+        """The output files by name, the mp4 as VIDEO_OUTPUT, and the post-processed media; None for a dry run."""
+        if job["command"] == "dry_run":
+            failure = await self.pool.dry_run(script_path, job["class_name"], file_id, client=job["client"])
+            if failure:
+                raise RenderFailed(failure)
+            return None
+        path = await self.pool.render(
+            script_path, job["class_name"], file_id, job["quality"],
+            on_progress=lambda progress: self._in_background(self._update(job["_id"], {"$set": {"progress": progress}})),
+            client=job["client"]
+        )
+        if not job.get("postprocess"):
+            return {VIDEO_OUTPUT: path}, {}
+        # inside the render's media dir, so cleanup_render_artifacts removes it too
+        media_dir = os.path.join(get_media_dir(file_id), "postprocessed")
+        media = await postprocess(path, media_dir)
+        return {VIDEO_OUTPUT: path, **{name: os.path.join(media_dir, name) for name in media_assets(media)}}, media
+
+    async def _heartbeat(self, job_id: str, render: asyncio.Task):
+        """Extend the lease while rendering; stop the render if the lease was lost or the job cancelled."""
+        while True:
+            await asyncio.sleep(RENDER_FARM_HEARTBEAT_SECONDS)
+            now = datetime.utcnow()
+            try:
+                held = await self._update(job_id, {"$set": {
+                    "lease_expires_at": now + timedelta(seconds=RENDER_FARM_LEASE_SECONDS)
+                }})
+            except Exception as e:
+                # Mongo unreachable: keep rendering, the lease may still be ours
+                continue
+            if not held:
+                render.cancel()
+                return
+
+    async def _deliver(self, job: dict, files: dict, media: dict):
+        """
+        Store the output under this attempt's own key and complete the job
+        naming it, so a host that lost the lease can neither overwrite nor
+        delete the chunks of the attempt that won. If completing fails, only
+        this attempt's chunks are removed.
+        """
+        owner = f"{self.worker_id}#{job['attempts']}"
+        completed = False
+        try:
+            chunks = 0
+            for name, path in files.items():
+                chunks += await self._store_output(job["_id"], owner, name, path)
+            fields = {"status": RenderJobStatus.DONE, "output_owner": owner, "output_chunks": chunks}
+            if job.get("postprocess"):
+                fields["media"] = media
+            completed = await self._complete(job["_id"], fields)
+        finally:
+            if not completed:
+                try:
+                    await render_outputs().delete_many({"job_id": job["_id"], "owner": owner})
+                except Exception as e:
+                    # the retention TTL removes them
+                    pass
+
+    async def _store_output(self, job_id: str, owner: str, name: str, path: str) -> int:
+        chunks = 0
+        with open(path, "rb") as f:
+            while True:
+                data = await asyncio.to_thread(f.read, RENDER_FARM_CHUNK_BYTES)
+                if not data:
+                    break
+                chunk_id = f"{job_id}:{owner}:{name}:{chunks}"
+                await render_outputs().replace_one(
+                    {"_id": chunk_id},
+                    {
+                        "_id": chunk_id, "job_id": job_id, "owner": owner, "file": name, "n": chunks,
+                        "data": Binary(data), "created_at": datetime.utcnow()
+                    },
+                    upsert=True
+                )
+                chunks += 1
+        return chunks
+
+    async def _complete(self, job_id: str, fields: dict) -> bool:
+        now = datetime.utcnow()
+        return await self._update(job_id, {"$set": {
+            **fields, "finished_at": now, "lease_owner": None,
+            "expire_at": now + timedelta(seconds=RENDER_FARM_RETENTION)
+        }})
+
+    async def _retry(self, job: dict, error: str):
+        """Requeue after a crash with exponential backoff, or dead-letter once out of attempts."""
+        now = datetime.utcnow()
+        if job["attempts"] >= job["max_attempts"]:
+            await self._update(job["_id"], {"$set": {
+                "status": RenderJobStatus.DEAD, "finished_at": now, "lease_owner": None, "error": error
+            }})
+            return
+        delay = RENDER_FARM_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+        await self._update(job["_id"], {"$set": {
+            "status": RenderJobStatus.QUEUED, "lease_owner": None, "error": error,
+            "available_at": now + timedelta(seconds=delay)
+        }})
+
+    async def _update(self, job_id: str, update: dict) -> bool:
+        """Apply an update only while this worker holds the job's lease."""
+        result = await render_jobs().update_one(
+            {"_id": job_id, "status": RenderJobStatus.RUNNING, "lease_owner": self.worker_id}, update
+        )
+        return result.matched_count == 1
+
+    def _in_background(self, update) -> asyncio.Task:
+        task = asyncio.ensure_future(update)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
@@ -0,0 +1,408 @@
+import asyncio
+import multiprocessing
+import os
+import resource
+import signal
+import traceback
+from typing import Callable, Optional
+
+from app.services.scheduler import FairScheduler, QUALITY_LANES, QUALITY_COSTS, half_of
+
+RENDER_WORKERS_PER_CORE = float(os.getenv("RENDER_WORKERS_PER_CORE", "0.5"))
+RENDER_MAX_WORKERS = int(os.getenv("RENDER_MAX_WORKERS", "0"))
+RENDER_WORKER_MAX_JOBS = int(os.getenv("RENDER_WORKER_MAX_JOBS", "50"))
+RENDER_WORKER_MAX_RSS_MB = int(os.getenv("RENDER_WORKER_MAX_RSS_MB", "1536"))
+# per-render governor; keep RENDER_TIMEOUT below the gunicorn worker timeout (300s)
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "240"))
+RENDER_CPU_LIMIT = int(os.getenv("RENDER_CPU_LIMIT", "180"))
+RENDER_MEMORY_LIMIT_MB = int(os.getenv("RENDER_MEMORY_LIMIT_MB", "4096"))
+RENDER_NICE = int(os.getenv("RENDER_NICE", "10"))
+# wait before replacing a worker that died while starting, e.g. because manim fails to import
+RENDER_WORKER_RESTART_DELAY = float(os.getenv("RENDER_WORKER_RESTART_DELAY", "5"))
+# renders one client may run at once; 0 means half the workers
+RENDER_MAX_PER_CLIENT = int(os.getenv("RENDER_MAX_PER_CLIENT", "0"))
+# "local" renders in this process's worker pool; "farm" queues renders in MongoDB for render_worker.py hosts
+RENDER_BACKEND = os.getenv("RENDER_BACKEND", "local")
+# a cgroup v2 directory delegated to this service; each worker gets a child group with memory.max
+RENDER_CGROUP_DIR = os.getenv("RENDER_CGROUP_DIR", "")
+
+class RenderWorkerCrashed(Exception):
+    pass
+
+class RenderFailed(Exception):
+    pass
+
+class RenderLimitExceeded(Exception):
+    """A render was stopped by the governor; details carries the structured reason."""
+
+    def __init__(self, reason: str, message: str, limit: Optional[float] = None):
+        super().__init__(message)
+        self.details = [{"type": reason, "message": message, "limit": limit}]
+
+class CPULimitExceeded(BaseException):
+    # BaseException, so a scene's own "except Exception" cannot swallow it
+    pass
+
+def default_worker_count() -> int:
+    """Number of render processes, derived from the core count unless pinned."""
+    if RENDER_MAX_WORKERS > 0:
+        return RENDER_MAX_WORKERS
+    return max(1, int((os.cpu_count() or 1) * RENDER_WORKERS_PER_CORE))
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def cgroup_path(pid: int) -> str:
+    return os.path.join(RENDER_CGROUP_DIR, f"render-{pid}")
+
+def join_cgroup():
+    """Move this worker into its own cgroup capped at RENDER_MEMORY_LIMIT_MB, if one is configured."""
+    path = cgroup_path(os.getpid())
+    try:
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "memory.max"), "w") as f:
+            f.write(str(RENDER_MEMORY_LIMIT_MB * 1024 * 1024))
+        with open(os.path.join(path, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+    except OSError as e:
+        # not delegated or not cgroup v2; the rlimit still applies
+        pass
+
+def apply_resource_limits():
+    """
+    Run once when a worker starts. It leads its own process group so a kill
+    takes latex, dvisvgm and anything else a scene spawned with it, runs at
+    a lower priority than the API, and has its address space capped.
+    """
+    os.setpgrp()
+    if RENDER_NICE:
+        os.nice(RENDER_NICE)
+    if RENDER_MEMORY_LIMIT_MB:
+        limit = RENDER_MEMORY_LIMIT_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if RENDER_CGROUP_DIR:
+            join_cgroup()
+    signal.signal(signal.SIGXCPU, _cpu_limit_reached)
+
+def _cpu_limit_reached(signum, frame):
+    disarm_cpu_limit()
+    raise CPULimitExceeded(f"Render used more than {RENDER_CPU_LIMIT}s of CPU time")
+
+def arm_cpu_limit():
+    """RLIMIT_CPU counts the worker's lifetime, so the soft limit is set relative to what it has used so far."""
+    if not RENDER_CPU_LIMIT:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + RENDER_CPU_LIMIT
+    resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+def disarm_cpu_limit():
+    if RENDER_CPU_LIMIT:
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+def worker_main(conn):
+    """
+    Entry point of a render worker process. manim (and with it numpy, cairo
+    and pango) is imported once here, then scenes are rendered in-process
+    for every ("render"|"dry_run", job) message read from the pipe.
+    """
+    apply_resource_limits()
+    import manim  # noqa: F401  warm the heavy imports before the first job
+    from app.services.manim import render_scene
+    from app.services.scene_cache import install_tex_lock
+
+    install_tex_lock()
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            command, job = conn.recv()
+        except EOFError:
+            return
+        if command == "stop":
+            return
+
+        try:
+            arm_cpu_limit()
+            path = render_scene(
+                job["script_path"], job["class_name"], job["file_id"], job.get("quality", "draft"),
+                on_animation=lambda progress: conn.send(("progress", progress)),
+                dry_run=command == "dry_run"
+            )
+            disarm_cpu_limit()
+            conn.send(("done", {"path": path, "rss_mb": current_rss_mb()}))
+        except CPULimitExceeded as e:
+            conn.send(("error", {"error": str(e), "reason": "render_cpu_limit", "limit": RENDER_CPU_LIMIT, "rss_mb": current_rss_mb()}))
+        except MemoryError:
+            disarm_cpu_limit()
+            message = f"Render ran out of its {RENDER_MEMORY_LIMIT_MB} MB memory limit"
+            conn.send(("error", {"error": message, "reason": "render_memory_limit", "limit": RENDER_MEMORY_LIMIT_MB, "rss_mb": current_rss_mb()}))
+        except Exception as e:
+            disarm_cpu_limit()
+            conn.send(("error", {"error": f"{e}\n{traceback.format_exc()}", "rss_mb": current_rss_mb()}))
+
+class RenderWorker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        # drop our copy of the child end so a dead worker shows up as EOF
+        child_conn.close()
+        self.jobs_done = 0
+        self.rss_mb = 0.0
+        # set once manim is imported and the worker has reported in
+        self.ready = False
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def should_recycle(self) -> bool:
+        return self.jobs_done >= RENDER_WORKER_MAX_JOBS or self.rss_mb >= RENDER_WORKER_MAX_RSS_MB
+
+    def stop(self, timeout: float = 5):
+        try:
+            self.conn.send(("stop", None))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        # the whole process group, so scene subprocesses do not outlive the worker
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+        if RENDER_CGROUP_DIR:
+            try:
+                os.rmdir(cgroup_path(self.process.pid))
+            except OSError:
+                pass
+
+    def oom_killed(self) -> bool:
+        """Whether the kernel killed something in this worker's cgroup for exceeding memory.max."""
+        if not RENDER_CGROUP_DIR:
+            return False
+        try:
+            with open(os.path.join(cgroup_path(self.process.pid), "memory.events")) as f:
+                events = dict(line.split() for line in f)
+        except OSError:
+            return False
+        return int(events.get("oom_kill", 0)) > 0
+
+class RenderWorkerPool:
+    """
+    Pool of long-lived render processes with manim pre-imported. Each job
+    holds one worker exclusively; workers are recycled after
+    RENDER_WORKER_MAX_JOBS jobs or once their RSS passes the limit, and a
+    worker that dies mid-job is replaced without affecting the others.
+    Workers start in the background and take jobs once manim is imported.
+    A render that runs past RENDER_TIMEOUT, or is cancelled, gets its
+    worker's process group killed. Workers are handed out by a
+    FairScheduler: drafts before higher qualities, clients in turn.
+    """
+
+    # renders come back raw and the caller post-processes them
+    postprocesses_remotely = False
+
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or default_worker_count()
+        self.scheduler = FairScheduler(self.size, max_per_client=RENDER_MAX_PER_CLIENT or half_of(self.size))
+        self.context = multiprocessing.get_context("spawn")
+        self.idle: asyncio.Queue = asyncio.Queue()
+        self.workers: list[RenderWorker] = []
+        self.recycled = 0
+        self.crashed = 0
+        self.limited = 0
+        self.startup_error: Optional[str] = None
+        self._starting: set[asyncio.Task] = set()
+
+    async def start(self):
+        for _ in range(self.size):
+            self._add_worker()
+
+    async def stop(self):
+        for task in self._starting:
+            task.cancel()
+        workers, self.workers = self.workers, []
+        self.idle = asyncio.Queue()
+        await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in workers))
+
+    async def render(
+        self,
+        script_path: str,
+        class_name: str,
+        file_id: str,
+        quality: str,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        client: str = "anonymous"
+    ) -> str:
+        job = {"script_path": script_path, "class_name": class_name, "file_id": file_id, "quality": quality}
+        async with self.scheduler.slot(client, QUALITY_LANES.get(quality, 0), QUALITY_COSTS.get(quality, 1.0)):
+            return await self._run("render", job, on_progress)
+
+    async def dry_run(self, script_path: str, class_name: str, file_id: str, client: str = "anonymous") -> Optional[str]:
+        """Run construct without rendering; returns the error text, or None if it ran cleanly."""
+        job = {"script_path": script_path, "class_name": class_name, "file_id": file_id}
+        try:
+            # cheap, and it gates a render, so it goes in the first lane
+            async with self.scheduler.slot(client, 0, 0.1):
+                await self._run("dry_run", job)
+        except RenderFailed as e:
+            return str(e)
+        return None
+
+    async def check(self, timeout: float) -> Optional[str]:
+        """Why no render can start soon, or None once a worker is up; for the readiness probe."""
+        if any(worker.ready and worker.is_alive() for worker in self.workers):
+            return None
+        return self.startup_error or "render workers are still starting"
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "alive": sum(1 for worker in self.workers if worker.is_alive()),
+            "starting": len(self._starting),
+            "idle": self.idle.qsize(),
+            "waiting": len(self.scheduler.waiting),
+            "recycled": self.recycled,
+            "crashed": self.crashed,
+            "limited": self.limited
+        }
+
+    async def _run(self, command: str, job: dict, on_progress: Optional[Callable[[dict], None]] = None):
+        worker = await self.idle.get()
+        finished = False
+        try:
+            worker.conn.send((command, job))
+            try:
+                kind, data = await asyncio.wait_for(self._collect(worker, on_progress), timeout=RENDER_TIMEOUT or None)
+            except asyncio.TimeoutError:
+                self.limited += 1
+                raise RenderLimitExceeded(
+                    "render_timeout", f"Render took longer than {RENDER_TIMEOUT:g}s and was stopped", RENDER_TIMEOUT
+                )
+            worker.rss_mb = data["rss_mb"]
+            if data.get("reason"):
+                # interrupted mid-render, so the worker is replaced rather than reused
+                self.limited += 1
+                raise RenderLimitExceeded(data["reason"], data["error"], data.get("limit"))
+            finished = True
+            worker.jobs_done += 1
+            if kind == "error":
+                raise RenderFailed(data["error"])
+            return data["path"]
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            self.crashed += 1
+            if worker.oom_killed():
+                self.limited += 1
+                raise RenderLimitExceeded(
+                    "render_memory_limit", f"Render exceeded its {RENDER_MEMORY_LIMIT_MB} MB memory limit",
+                    RENDER_MEMORY_LIMIT_MB
+                )
+            raise RenderWorkerCrashed(f"Render worker {worker.pid} exited during the job")
+        finally:
+            self._release(worker, healthy=finished)
+
+    async def _collect(self, worker: RenderWorker, on_progress: Optional[Callable[[dict], None]]) -> tuple[str, dict]:
+        """Relay progress messages until the worker reports the outcome."""
+        while True:
+            kind, data = await self._recv(worker)
+            if kind != "progress":
+                return kind, data
+            if on_progress:
+                on_progress(data)
+
+    async def _recv(self, worker: RenderWorker):
+        """Wait for the next message without parking a thread on the pipe."""
+        loop = asyncio.get_running_loop()
+        fd = worker.conn.fileno()
+        while not worker.conn.poll():
+            readable = loop.create_future()
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await readable
+            finally:
+                loop.remove_reader(fd)
+        return worker.conn.recv()
+
+    def _release(self, worker: RenderWorker, healthy: bool):
+        # a worker that did not finish its job (crash or cancellation) may be
+        # mid-render, so it is killed rather than reused
+        if healthy and worker.is_alive() and not worker.should_recycle():
+            self.idle.put_nowait(worker)
+            return
+
+        if healthy:
+            self.recycled += 1
+        retire = worker.stop if healthy else worker.kill
+        asyncio.get_running_loop().run_in_executor(None, retire)
+        if worker in self.workers:
+            self.workers.remove(worker)
+            self._add_worker()
+
+    def _add_worker(self):
+        worker = RenderWorker(self.context)
+        self.workers.append(worker)
+        task = asyncio.get_running_loop().create_task(self._warm_up(worker))
+        self._starting.add(task)
+        task.add_done_callback(self._starting.discard)
+
+    async def _warm_up(self, worker: RenderWorker):
+        """Hand the worker out once it reports ready; replace it, after a pause, if it dies first."""
+        try:
+            await self._recv(worker)
+        except (EOFError, OSError):
+            self.crashed += 1
+            await asyncio.to_thread(worker.kill)
+            self.startup_error = f"Render worker {worker.pid} exited while starting (exit code {worker.process.exitcode})"
+            if worker in self.workers:
+                self.workers.remove(worker)
+                await asyncio.sleep(RENDER_WORKER_RESTART_DELAY)
+                self._add_worker()
+            return
+        worker.ready = True
+        self.startup_error = None
+        self.idle.put_nowait(worker)
+
+def build_render_pool(name: str = RENDER_BACKEND) -> RenderWorkerPool:
+    # render_farm imports this module, so it is imported on use
+    from app.services.render_farm import RenderFarm
+
+    available = {"local": RenderWorkerPool, "farm": RenderFarm}
+    if name not in available:
+        raise ValueError(f"Unknown RENDER_BACKEND '{name}', expected one of {', '.join(available)}")
+    return available[name]()
+
+render_pool: Optional[RenderWorkerPool] = None
+
+async def start_render_pool() -> RenderWorkerPool:
+    global render_pool
+
+    render_pool = build_render_pool()
+    await render_pool.start()
+    return render_pool
+
+async def stop_render_pool():
+    global render_pool
+
+    if render_pool:
+        await render_pool.stop()
+    render_pool = None
+
+def get_render_pool() -> RenderWorkerPool:
+    if not render_pool:
+        raise Exception("Render pool not started. Call start_render_pool() first.")
+    return render_pool
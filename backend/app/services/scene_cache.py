@@ -0,0 +1,145 @@
+import fcntl
+import hashlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+SCENE_CACHE_DIR = os.getenv("SCENE_CACHE_DIR", "videos/scene_cache")
+SCENE_CACHE_MAX_BYTES = int(os.getenv("SCENE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+SCENE_CACHE_EVICT_INTERVAL = float(os.getenv("SCENE_CACHE_EVICT_INTERVAL", "60"))
+
+PARTIALS_DIR = os.path.join(SCENE_CACHE_DIR, "partial_movie_files")
+TEX_DIR = os.path.join(SCENE_CACHE_DIR, "Tex")
+LOCK_DIR = os.path.join(SCENE_CACHE_DIR, "locks")
+
+_last_eviction = 0.0
+
+@contextmanager
+def file_lock(name: str, blocking: bool = True) -> Iterator[bool]:
+    """
+    An flock shared by every render worker on this host. Yields whether the
+    lock was acquired, which is always true when blocking.
+    """
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    with open(os.path.join(LOCK_DIR, f"{name}.lock"), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def partial_store(quality: str, class_name: str) -> str:
+    """
+    Shared partial movies for one scene name and quality. Manim names each
+    partial by a hash of the play() call, its mobjects and the camera
+    config, so equal names mean equal content.
+    """
+    return os.path.join(PARTIALS_DIR, quality, class_name)
+
+def link_cached_partials(store: str, partial_dir: str):
+    """
+    Hard-link the stored partials into a render's private partial movie
+    dir, where manim finds them and skips those animations. Only complete
+    files are ever published to the store, and eviction can unlink a store
+    entry without affecting the link a running render holds.
+    """
+    os.makedirs(partial_dir, exist_ok=True)
+    try:
+        entries = list(os.scandir(store))
+    except FileNotFoundError:
+        return
+    now = time.time()
+    for entry in entries:
+        try:
+            os.link(entry.path, os.path.join(partial_dir, entry.name))
+            os.utime(entry.path, (now, now))
+        except (FileExistsError, FileNotFoundError):
+            pass
+
+def publish_partials(partial_dir: str, store: str):
+    """After a successful render, add its new partial movies to the store; link() never exposes a half-written file."""
+    os.makedirs(store, exist_ok=True)
+    try:
+        entries = list(os.scandir(partial_dir))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if not entry.is_file() or entry.name.startswith("partial_movie_file_list"):
+            continue
+        try:
+            os.link(entry.path, os.path.join(store, entry.name))
+        except FileExistsError:
+            pass
+
+def install_tex_lock():
+    """
+    Serialize compiles of the same LaTeX expression across workers sharing
+    TEX_DIR. Manim returns an existing svg without compiling, so without
+    the lock a second worker could read one that latex/dvisvgm are still
+    writing. Different expressions compile in parallel.
+    """
+    try:
+        from manim.utils import tex_file_writing
+    except ImportError:
+        return
+
+    original = tex_file_writing.tex_to_svg_file
+
+    def locked_tex_to_svg_file(expression, *args, **kwargs):
+        stripe = hashlib.sha256(str(expression).encode("utf-8")).hexdigest()[:2]
+        with file_lock(f"tex-{stripe}"):
+            path = original(expression, *args, **kwargs)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    # modules import the function by name, so patch every reference to it
+    for module in list(sys.modules.values()):
+        if getattr(module, "tex_to_svg_file", None) is original:
+            module.tex_to_svg_file = locked_tex_to_svg_file
+
+def maybe_evict():
+    """Evict least recently used files once the cache passes SCENE_CACHE_MAX_BYTES, at most every SCENE_CACHE_EVICT_INTERVAL seconds per worker."""
+    global _last_eviction
+
+    if time.monotonic() - _last_eviction < SCENE_CACHE_EVICT_INTERVAL:
+        return
+    _last_eviction = time.monotonic()
+    # one worker sweeps at a time; the others skip rather than wait
+    with file_lock("evict", blocking=False) as acquired:
+        if acquired:
+            evict(SCENE_CACHE_MAX_BYTES)
+
+def evict(max_bytes: int) -> int:
+    """Delete the oldest cached partials and Tex files until the total fits; returns the bytes freed."""
+    files = []
+    for root in (PARTIALS_DIR, TEX_DIR):
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    freed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            freed += size
+        except FileNotFoundError:
+            pass
+    return freed
@@ -0,0 +1,205 @@
+import asyncio
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+# a waiter older than this is served as if it were in the first lane, so busy lanes cannot starve the rest
+SCHEDULER_LANE_AGING = float(os.getenv("SCHEDULER_LANE_AGING", "60"))
+# per-client share, e.g. "10.0.0.5=2,10.0.0.6=0.5"; clients not listed weigh 1
+SCHEDULER_WEIGHTS = os.getenv("SCHEDULER_WEIGHTS", "")
+SCHEDULER_INITIAL_SERVICE_TIME = float(os.getenv("SCHEDULER_INITIAL_SERVICE_TIME", "30"))
+
+# lower lanes go first: drafts are scheduled ahead of high-quality renders
+QUALITY_LANES = {"draft": 0, "medium": 1, "high": 2, "4k": 3}
+# rough render cost relative to a draft; what a client is charged in fair queuing
+QUALITY_COSTS = {"draft": 1.0, "medium": 3.0, "high": 8.0, "4k": 24.0}
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        client, _, weight = item.strip().rpartition("=")
+        if client:
+            weights[client] = float(weight)
+    return weights
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing when the scheduler is too far behind; retry_after is in seconds."""
+
+    def __init__(self, message: str, reason: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Ticket:
+    def __init__(self, client: str, lane: int, cost: float, tag: float, sequence: int):
+        self.client = client
+        self.lane = lane
+        self.cost = cost
+        self.tag = tag
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class FairScheduler:
+    """
+    Hands out a fixed number of slots. Waiting tickets are served by lane
+    first, then by start-time fair queuing across clients: each ticket is
+    tagged with its client's virtual finish time, so a client with many
+    tickets queued takes turns with the others instead of going first, and
+    every client gets slot time in proportion to its weight whatever its
+    cost per ticket. A client already holding max_per_client slots is
+    passed over until one of them is released.
+
+    enqueue also does admission control: it rejects a ticket when the
+    queue is at max_waiting, when the estimated wait passes max_wait
+    seconds, or when the client already has max_per_client_queued tickets.
+    """
+
+    def __init__(
+        self, slots: int, max_per_client: int = 0, max_waiting: int = 0,
+        max_wait: float = 0, max_per_client_queued: int = 0, weights: Optional[Dict[str, float]] = None
+    ):
+        self.slots = slots
+        self.max_per_client = max_per_client
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.max_per_client_queued = max_per_client_queued
+        self.weights = parse_weights(SCHEDULER_WEIGHTS) if weights is None else weights
+        self.waiting: List[Ticket] = []
+        self.held: Dict[str, int] = {}
+        self.queued: Dict[str, int] = {}
+        self.finish_tags: Dict[str, float] = {}
+        self.virtual_time = 0.0
+        # moving average of how long a slot is held, for wait estimates
+        self.service_time = SCHEDULER_INITIAL_SERVICE_TIME
+        self.rejected = 0
+        self._sequence = itertools.count()
+
+    @property
+    def in_use(self) -> int:
+        return sum(self.held.values())
+
+    def estimated_wait(self, ahead: Optional[int] = None) -> float:
+        """Seconds until a ticket behind `ahead` others (default: all waiting) would get a slot."""
+        ahead = len(self.waiting) if ahead is None else ahead
+        if self.in_use + ahead < self.slots:
+            return 0.0
+        return (ahead // self.slots + 1) * self.service_time
+
+    def enqueue(self, client: str, lane: int = 0, cost: float = 1.0) -> Ticket:
+        if self.max_waiting and len(self.waiting) >= self.max_waiting:
+            self._reject("The render queue is full, try again later.", "queue_full", self.estimated_wait())
+        if self.max_wait and self.estimated_wait() > self.max_wait:
+            self._reject("The render queue is too long right now, try again later.", "queue_wait", self.estimated_wait())
+        queued = self.queued.get(client, 0) + self.held.get(client, 0)
+        if self.max_per_client_queued and queued >= self.max_per_client_queued:
+            self._reject(
+                f"Too many animations in progress for this client (limit {self.max_per_client_queued}).",
+                "client_limit", self.service_time
+            )
+
+        start = max(self.virtual_time, self.finish_tags.get(client, 0.0))
+        self.finish_tags[client] = start + cost / self.weights.get(client, 1.0)
+        ticket = Ticket(client, lane, cost, start, next(self._sequence))
+        self.waiting.append(ticket)
+        self.queued[client] = self.queued.get(client, 0) + 1
+        self._dispatch()
+        return ticket
+
+    async def wait(self, ticket: Ticket):
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self.release(ticket)
+            else:
+                self.cancel(ticket)
+            raise
+
+    def release(self, ticket: Ticket):
+        if ticket.granted_at is None:
+            return
+        held = time.monotonic() - ticket.granted_at
+        self.service_time += 0.2 * (held - self.service_time)
+        ticket.granted_at = None
+        self._decrement(self.held, ticket.client)
+        self._dispatch()
+
+    def cancel(self, ticket: Ticket):
+        """Withdraw a ticket that has not been granted; one that has is released."""
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            self._decrement(self.queued, ticket.client)
+            if not ticket.granted.done():
+                ticket.granted.cancel()
+            self._dispatch()
+        else:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def slot(self, client: str, lane: int = 0, cost: float = 1.0) -> AsyncIterator[Ticket]:
+        ticket = self.enqueue(client, lane, cost)
+        await self.wait(ticket)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def position(self, ticket: Ticket) -> Optional[int]:
+        """1-based place in the current serving order, or None once granted."""
+        if ticket not in self.waiting:
+            return None
+        return self._ordered().index(ticket) + 1
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.slots,
+            "in_use": self.in_use,
+            "waiting": len(self.waiting),
+            "clients": len(set(self.held) | set(self.queued)),
+            "service_time": self.service_time,
+            "estimated_wait": self.estimated_wait(),
+            "rejected": self.rejected
+        }
+
+    def _ordered(self) -> List[Ticket]:
+        now = time.monotonic()
+        return sorted(self.waiting, key=lambda ticket: (
+            0 if now - ticket.enqueued_at > SCHEDULER_LANE_AGING else ticket.lane, ticket.tag, ticket.sequence
+        ))
+
+    def _dispatch(self):
+        while self.waiting and self.in_use < self.slots:
+            ticket = next((
+                ticket for ticket in self._ordered()
+                if not self.max_per_client or self.held.get(ticket.client, 0) < self.max_per_client
+            ), None)
+            if not ticket:
+                return
+            self.waiting.remove(ticket)
+            # held first, so moving a client's only ticket does not count as it going idle
+            self.held[ticket.client] = self.held.get(ticket.client, 0) + 1
+            self._decrement(self.queued, ticket.client)
+            self.virtual_time = max(self.virtual_time, ticket.tag)
+            ticket.granted_at = time.monotonic()
+            ticket.granted.set_result(None)
+
+    def _reject(self, message: str, reason: str, retry_after: float):
+        self.rejected += 1
+        raise AdmissionRejected(message, reason, max(1, math.ceil(retry_after)))
+
+    def _decrement(self, counts: Dict[str, int], client: str):
+        counts[client] -= 1
+        if not counts[client]:
+            del counts[client]
+        # a client with nothing queued or running starts again from virtual_time
+        if client not in self.held and client not in self.queued:
+            self.finish_tags.pop(client, None)
+
+def half_of(slots: int) -> int:
+    """Default per-client cap: half the slots, so one client always leaves room for others."""
+    return max(1, math.ceil(slots / 2))
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+class Flight:
+    def __init__(self, task: asyncio.Task, owner: Any):
+        self.task = task
+        self.owner = owner
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    At most one call in flight per key; callers arriving while it runs wait
+    for the same result (or exception) instead of starting their own. The
+    call runs in its own task, so one caller being cancelled does not cancel
+    it for the rest; it is only cancelled once every caller has gone.
+    """
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def owner(self, key: str) -> Any:
+        """Whatever the caller that started the in-flight call for key passed as owner, or None."""
+        flight = self.flights.get(key)
+        return flight.owner if flight else None
+
+    async def do(self, key: str, fn: Callable[[], Awaitable], owner: Any = None) -> tuple[Any, bool]:
+        """Run fn unless a call for key is already in flight; returns its result and whether this caller joined one."""
+        flight = self.flights.get(key)
+        joined = flight is not None
+        if joined:
+            self.joined += 1
+        else:
+            self.started += 1
+            flight = Flight(asyncio.create_task(fn()), owner)
+            self.flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), joined
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    def _land(self, key: str, flight: Flight):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self.flights), "started": self.started, "joined": self.joined}
@@ -0,0 +1,369 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import re
+import shutil
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Optional
+from urllib.parse import quote
+
+import httpx
+
+from app.lib.cloudinary import get_cloudinary
+from app.lib.settings import settings
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+# overridable so uploads can go to a stand-in such as the benchmark's fake CDN
+CLOUDINARY_API_URL = os.getenv("CLOUDINARY_API_URL", "https://api.cloudinary.com").rstrip("/")
+CLOUDINARY_CHUNK_SIZE = int(os.getenv("CLOUDINARY_CHUNK_SIZE", str(20 * 1024 * 1024)))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", "3"))
+UPLOAD_TIMEOUT = float(os.getenv("UPLOAD_TIMEOUT", "120"))
+UPLOAD_IN_BACKGROUND = os.getenv("UPLOAD_IN_BACKGROUND", "true").lower() == "true"
+# a background upload that fails outright is started over this many times, backing off from the delay
+UPLOAD_BACKGROUND_RETRIES = int(os.getenv("UPLOAD_BACKGROUND_RETRIES", "3"))
+UPLOAD_BACKGROUND_RETRY_DELAY = float(os.getenv("UPLOAD_BACKGROUND_RETRY_DELAY", "10"))
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
+VIDEOS_ROOT = "videos"
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(VIDEOS_ROOT, "storage"))
+
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://127.0.0.1:9000").rstrip("/")
+S3_BUCKET = os.getenv("S3_BUCKET", "llmanim")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", f"{S3_ENDPOINT_URL}/{S3_BUCKET}").rstrip("/")
+# S3 rejects multipart parts (other than the last) below 5 MiB
+S3_CHUNK_SIZE = max(int(os.getenv("S3_CHUNK_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+
+class RetryableUploadError(Exception):
+    pass
+
+def local_video_url(path: str) -> str:
+    """URL of a file under videos/ as served by the /videos route."""
+    relative = os.path.relpath(path, VIDEOS_ROOT).replace(os.sep, "/")
+    return f"{PUBLIC_BASE_URL}/videos/{relative}"
+
+async def read_chunks(path: str, chunk_size: int) -> AsyncIterator[tuple[int, bytes]]:
+    """Yield (offset, chunk) pairs, reading off the event loop."""
+    with open(path, "rb") as f:
+        offset = 0
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk and offset:
+                return
+            yield offset, chunk
+            offset += len(chunk)
+            if len(chunk) < chunk_size:
+                return
+
+class StorageBackend:
+    """
+    Where finished videos are kept. save_video returns a dict with the
+    public url, the backend's id for the asset, and the backend name;
+    save_asset stores a file that goes with a video (poster, preview, HLS
+    segment) under key as given and returns its public url. Assets saved
+    under a common prefix can refer to each other by relative url.
+    """
+
+    name = "base"
+    # remote backends are slow enough to be worth uploading in the background
+    remote = True
+
+    def __init__(self):
+        self._background: set[asyncio.Task] = set()
+
+    async def save_video(self, path: str, key: str) -> dict:
+        raise NotImplementedError
+
+    async def save_asset(self, path: str, key: str, content_type: str) -> str:
+        raise NotImplementedError
+
+    async def check(self, timeout: float) -> Optional[str]:
+        """Why this backend cannot take uploads right now, or None if it can; for the readiness probe."""
+        return None
+
+    async def close(self):
+        pass
+
+    def run_in_background(self, upload: Awaitable) -> asyncio.Task:
+        """Keep a reference to a follow-up task so it survives until shutdown drains it."""
+        task = asyncio.ensure_future(upload)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def drain(self):
+        await asyncio.gather(*self._background, return_exceptions=True)
+
+    def _asset(self, url: str, public_id: str) -> dict:
+        return {"url": url, "public_id": public_id, "backend": self.name}
+
+class LocalStorage(StorageBackend):
+    """
+    Keeps videos on local disk under LOCAL_STORAGE_DIR, served by the
+    /videos route. Files are hard-linked out of the render cache when it
+    sits on the same filesystem, so saving costs no copy and survives
+    cache eviction.
+    """
+
+    name = "local"
+    remote = False
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR):
+        super().__init__()
+        self.root = root
+
+    async def save_video(self, path: str, key: str) -> dict:
+        destination = os.path.join(self.root, f"{key}.mp4")
+        await asyncio.to_thread(self._link_or_copy, path, destination)
+        return self._asset(local_video_url(destination), key)
+
+    async def save_asset(self, path: str, key: str, content_type: str) -> str:
+        destination = os.path.join(self.root, key)
+        await asyncio.to_thread(self._link_or_copy, path, destination)
+        return local_video_url(destination)
+
+    async def check(self, timeout: float) -> Optional[str]:
+        try:
+            os.makedirs(self.root, exist_ok=True)
+        except OSError as e:
+            return f"cannot create {self.root}: {e}"
+        if not os.access(self.root, os.W_OK):
+            return f"{self.root} is not writable"
+        return None
+
+    def _link_or_copy(self, source: str, destination: str):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
+
+class HTTPStorage(StorageBackend):
+    """Base for backends behind an HTTP API: one pooled client, bounded concurrency, per-request retries."""
+
+    def __init__(self):
+        super().__init__()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots = asyncio.Semaphore(UPLOAD_MAX_CONCURRENCY)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(UPLOAD_TIMEOUT, connect=10),
+                limits=httpx.Limits(
+                    max_connections=UPLOAD_MAX_CONCURRENCY * 2,
+                    max_keepalive_connections=UPLOAD_MAX_CONCURRENCY
+                )
+            )
+        return self._client
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        for attempt in range(UPLOAD_MAX_RETRIES + 1):
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise RetryableUploadError(f"{self.name} returned {response.status_code}")
+                response.raise_for_status()
+                return response
+            except (httpx.TransportError, RetryableUploadError):
+                if attempt == UPLOAD_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(random.uniform(0, 0.5 * (2 ** attempt)))
+
+class CloudinaryStorage(HTTPStorage):
+    """
+    Async uploader for Cloudinary's REST API. Files are streamed in chunks
+    (Cloudinary's chunked upload protocol) and every chunk is retried on its own.
+    """
+
+    name = "cloudinary"
+
+    async def save_video(self, path: str, key: str) -> dict:
+        result = await self._upload(path, "video", key, "video/mp4")
+        return self._asset(result["secure_url"], result["public_id"])
+
+    async def save_asset(self, path: str, key: str, content_type: str) -> str:
+        if content_type.startswith("image/"):
+            # Cloudinary adds the extension of image assets itself
+            result = await self._upload(path, "image", os.path.splitext(key)[0], content_type)
+            return result["secure_url"]
+        result = await self._upload(path, "raw", key, content_type)
+        # without the version segment, so relative urls inside a playlist reach its segments
+        return re.sub(r"/upload/v\d+/", "/upload/", result["secure_url"], count=1)
+
+    async def check(self, timeout: float) -> Optional[str]:
+        # a request would count against the API rate limit on every probe, so only the credentials are checked
+        if not (settings.cloudinary_cloud_name and settings.cloudinary_api_key and settings.cloudinary_api_secret):
+            return "CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY and CLOUDINARY_API_SECRET must be set"
+        return None
+
+    async def _upload(self, path: str, resource_type: str, public_id: str, content_type: str) -> dict:
+        sdk = get_cloudinary()
+        config = sdk.config()
+        url = f"{CLOUDINARY_API_URL}/v1_1/{config.cloud_name}/{resource_type}/upload"
+        params = {"public_id": public_id, "timestamp": int(time.time())}
+        params["signature"] = sdk.utils.api_sign_request(params, config.api_secret)
+        params["api_key"] = config.api_key
+
+        async with self._slots:
+            size = os.path.getsize(path)
+            filename = os.path.basename(path)
+            headers = {"X-Unique-Upload-Id": uuid.uuid4().hex}
+            response = None
+
+            async for offset, chunk in read_chunks(path, CLOUDINARY_CHUNK_SIZE):
+                if size > CLOUDINARY_CHUNK_SIZE:
+                    headers["Content-Range"] = f"bytes {offset}-{offset + len(chunk) - 1}/{size}"
+                response = await self._request(
+                    "POST", url, data=params, files={"file": (filename, chunk, content_type)}, headers=headers
+                )
+
+        return response.json()
+
+class S3Storage(HTTPStorage):
+    """
+    S3-compatible object storage (AWS S3, MinIO, R2) addressed path-style.
+    Requests are signed with SigV4; files above S3_CHUNK_SIZE go up as a
+    multipart upload, one retried request per part.
+    """
+
+    name = "s3"
+
+    async def save_video(self, path: str, key: str) -> dict:
+        object_key = f"{key}.mp4"
+        await self._put(path, object_key, "video/mp4")
+        return self._asset(f"{S3_PUBLIC_URL}/{quote(object_key)}", object_key)
+
+    async def save_asset(self, path: str, key: str, content_type: str) -> str:
+        await self._put(path, key, content_type)
+        return f"{S3_PUBLIC_URL}/{quote(key)}"
+
+    async def check(self, timeout: float) -> Optional[str]:
+        """HEAD the bucket once, without the upload retries."""
+        path = f"/{S3_BUCKET}"
+        headers = self._sign("HEAD", path, {}, hashlib.sha256(b"").hexdigest())
+        try:
+            response = await self.client.head(f"{S3_ENDPOINT_URL}{path}", headers=headers, timeout=timeout)
+        except httpx.HTTPError as e:
+            return f"{S3_ENDPOINT_URL} unreachable: {e!r}"
+        if response.status_code >= 400:
+            return f"bucket {S3_BUCKET} returned {response.status_code}"
+        return None
+
+    async def _put(self, path: str, object_key: str, content_type: str):
+        async with self._slots:
+            if os.path.getsize(path) <= S3_CHUNK_SIZE:
+                body = await asyncio.to_thread(self._read_file, path)
+                await self._signed("PUT", object_key, content=body, content_type=content_type)
+            else:
+                await self._multipart_upload(path, object_key, content_type)
+
+    async def _multipart_upload(self, path: str, object_key: str, content_type: str):
+        response = await self._signed("POST", object_key, query={"uploads": ""}, content_type=content_type)
+        upload_id = self._find(response.content, "UploadId")
+        try:
+            parts = []
+            number = 1
+            async for _, chunk in read_chunks(path, S3_CHUNK_SIZE):
+                part = await self._signed(
+                    "PUT", object_key, query={"partNumber": str(number), "uploadId": upload_id}, content=chunk
+                )
+                parts.append(f"<Part><PartNumber>{number}</PartNumber><ETag>{part.headers['ETag']}</ETag></Part>")
+                number += 1
+            manifest = f"<CompleteMultipartUpload>{''.join(parts)}</CompleteMultipartUpload>".encode()
+            await self._signed("POST", object_key, query={"uploadId": upload_id}, content=manifest)
+        except BaseException:
+            try:
+                await self._signed("DELETE", object_key, query={"uploadId": upload_id})
+            except Exception as e:
+                pass
+            raise
+
+    async def _signed(
+        self, method: str, object_key: str, query: Optional[dict] = None,
+        content: bytes = b"", content_type: Optional[str] = None
+    ) -> httpx.Response:
+        query = query or {}
+        path = f"/{S3_BUCKET}/{quote(object_key)}"
+        headers = self._sign(method, path, query, hashlib.sha256(content).hexdigest())
+        if content_type:
+            headers["Content-Type"] = content_type
+        url = f"{S3_ENDPOINT_URL}{path}"
+        if query:
+            url += "?" + self._canonical_query(query)
+        return await self._request(method, url, content=content, headers=headers)
+
+    def _sign(self, method: str, path: str, query: dict, payload_hash: str) -> dict:
+        now = datetime.utcnow()
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{now.strftime('%Y%m%d')}/{S3_REGION}/s3/aws4_request"
+        headers = {
+            "host": httpx.URL(S3_ENDPOINT_URL).netloc.decode(),
+            "x-amz-content-sha256": payload_hash,
+            "x-amz-date": amz_date
+        }
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join([
+            method,
+            path,
+            self._canonical_query(query),
+            "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+            signed_headers,
+            payload_hash
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+
+        signing_key = f"AWS4{S3_SECRET_ACCESS_KEY}".encode()
+        for part in scope.split("/"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        del headers["host"]  # httpx sends the same value itself
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={S3_ACCESS_KEY_ID}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        return headers
+
+    @staticmethod
+    def _canonical_query(query: dict) -> str:
+        return "&".join(
+            f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted(query.items())
+        )
+
+    @staticmethod
+    def _find(document: bytes, tag: str) -> str:
+        for element in ET.fromstring(document).iter():
+            if element.tag.rsplit("}", 1)[-1] == tag:
+                return element.text
+        raise Exception(f"S3 response has no {tag}")
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+def build_storage(name: str = STORAGE_BACKEND) -> StorageBackend:
+    available = {"cloudinary": CloudinaryStorage, "local": LocalStorage, "s3": S3Storage}
+    if name not in available:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{name}', expected one of {', '.join(available)}")
+    return available[name]()
+
+storage = build_storage()
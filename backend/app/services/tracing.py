@@ -0,0 +1,217 @@
+import asyncio
+import contextvars
+import json
+import os
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from app.services.metrics import stage_duration
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces/spans.jsonl")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://127.0.0.1:4318").rstrip("/")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "llmanim-backend")
+
+SPAN_KIND_INTERNAL = 1
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+class Trace:
+    def __init__(self):
+        # 16-byte trace ids and 8-byte span ids, hex encoded, as OpenTelemetry expects
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List["Span"] = []
+        self.exported = False
+
+    def stages(self) -> Dict[str, float]:
+        """Seconds spent per stage name so far, summed over repeated stages (e.g. repair attempts)."""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+class Span:
+    def __init__(
+        self,
+        trace: Optional[Trace],
+        name: str,
+        parent_id: Optional[str] = None,
+        attributes: Optional[dict] = None,
+        start_ns: Optional[int] = None
+    ):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id if self.trace else "",
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)} for key, value in self.attributes.items() if value is not None
+            ],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_UNSET}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 travels as a string in OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_request(spans: List[Span]) -> dict:
+    """An OTLP/JSON ExportTraceServiceRequest body."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": OTEL_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "llmanim"}, "spans": [span.to_otlp() for span in spans]}]
+        }]
+    }
+
+class SpanExporter:
+    """No-op exporter: spans still feed the stage metrics and message metadata."""
+
+    name = "none"
+
+    async def export(self, spans: List[Span]):
+        pass
+
+    async def close(self):
+        pass
+
+class LocalSpanExporter(SpanExporter):
+    """Appends one OTLP/JSON request per line to TRACE_EXPORT_PATH, for offline inspection."""
+
+    name = "local"
+
+    def __init__(self, path: str = TRACE_EXPORT_PATH):
+        self.path = path
+
+    async def export(self, spans: List[Span]):
+        line = json.dumps(otlp_request(spans)) + "\n"
+        await asyncio.to_thread(self._append, line)
+
+    def _append(self, line: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(line)
+
+class OTLPHTTPExporter(SpanExporter):
+    """Posts spans to an OpenTelemetry collector's OTLP/HTTP JSON endpoint."""
+
+    name = "otlp"
+
+    def __init__(self, endpoint: str = OTEL_EXPORTER_OTLP_ENDPOINT):
+        self.url = f"{endpoint}/v1/traces"
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def export(self, spans: List[Span]):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=5)
+        await self._client.post(self.url, json=otlp_request(spans))
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+def build_exporter(name: str = TRACE_EXPORTER) -> SpanExporter:
+    available = {"none": SpanExporter, "local": LocalSpanExporter, "otlp": OTLPHTTPExporter}
+    if name not in available:
+        raise ValueError(f"Unknown TRACE_EXPORTER '{name}', expected one of {', '.join(available)}")
+    return available[name]()
+
+exporter = build_exporter()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def current_trace() -> Optional[Trace]:
+    span = _current_span.get()
+    return span.trace if span else None
+
+async def _export(spans: List[Span]):
+    try:
+        await exporter.export(spans)
+    except Exception as e:
+        # losing a trace must never fail the job it describes
+        pass
+
+async def _finish(span: Span):
+    span.end_ns = time.time_ns()
+    stage_duration.observe(span.duration, stage=span.name, outcome="error" if span.error else "ok")
+    if span.trace:
+        span.trace.spans.append(span)
+        if span.trace.exported:
+            # e.g. a background upload that outlived its job
+            await _export([span])
+
+@asynccontextmanager
+async def span(name: str, **attributes) -> AsyncIterator[Span]:
+    """
+    Time a stage as a child of the current span. Outside a trace the span
+    is still timed into the stage histogram, just not exported.
+    """
+    parent = _current_span.get()
+    current = Span(parent.trace if parent else None, name, parent.span_id if parent else None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = str(e) or type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        await _finish(current)
+
+@asynccontextmanager
+async def start_trace(name: str, **attributes) -> AsyncIterator[Span]:
+    """Open a new trace with a root span; its spans are exported when the root ends."""
+    trace = Trace()
+    root = Span(trace, name, None, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = str(e) or type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        await _finish(root)
+        trace.exported = True
+        await _export(trace.spans)
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes):
+    """Add an already finished stage, such as time spent queued, under the current span."""
+    parent = _current_span.get()
+    finished = Span(parent.trace if parent else None, name, parent.span_id if parent else None, attributes, start_ns)
+    finished.end_ns = end_ns
+    stage_duration.observe(finished.duration, stage=name, outcome="ok")
+    if finished.trace:
+        finished.trace.spans.append(finished)
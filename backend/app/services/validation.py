@@ -0,0 +1,105 @@
+import ast
+import os
+from typing import List, Optional
+
+VALIDATION_DRY_RUN = os.getenv("VALIDATION_DRY_RUN", "false").lower() == "true"
+VALIDATION_REPAIR_ATTEMPTS = int(os.getenv("VALIDATION_REPAIR_ATTEMPTS", "1"))
+
+ALLOWED_IMPORTS = {
+    "manim", "numpy", "math", "random", "itertools", "functools",
+    "collections", "typing", "colour", "dataclasses", "enum", "string", "fractions",
+}
+DISALLOWED_CALLS = {
+    "eval", "exec", "compile", "open", "__import__", "input", "breakpoint",
+    "exit", "quit", "globals", "locals", "vars", "getattr", "setattr", "delattr",
+}
+ALLOWED_DUNDERS = {"__init__", "__name__"}
+
+class CodeValidationError(Exception):
+    """Raised when generated code fails static checks; details is a list of structured errors."""
+
+    def __init__(self, details: List[dict]):
+        self.details = details
+        super().__init__("; ".join(
+            f"line {d['line']}: {d['message']}" if d.get("line") else d["message"] for d in details
+        ))
+
+def _error(kind: str, message: str, node: Optional[ast.AST] = None) -> dict:
+    return {"type": kind, "message": message, "line": getattr(node, "lineno", None)}
+
+def _check_imports_and_calls(tree: ast.AST) -> List[dict]:
+    errors = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] not in ALLOWED_IMPORTS:
+                    errors.append(_error("disallowed_import", f"import of '{alias.name}' is not allowed", node))
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ""
+            if node.level or module.split(".")[0] not in ALLOWED_IMPORTS:
+                errors.append(_error("disallowed_import", f"import from '{module}' is not allowed", node))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id in DISALLOWED_CALLS:
+                errors.append(_error("disallowed_call", f"call to '{node.func.id}' is not allowed", node))
+        elif isinstance(node, ast.Attribute):
+            if node.attr.startswith("__") and node.attr.endswith("__") and node.attr not in ALLOWED_DUNDERS:
+                errors.append(_error("disallowed_attribute", f"access to '{node.attr}' is not allowed", node))
+        elif isinstance(node, ast.Name) and node.id == "__builtins__":
+            errors.append(_error("disallowed_attribute", "access to '__builtins__' is not allowed", node))
+    return errors
+
+def _has_construct(classes: dict, class_name: str) -> bool:
+    """Look for construct on the class or on any base class defined in the same file."""
+    seen = set()
+    pending = [class_name]
+    while pending:
+        name = pending.pop()
+        if name in seen or name not in classes:
+            continue
+        seen.add(name)
+        node = classes[name]
+        for item in node.body:
+            if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == "construct":
+                return True
+        pending.extend(base.id for base in node.bases if isinstance(base, ast.Name))
+    return False
+
+def validate_scene_code(code: str, class_name: str):
+    """
+    Static checks run before any render time is spent: the code parses,
+    the scene class exists and has a construct method, and it only uses
+    allowed imports and calls.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise CodeValidationError([{"type": "syntax_error", "message": e.msg, "line": e.lineno}])
+
+    errors = _check_imports_and_calls(tree)
+
+    classes = {node.name: node for node in ast.walk(tree) if isinstance(node, ast.ClassDef)}
+    if class_name not in classes:
+        errors.append(_error("missing_scene", f"scene class '{class_name}' is not defined"))
+    elif not _has_construct(classes, class_name):
+        errors.append(_error("missing_construct", f"scene class '{class_name}' has no construct method", classes[class_name]))
+
+    if errors:
+        raise CodeValidationError(errors)
+
+def dry_run_error(output: str) -> CodeValidationError:
+    # the tail of manim's output holds the exception that stopped construct
+    tail = "\n".join(line for line in output.strip().splitlines()[-10:] if line.strip())
+    return CodeValidationError([{"type": "dry_run_failed", "message": tail, "line": None}])
+
+def build_repair_prompt(prompt: str, code: str, error: CodeValidationError) -> str:
+    problems = "\n".join(
+        f"- line {d['line']}: {d['message']}" if d.get("line") else f"- {d['message']}" for d in error.details
+    )
+    return (
+        f"{prompt}\n\n"
+        "The following Manim code was generated for this request but failed validation:\n\n"
+        f"```python\n{code}\n```\n\n"
+        f"Problems:\n{problems}\n\n"
+        "Return a corrected version of the full script. Only import from manim, numpy and the "
+        "Python standard math/random/itertools modules, and do not use eval, exec, open or file access."
+    )
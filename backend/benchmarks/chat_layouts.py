@@ -0,0 +1,106 @@
+"""
+Compare the flat and bucketed chat layouts: append latency, conversation
+load latency, documents read per load, and on-disk size.
+
+    cd backend
+    python -m benchmarks.chat_layouts --sessions 200 --generations 250
+
+Each generation appends a prompt and a reply in one add_messages call,
+as the generate job does. Uses MONGODB_URL and a separate DATABASE_NAME
+(default llmanim_bench), whose chat collections are dropped first.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+
+# read by app.lib.settings at import time
+os.environ.setdefault("DATABASE_NAME", "llmanim_bench")
+
+from app.lib.settings import settings
+from app.lib.database import connect_to_mongo, close_mongo_connection
+from app.models.chat_models import AnimationModel, MessageMetadata, MessageModel
+from app.services.chat_service import ChatService, BucketedChatService, MAX_PAGE_SIZE, MESSAGE_BUCKET_SIZE
+
+SAMPLE_CODE = "from manim import *\n\nclass Demo(Scene):\n    def construct(self):\n" + "        self.play(Create(Circle()))\n" * 60
+
+def summarize(durations: list) -> str:
+    durations = sorted(durations)
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    return f"p50 {statistics.median(durations):8.2f} ms   p95 {p95:8.2f} ms"
+
+def generation(session_id: str, i: int) -> list:
+    now = datetime.utcnow()
+    return [
+        MessageModel(session_id=session_id, message_id=f"{session_id}-u{i}", content=f"Animate step {i}", sender="user", timestamp=now),
+        MessageModel(
+            session_id=session_id, message_id=f"{session_id}-a{i}", content="I've created an animation based on your request!",
+            sender="ai", timestamp=now,
+            animation=AnimationModel(cloudinary_url=f"https://example.com/{session_id}/{i}.mp4", storage_backend="local"),
+            metadata=MessageMetadata(prompt=f"Animate step {i}", generation_time=12.5, manim_code=SAMPLE_CODE)
+        )
+    ]
+
+async def load_conversation(chat_service: ChatService, session_id: str) -> int:
+    pages = 0
+    cursor = None
+    while True:
+        _, cursor = await chat_service.list_messages(session_id, MAX_PAGE_SIZE, cursor)
+        pages += 1
+        if not cursor:
+            return pages
+
+async def collection_size(db, name: str) -> str:
+    stats = await db.command("collStats", name)
+    return f"{name}: {stats['count']:,} docs, {stats['size'] / 1024 ** 2:.1f} MiB data, {stats['totalIndexSize'] / 1024 ** 2:.1f} MiB indexes"
+
+async def run_layout(label: str, chat_service: ChatService, sessions: int, generations: int, iterations: int):
+    db = chat_service.db
+    for name in ("sessions", "messages", "message_buckets"):
+        await db[name].drop()
+    await chat_service.ensure_indexes()
+
+    session_ids = [(await chat_service.create_session(f"Session {i}")).session_id for i in range(sessions)]
+    appends = []
+    # interleave sessions so the bucket tier sees realistic, non-sequential writes
+    for i in range(generations):
+        for session_id in session_ids:
+            messages = generation(session_id, i)
+            started = time.perf_counter()
+            await chat_service.add_messages(session_id, messages)
+            appends.append((time.perf_counter() - started) * 1000)
+
+    loads = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await load_conversation(chat_service, random.choice(session_ids))
+        loads.append((time.perf_counter() - started) * 1000)
+
+    collection = "message_buckets" if isinstance(chat_service, BucketedChatService) else "messages"
+    documents_per_load = await db[collection].count_documents({"session_id": session_ids[0]})
+
+    print(f"{label}:")
+    print(f"  append (prompt + reply)      {summarize(appends)}")
+    print(f"  load conversation            {summarize(loads)}   [{documents_per_load} documents read]")
+    print(f"  {await collection_size(db, collection)}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--generations", type=int, default=250, help="prompt/reply pairs per session")
+    parser.add_argument("--iterations", type=int, default=100, help="conversation loads to time")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        print(f"database: {settings.database_name}, {args.sessions} sessions x {args.generations * 2} messages, bucket size {MESSAGE_BUCKET_SIZE}")
+        await run_layout("flat", ChatService(), args.sessions, args.generations, args.iterations)
+        await run_layout("bucketed", BucketedChatService(), args.sessions, args.generations, args.iterations)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,145 @@
+"""
+Cold start of the API process: starts the backend as a fresh subprocess
+several times and reports how long until it answers /health (the port is
+open), how long until /ready says it can serve, and the phases the
+process reports itself (imports, startup hook, first ready answer).
+
+    cd backend
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --runs 5 --mongomock --imports 15
+
+--imports N also runs `python -X importtime -c "import main"` and lists
+the N slowest top-level imports. Uses MONGODB_URL, or an in-memory
+mongomock in the server process with --mongomock, and STORAGE_BACKEND
+(default local here, which needs no credentials).
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(port: int, mongomock: bool):
+    """Child mode: run the app on port until terminated."""
+    if mongomock:
+        # patched inline rather than through benchmarks.load_test, which would import fastapi ahead of main
+        from mongomock_motor import AsyncMongoMockClient
+        from app.lib import database
+        database.motor_client = lambda url, **kwargs: AsyncMongoMockClient()
+    import uvicorn
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+async def measure(args) -> dict:
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.cold_start", "--serve", str(port)]
+    if args.mongomock:
+        command.append("--mongomock")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, start_new_session=True)
+    result = {"live": None, "ready": None, "boot": {}}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            while time.perf_counter() - started < args.timeout:
+                if process.poll() is not None:
+                    raise SystemExit(f"server exited with {process.returncode} before it was ready")
+                try:
+                    if result["live"] is None:
+                        if (await client.get("/health")).status_code == 200:
+                            result["live"] = time.perf_counter() - started
+                    else:
+                        response = await client.get("/ready")
+                        if response.status_code == 200:
+                            result["ready"] = time.perf_counter() - started
+                            result["boot"] = response.json()["boot"]
+                            break
+                        result["checks"] = response.json()["checks"]
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(args.interval)
+    finally:
+        stop_server(process)
+    return result
+
+def stop_server(process: subprocess.Popen):
+    """SIGTERM the server's whole session, render workers included, and SIGKILL what is left after 10s."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(10)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+def slowest_imports(count: int) -> list:
+    """(cumulative seconds, module) of the slowest modules main imports directly."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], capture_output=True, text=True, check=True
+    ).stderr
+    # a module's imports are listed before it, one level deeper; main is the last top-level entry
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if level == 0:
+            if name.strip() == "main":
+                return sorted(imports, reverse=True)[:count]
+            imports = []
+        elif level == 1:
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return []
+
+def describe(values: list) -> str:
+    if not values:
+        return "-"
+    return f"median {statistics.median(values):6.2f}s   min {min(values):6.2f}s   max {max(values):6.2f}s"
+
+async def run(args):
+    runs = [await measure(args) for _ in range(args.runs)]
+    print(f"{args.runs} cold starts")
+    print(f"  answering /health   {describe([run['live'] for run in runs if run['live'] is not None])}")
+    print(f"  ready               {describe([run['ready'] for run in runs if run['ready'] is not None])}")
+    for phase in ("import", "startup", "ready"):
+        values = [run["boot"][f"{phase}_seconds"] for run in runs if run["boot"].get(f"{phase}_seconds") is not None]
+        print(f"  in process: {phase:<8}{describe(values)}")
+    never_ready = [run for run in runs if run["ready"] is None]
+    if never_ready:
+        print(f"  {len(never_ready)} runs never became ready; last checks: {never_ready[-1].get('checks')}")
+
+    if args.imports:
+        print("slowest imports under main:")
+        for seconds, name in slowest_imports(args.imports):
+            print(f"  {seconds:6.3f}s  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120, help="give up on a run after this many seconds")
+    parser.add_argument("--interval", type=float, default=0.05, help="polling interval")
+    parser.add_argument("--mongomock", action="store_true", help="in-memory MongoDB instead of MONGODB_URL")
+    parser.add_argument("--imports", type=int, default=0, help="also list the N slowest top-level imports")
+    parser.add_argument("--serve", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.environ.setdefault("STORAGE_BACKEND", "local")
+    os.environ.setdefault("DATABASE_NAME", "llmanim_bench")
+    if args.serve:
+        serve(args.serve, args.mongomock)
+    else:
+        asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Local stand-ins for Gemini and the Cloudinary upload API, so the backend
+can be load tested without network access or API quotas.
+
+    cd backend
+    python -m benchmarks.fakes --gemini-port 8090 --cdn-port 8091 --llm-latency 1.5
+
+then start the backend with GEMINI_API_ENDPOINT=http://127.0.0.1:8090 and
+CLOUDINARY_API_URL=http://127.0.0.1:8091. benchmarks.load_test starts
+both itself.
+
+The fake Gemini answers generateContent with a canned Manim script. A
+"complexity=light|medium|heavy" hint in the prompt picks the script, and
+the rest of the prompt seeds a parameter, so distinct prompts render
+distinct scenes instead of hitting the render cache.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+LIGHT_SCENE = """from manim import *
+
+class LightScene(Scene):
+    def construct(self):
+        circle = Circle(color=BLUE).rotate({seed} * DEGREES)
+        self.play(Create(circle))
+        self.play(circle.animate.shift(RIGHT))
+"""
+
+MEDIUM_SCENE = """from manim import *
+
+class MediumScene(Scene):
+    def construct(self):
+        square = Square(color=GREEN).rotate({seed} * DEGREES)
+        title = Text("Step {seed}").to_edge(UP)
+        self.play(Write(title), Create(square))
+        for i in range(4):
+            self.play(square.animate.rotate(PI / 4).scale(1.1), run_time=0.5)
+        self.play(Transform(square, Circle(color=YELLOW)))
+        self.play(FadeOut(square), FadeOut(title))
+"""
+
+HEAVY_SCENE = """from manim import *
+import numpy as np
+
+class HeavyScene(Scene):
+    def construct(self):
+        axes = Axes(x_range=[-4, 4], y_range=[-2, 2])
+        graph = axes.plot(lambda x: np.sin(x + {seed} / 10), color=BLUE)
+        self.play(Create(axes), Create(graph))
+        dots = VGroup(*[Dot(axes.c2p(x / 4, np.sin(x / 4 + {seed} / 10))) for x in range(-16, 17)])
+        self.play(LaggedStart(*[GrowFromCenter(dot) for dot in dots], lag_ratio=0.05))
+        squares = VGroup(*[Square(side_length=0.3).set_fill(random_bright_color(), 0.8) for _ in range(60)])
+        squares.arrange_in_grid(rows=6).scale(0.8)
+        self.play(ReplacementTransform(dots, squares), FadeOut(graph), FadeOut(axes))
+        self.play(Rotate(squares, angle=PI), run_time=2)
+        self.play(squares.animate.arrange_in_grid(rows=3), run_time=1.5)
+"""
+
+SCENES = {"light": LIGHT_SCENE, "medium": MEDIUM_SCENE, "heavy": HEAVY_SCENE}
+
+def canned_script(prompt: str) -> str:
+    match = re.search(r"complexity=(\w+)", prompt)
+    complexity = match.group(1) if match and match.group(1) in SCENES else "light"
+    # repair prompts quote the original one, so they map to the same scene
+    seed = int(hashlib.sha256(prompt.split("\n\n")[0].encode()).hexdigest(), 16) % 360
+    return SCENES[complexity].format(seed=seed)
+
+def fake_gemini_app(latency: float = 1.0, jitter: float = 0.25, error_rate: float = 0.0) -> FastAPI:
+    """
+    generateContent with a simulated model latency. error_rate returns 503s
+    to exercise the client's retries.
+    """
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.post("/v1beta/models/{model}:generateContent")
+    async def generate_content(model: str, request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        prompt = "".join(part.get("text", "") for part in body["contents"][-1]["parts"])
+        await asyncio.sleep(max(0.0, random.gauss(latency, latency * jitter)))
+        if random.random() < error_rate:
+            return JSONResponse(status_code=503, content={"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}})
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": canned_script(prompt)}]}, "finishReason": "STOP"}],
+            "modelVersion": model
+        }
+
+    return app
+
+def fake_cdn_app(bandwidth_mb: float = 50.0, latency: float = 0.05) -> FastAPI:
+    """
+    Cloudinary's upload endpoints, chunked uploads included. The bytes are
+    discarded; each request sleeps for latency plus size / bandwidth.
+    """
+    app = FastAPI()
+    app.state.uploads = 0
+    app.state.bytes = 0
+
+    @app.post("/v1_1/{cloud_name}/{resource_type}/upload")
+    async def upload(cloud_name: str, resource_type: str, request: Request):
+        form = await request.form()
+        chunk = await form["file"].read()
+        app.state.bytes += len(chunk)
+        await asyncio.sleep(latency + len(chunk) / (bandwidth_mb * 1024 * 1024))
+
+        content_range = request.headers.get("Content-Range")
+        if content_range:
+            end, total = re.match(r"bytes \d+-(\d+)/(\d+)", content_range).groups()
+            if int(end) + 1 < int(total):
+                return {"done": False}
+        app.state.uploads += 1
+        public_id = form["public_id"]
+        extension = ".mp4" if resource_type == "video" else ""
+        return {
+            "public_id": public_id,
+            "secure_url": f"{str(request.base_url).rstrip('/')}/{cloud_name}/{resource_type}/upload/v1/{public_id}{extension}",
+            "resource_type": resource_type
+        }
+
+    return app
+
+async def serve(app: FastAPI, port: int = 0) -> tuple[uvicorn.Server, asyncio.Task, int]:
+    """Run an app on 127.0.0.1 inside the current event loop; port 0 picks a free one."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task, server.servers[0].sockets[0].getsockname()[1]
+
+async def stop(server: uvicorn.Server, task: asyncio.Task):
+    server.should_exit = True
+    await task
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gemini-port", type=int, default=8090)
+    parser.add_argument("--cdn-port", type=int, default=8091)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="mean seconds per generateContent call")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--cdn-bandwidth", type=float, default=50.0, help="simulated upload bandwidth in MiB/s")
+    args = parser.parse_args()
+
+    gemini = await serve(fake_gemini_app(args.llm_latency, error_rate=args.llm_error_rate), args.gemini_port)
+    cdn = await serve(fake_cdn_app(args.cdn_bandwidth), args.cdn_port)
+    print(f"fake Gemini on http://127.0.0.1:{gemini[2]}, fake CDN on http://127.0.0.1:{cdn[2]}")
+    await asyncio.gather(gemini[1], cdn[1])
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,346 @@
+"""
+End-to-end load test: runs the backend in-process against a fake Gemini
+and a fake Cloudinary (benchmarks.fakes), drives /api/generate and the
+chat endpoints from concurrent virtual users, and reports throughput,
+p50/p95/p99 latency per route and per generation stage, and the CPU and
+RSS of the render worker processes.
+
+    cd backend
+    python -m benchmarks.load_test --jobs 200 --concurrency 16 --mix light=0.6,medium=0.3,heavy=0.1
+    python -m benchmarks.load_test ... --output after.json --compare before.json
+    python -m benchmarks.load_test ... --greedy 2 --greedy-burst 20
+
+Each virtual user counts as its own client. --greedy adds users that fire
+--greedy-burst generate requests at once; their jobs and rejections are
+reported apart, to show what overload does to everyone else.
+
+Rendering is real (the warm manim worker pool), so render numbers depend
+on the machine; run baselines and comparisons on the same one. Chat data
+goes to MONGODB_URL with DATABASE_NAME defaulting to llmanim_bench, whose
+chat and cache collections are emptied first, or to an in-memory mongomock
+with --mongomock (needs the mongomock-motor package).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.fakes import fake_gemini_app, fake_cdn_app, serve, stop, SCENES
+
+BENCH_COLLECTIONS = ("sessions", "messages", "message_buckets", "render_cache", "llm_cache")
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99)
+    }
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENES:
+            raise ValueError(f"Unknown complexity '{name}', expected one of {', '.join(SCENES)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def build_prompts(jobs: int, mix: dict, repeat_ratio: float) -> list:
+    """Prompts tagged with a complexity; repeat_ratio of them reuse an earlier prompt (cache hits)."""
+    prompts = []
+    for i in range(jobs):
+        if prompts and random.random() < repeat_ratio:
+            prompts.append(random.choice(prompts))
+            continue
+        complexity = random.choices(list(mix), weights=list(mix.values()))[0]
+        prompts.append(f"complexity={complexity} Animate benchmark scene #{i} ({random.getrandbits(32):08x})")
+    return prompts
+
+def read_process(pid: int) -> tuple[float, float]:
+    """(CPU seconds, RSS MiB) of a live process, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        # the command name may contain spaces, so split after its closing paren
+        fields = f.read().rsplit(")", 1)[1].split()
+    with open(f"/proc/{pid}/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return cpu_seconds, resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+def child_pids(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+class ProcessSampler:
+    """
+    Samples the render workers (and anything they spawn) every interval.
+    CPU time is kept per pid, so workers recycled mid-run still count.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.cpu = {}
+        self.peak_rss = {}
+        self.peak_total_rss = 0.0
+        self.started = time.perf_counter()
+
+    def pids(self) -> list:
+        from app.services.render_workers import get_render_pool
+        try:
+            workers = [worker.pid for worker in get_render_pool().workers if worker.pid]
+        except Exception as e:
+            return []
+        return workers + [child for pid in workers for child in child_pids(pid)]
+
+    def sample(self):
+        total_rss = 0.0
+        for pid in self.pids():
+            try:
+                cpu_seconds, rss = read_process(pid)
+            except OSError:
+                continue
+            self.cpu[pid] = cpu_seconds
+            self.peak_rss[pid] = max(self.peak_rss.get(pid, 0.0), rss)
+            total_rss += rss
+        self.peak_total_rss = max(self.peak_total_rss, total_rss)
+
+    async def run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def report(self) -> dict:
+        wall = time.perf_counter() - self.started
+        cpu_seconds = sum(self.cpu.values())
+        return {
+            "processes": len(self.cpu),
+            "cpu_seconds": cpu_seconds,
+            "avg_cores_busy": cpu_seconds / wall if wall else 0.0,
+            "peak_rss_mb": max(self.peak_rss.values(), default=0.0),
+            "peak_total_rss_mb": self.peak_total_rss
+        }
+
+class Recorder:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.stages = defaultdict(list)
+        self.outcomes = defaultdict(int)
+        self.requests = 0
+
+    async def timed(self, name: str, request) -> httpx.Response:
+        started = time.perf_counter()
+        response = await request
+        self.latency[name].append(time.perf_counter() - started)
+        self.requests += 1
+        return response
+
+async def run_job(
+    client: httpx.AsyncClient, recorder: Recorder, prompt: str, session_id, args, address: str, kind: str = ""
+) -> str:
+    started = time.perf_counter()
+    payload = {"prompt": prompt, "quality": args.quality}
+    if session_id:
+        payload["session_id"] = session_id
+    response = await recorder.timed(
+        "POST /api/generate", client.post("/api/generate", json=payload, headers={"X-Forwarded-For": address})
+    )
+    if response.status_code != 202:
+        recorder.outcomes[f"{kind}rejected_{response.status_code}"] += 1
+        return session_id
+    job = response.json()
+
+    while True:
+        await asyncio.sleep(args.poll_interval)
+        response = await recorder.timed(
+            "GET /api/jobs/{job_id}/result", client.get(f"/api/jobs/{job['job_id']}/result")
+        )
+        if response.status_code != 202:
+            break
+
+    recorder.latency[f"{kind}job end-to-end"].append(time.perf_counter() - started)
+    if response.status_code == 200:
+        recorder.outcomes[f"{kind}completed"] += 1
+        for stage, seconds in (response.json().get("stages") or {}).items():
+            recorder.stages[stage].append(seconds)
+    else:
+        recorder.outcomes[f"{kind}failed_{response.status_code}"] += 1
+    return job.get("session_id") or session_id
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, prompts, args, address: str):
+    """One user keeps a single conversation going and browses the chat after every job."""
+    session_id = None
+    for prompt in prompts:
+        session_id = await run_job(client, recorder, prompt, session_id, args, address)
+        for _ in range(args.chat_reads):
+            await recorder.timed("GET /api/chat/sessions", client.get("/api/chat/sessions", params={"limit": 20}))
+            if session_id:
+                await recorder.timed(
+                    "GET /api/chat/sessions/{session_id}", client.get(f"/api/chat/sessions/{session_id}")
+                )
+
+async def greedy_user(client: httpx.AsyncClient, recorder: Recorder, prompts, args, address: str):
+    """Fires --greedy-burst jobs at once, each in a new chat, until the prompts run out."""
+    while True:
+        burst = [prompt for _, prompt in zip(range(args.greedy_burst), prompts)]
+        if not burst:
+            return
+        await asyncio.gather(*(run_job(client, recorder, prompt, None, args, address, "greedy ") for prompt in burst))
+
+def print_table(title: str, rows: dict, baseline: dict):
+    print(title)
+    for name, stats in sorted(rows.items()):
+        line = f"  {name:<38} n={stats['count']:<6} p50 {stats['p50'] * 1000:9.1f} ms   p95 {stats['p95'] * 1000:9.1f} ms   p99 {stats['p99'] * 1000:9.1f} ms"
+        before = baseline.get(name)
+        if before and before["p95"]:
+            line += f"   (p95 {(stats['p95'] / before['p95'] - 1) * 100:+.1f}%)"
+        print(line)
+
+def print_report(results: dict, baseline: dict):
+    throughput = results["throughput"]
+    line = f"{throughput['jobs_per_sec']:.2f} jobs/s, {throughput['requests_per_sec']:.1f} requests/s over {throughput['wall_seconds']:.1f} s"
+    if baseline:
+        before = baseline["throughput"]["jobs_per_sec"]
+        if before:
+            line += f"   (jobs/s {(throughput['jobs_per_sec'] / before - 1) * 100:+.1f}%)"
+    print(line)
+    print("outcomes: " + ", ".join(f"{name} {count}" for name, count in sorted(results["outcomes"].items())))
+    print_table("routes:", results["latency"], baseline.get("latency", {}) if baseline else {})
+    print_table("stages:", results["stages"], baseline.get("stages", {}) if baseline else {})
+    processes = results["render_processes"]
+    print(
+        f"render processes: {processes['processes']} seen, {processes['cpu_seconds']:.1f} CPU s "
+        f"({processes['avg_cores_busy']:.2f} cores busy on average), peak RSS {processes['peak_rss_mb']:.0f} MiB "
+        f"per process, {processes['peak_total_rss_mb']:.0f} MiB total"
+    )
+
+async def wait_until_ready(base_url: str, timeout: float = 120) -> float:
+    """Poll /ready like a load balancer would, so no job is measured against workers still starting."""
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while True:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                return time.perf_counter() - started
+            if time.perf_counter() - started > timeout:
+                raise SystemExit(f"backend not ready after {timeout:g}s: {response.json()['checks']}")
+            await asyncio.sleep(0.1)
+
+def configure_environment(args, gemini_url: str, cdn_url: str):
+    """Settings are read at import time, so this runs before the app is imported."""
+    os.environ["GEMINI_API_ENDPOINT"] = gemini_url
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["CLOUDINARY_API_URL"] = cdn_url
+    os.environ.setdefault("CLOUDINARY_CLOUD_NAME", "benchmark")
+    os.environ.setdefault("CLOUDINARY_API_KEY", "benchmark")
+    os.environ.setdefault("CLOUDINARY_API_SECRET", "benchmark")
+    os.environ.setdefault("DATABASE_NAME", "llmanim_bench")
+    # virtual users are told apart by X-Forwarded-For, as they would be behind a proxy
+    os.environ["TRUST_FORWARDED_FOR"] = "true"
+    # a fresh file tier per run, so renders are measured cold
+    os.environ.setdefault("RENDER_CACHE_DIR", tempfile.mkdtemp(prefix="llmanim-bench-cache-"))
+
+def use_mongomock():
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        raise SystemExit("--mongomock needs the mongomock-motor package (pip install mongomock-motor)")
+    from app.lib import database
+    # pool options and event listeners are meaningless for the in-memory client
+    database.motor_client = lambda url, **kwargs: AsyncMongoMockClient()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=100, help="generate requests in total")
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual users")
+    parser.add_argument("--mix", default="light=0.6,medium=0.3,heavy=0.1", help="scene complexity weights")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="fraction of prompts repeated (cache hits)")
+    parser.add_argument("--quality", default="draft")
+    parser.add_argument("--chat-reads", type=int, default=1, help="session list + session loads after each job")
+    parser.add_argument("--greedy", type=int, default=0, help="extra users that submit in bursts")
+    parser.add_argument("--greedy-burst", type=int, default=20, help="generate requests a greedy user fires at once")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--storage", default="cloudinary", choices=("cloudinary", "local"))
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="mean fake Gemini latency in seconds")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--cdn-bandwidth", type=float, default=50.0, help="fake CDN bandwidth in MiB/s")
+    parser.add_argument("--mongomock", action="store_true", help="in-memory MongoDB instead of MONGODB_URL")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to diff against")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    gemini = await serve(fake_gemini_app(args.llm_latency, error_rate=args.llm_error_rate))
+    cdn = await serve(fake_cdn_app(args.cdn_bandwidth))
+    configure_environment(args, f"http://127.0.0.1:{gemini[2]}", f"http://127.0.0.1:{cdn[2]}")
+    if args.mongomock:
+        use_mongomock()
+
+    from main import app
+    from app.lib.database import get_database, is_database_connected
+
+    backend = await serve(app)
+    try:
+        print(f"backend ready after {await wait_until_ready(f'http://127.0.0.1:{backend[2]}'):.2f}s")
+        if is_database_connected():
+            db = get_database()
+            for name in BENCH_COLLECTIONS:
+                await db[name].delete_many({})
+
+        prompts = iter(build_prompts(args.jobs, parse_mix(args.mix), args.repeat_ratio))
+        recorder = Recorder()
+        sampler = ProcessSampler()
+        sampling = asyncio.create_task(sampler.run())
+        started = time.perf_counter()
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{backend[2]}", timeout=600, limits=limits) as client:
+            await asyncio.gather(
+                *(virtual_user(client, recorder, prompts, args, f"10.0.0.{i + 1}") for i in range(args.concurrency)),
+                *(greedy_user(client, recorder, prompts, args, f"10.0.1.{i + 1}") for i in range(args.greedy))
+            )
+        wall = time.perf_counter() - started
+        sampling.cancel()
+        sampler.sample()
+    finally:
+        await stop(*backend[:2])
+        await stop(*cdn[:2])
+        await stop(*gemini[:2])
+
+    results = {
+        "config": vars(args),
+        "throughput": {
+            "wall_seconds": wall,
+            "jobs_per_sec": (recorder.outcomes.get("completed", 0) + recorder.outcomes.get("greedy completed", 0)) / wall,
+            "requests_per_sec": recorder.requests / wall
+        },
+        "outcomes": dict(recorder.outcomes),
+        "latency": {name: summarize(values) for name, values in recorder.latency.items()},
+        "stages": {name: summarize(values) for name, values in recorder.stages.items()},
+        "render_processes": sampler.report()
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,165 @@
+"""
+Seed a throwaway database with chat history and time the ChatService
+queries, first against bare collections and then with the indexes from
+ChatService.ensure_indexes.
+
+    cd backend
+    python -m benchmarks.mongo_queries --messages 1000000 --sessions 10000
+
+Uses MONGODB_URL and a separate DATABASE_NAME (default llmanim_bench),
+which is dropped and reseeded unless --skip-seed is given.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# read by app.lib.settings at import time
+os.environ.setdefault("DATABASE_NAME", "llmanim_bench")
+
+from bson import ObjectId
+
+from app.lib.settings import settings
+from app.lib.database import connect_to_mongo, close_mongo_connection, get_database
+from app.services.chat_service import (
+    ChatService, SESSION_LIST_PROJECTION, MESSAGE_LIGHTWEIGHT_PROJECTION, SESSION_PAGE_SIZE, MESSAGE_PAGE_SIZE
+)
+
+SAMPLE_CODE = "from manim import *\n\nclass Demo(Scene):\n    def construct(self):\n" + "        self.play(Create(Circle()))\n" * 60
+
+async def seed(db, sessions: int, messages: int, batch_size: int) -> list:
+    await db.sessions.drop()
+    await db.messages.drop()
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=30)
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    session_docs = [
+        {
+            "_id": str(ObjectId()),
+            "session_id": session_id,
+            "title": f"Session {i}",
+            "created_at": start,
+            "updated_at": start + timedelta(seconds=random.randint(0, 30 * 86400)),
+            "message_count": messages // sessions
+        }
+        for i, session_id in enumerate(session_ids)
+    ]
+    for offset in range(0, len(session_docs), batch_size):
+        await db.sessions.insert_many(session_docs[offset:offset + batch_size], ordered=False)
+
+    step = timedelta(days=30) / max(messages, 1)
+    for offset in range(0, messages, batch_size):
+        docs = []
+        for i in range(offset, min(offset + batch_size, messages)):
+            sender = "user" if i % 2 == 0 else "ai"
+            doc = {
+                "_id": str(ObjectId()),
+                "session_id": random.choice(session_ids),
+                "message_id": str(uuid.uuid4()),
+                "content": "Animate a circle turning into a square" if sender == "user" else "I've created an animation based on your request!",
+                "sender": sender,
+                "timestamp": start + step * i,
+                "animation": None,
+                "metadata": None
+            }
+            if sender == "ai":
+                doc["animation"] = {"cloudinary_url": f"https://example.com/{i}.mp4", "format": "mp4", "storage_backend": "local"}
+                doc["metadata"] = {"prompt": doc["content"], "generation_time": 12.5, "manim_code": SAMPLE_CODE}
+            docs.append(doc)
+        await db.messages.insert_many(docs, ordered=False)
+        print(f"\rseeded {min(offset + batch_size, messages):,}/{messages:,} messages", end="", flush=True)
+    print()
+    return session_ids
+
+def plan_stages(plan: dict) -> list:
+    stages = [plan.get("stage")]
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            stages.extend(plan_stages(child))
+    return [stage for stage in stages if stage]
+
+async def explain(cursor) -> str:
+    result = await cursor.explain()
+    stages = plan_stages(result["queryPlanner"]["winningPlan"])
+    examined = result.get("executionStats", {}).get("totalDocsExamined", "?")
+    return f"{'>'.join(stages)}, {examined} docs examined"
+
+async def time_query(label: str, run, iterations: int, plan: str):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await run()
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+    print(f"  {label:<34} p50 {statistics.median(durations):9.2f} ms   p95 {p95:9.2f} ms   [{plan}]")
+
+async def run_queries(chat_service: ChatService, session_ids: list, iterations: int):
+    db = chat_service.db
+    sample = random.choice(session_ids)
+    _, next_cursor = await chat_service.list_sessions()
+
+    await time_query(
+        "list sessions (first page)", chat_service.list_sessions, iterations,
+        await explain(
+            db.sessions.find({}, SESSION_LIST_PROJECTION).sort([("updated_at", -1), ("_id", -1)]).limit(SESSION_PAGE_SIZE + 1)
+        )
+    )
+    if next_cursor:
+        await time_query("list sessions (second page)", lambda: chat_service.list_sessions(cursor=next_cursor), iterations, "keyset")
+    await time_query(
+        "get session", lambda: chat_service.get_session(random.choice(session_ids)), iterations,
+        await explain(db.sessions.find({"session_id": sample}).limit(1))
+    )
+    await time_query(
+        "session messages (lightweight)",
+        lambda: chat_service.list_messages(random.choice(session_ids)), iterations,
+        await explain(
+            db.messages.find({"session_id": sample}, MESSAGE_LIGHTWEIGHT_PROJECTION)
+            .sort([("timestamp", 1), ("_id", 1)]).limit(MESSAGE_PAGE_SIZE + 1)
+        )
+    )
+    await time_query(
+        "session messages (full documents)",
+        lambda: chat_service.list_messages(random.choice(session_ids), lightweight=False), iterations,
+        await explain(db.messages.find({"session_id": sample}).sort([("timestamp", 1), ("_id", 1)]).limit(MESSAGE_PAGE_SIZE + 1))
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the data from a previous run")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        db = get_database()
+        chat_service = ChatService()
+        print(f"database: {settings.database_name}")
+
+        if args.skip_seed:
+            session_ids = await db.sessions.distinct("session_id")
+        else:
+            session_ids = await seed(db, args.sessions, args.messages, args.batch_size)
+
+        await db.sessions.drop_indexes()
+        await db.messages.drop_indexes()
+        print("without indexes:")
+        await run_queries(chat_service, session_ids, args.iterations)
+
+        await chat_service.ensure_indexes()
+        print("with indexes:")
+        await run_queries(chat_service, session_ids, args.iterations)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,23 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import time
+
+boot_started = time.perf_counter()
+
+from app.lib import settings as _settings  # noqa: F401  (loads .env before any module reads the environment)
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routes import generate, chat
+from fastapi.responses import JSONResponse
+from app.routes import generate, chat, jobs, cache, videos, metrics
 from app.lib.database import connect_to_mongo, close_mongo_connection
-import os
+from app.services.jobs import start_job_queue, stop_job_queue
+from app.services.render_workers import start_render_pool, stop_render_pool
+from app.services.generation import run_generation_job
+from app.services.storage import storage
+from app.services.chat_service import stop_chat_service
+from app.services.metrics import http_request_duration
+from app.services.tracing import exporter
+from app.services.readiness import mark_boot, readiness, start_preparation, stop_preparation
+
+mark_boot("import", boot_started)
 
 app = FastAPI(title="LLManim API", version="1.0.0")
 
@@ -15,24 +29,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-videos_path = os.path.join(os.path.dirname(__file__), "videos")
-if os.path.exists(videos_path):
-    app.mount("/videos", StaticFiles(directory=videos_path), name="videos")
-
 app.include_router(generate.router, prefix="/api", tags=["generate"])
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
+app.include_router(jobs.router, prefix="/api", tags=["jobs"])
+app.include_router(cache.router, prefix="/api", tags=["cache"])
+app.include_router(videos.router, tags=["videos"])
+app.include_router(metrics.router, tags=["metrics"])
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # the route template, not the raw path, keeps label cardinality bounded
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=status
+        )
 
 @app.on_event("startup")
 async def startup_event():
+    """Nothing here waits on the network or on manim; /ready tells when the process can serve."""
     try:
-        await connect_to_mongo()
+        await connect_to_mongo(ping=False)
     except Exception as e:
         pass
 
+    start_preparation()
+    await start_render_pool()
+    await start_job_queue(run_generation_job)
+    mark_boot("startup", boot_started)
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close MongoDB connection on shutdown."""
+    stop_preparation()
+    await stop_job_queue()
+    await stop_render_pool()
+    await storage.drain()
+    await storage.close()
+    stop_chat_service()
     await close_mongo_connection()
+    await exporter.close()
 
 @app.get("/")
 async def root():
@@ -40,4 +83,11 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    """Liveness: the process is up and answering."""
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: MongoDB, a render worker and storage are all usable; 503 with the failing checks otherwise."""
+    report = await readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
@@ -0,0 +1,81 @@
+"""
+Copy chat messages from the flat messages collection into the bucketed
+layout (message_buckets) used when CHAT_STORAGE_LAYOUT=bucketed.
+
+    cd backend
+    python -m scripts.migrate_message_buckets --dry-run
+    python -m scripts.migrate_message_buckets --drop-source
+
+Sessions that already have buckets are skipped unless --force is given,
+so the tool can be re-run after an interruption. Source messages are
+only deleted with --drop-source, one session at a time after its buckets
+are written. Run it with the app stopped or still on the flat layout.
+"""
+import argparse
+import asyncio
+
+from app.lib.database import connect_to_mongo, close_mongo_connection, get_database
+from app.services.chat_service import BucketedChatService, new_bucket, MESSAGE_BUCKET_SIZE
+
+async def migrate(bucket_size: int, dry_run: bool, force: bool, drop_source: bool) -> dict:
+    db = get_database()
+    if not dry_run:
+        await BucketedChatService().ensure_indexes()
+
+    already_migrated = set() if force else set(await db.message_buckets.distinct("session_id"))
+    stats = {"sessions": 0, "skipped_sessions": 0, "messages": 0, "buckets": 0}
+
+    async def flush(session_id, messages):
+        if session_id in already_migrated:
+            stats["skipped_sessions"] += 1
+            return
+        buckets = [new_bucket(session_id, messages[i:i + bucket_size]) for i in range(0, len(messages), bucket_size)]
+        stats["sessions"] += 1
+        stats["messages"] += len(messages)
+        stats["buckets"] += len(buckets)
+        if dry_run:
+            return
+        if force:
+            await db.message_buckets.delete_many({"session_id": session_id})
+        await db.message_buckets.insert_many(buckets)
+        if drop_source:
+            await db.messages.delete_many({"session_id": session_id})
+
+    # walks the (session_id, timestamp, _id) index, so each session arrives in order
+    session_id, messages, read = None, [], 0
+    async for message in db.messages.find({}).sort([("session_id", 1), ("timestamp", 1), ("_id", 1)]):
+        if message["session_id"] != session_id and messages:
+            await flush(session_id, messages)
+            messages = []
+        session_id = message["session_id"]
+        messages.append(message)
+        read += 1
+        if read % 10_000 == 0:
+            print(f"\r{read:,} messages read", end="", flush=True)
+    if messages:
+        await flush(session_id, messages)
+    print()
+    return stats
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bucket-size", type=int, default=MESSAGE_BUCKET_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be written")
+    parser.add_argument("--force", action="store_true", help="rebuild buckets for sessions that already have them")
+    parser.add_argument("--drop-source", action="store_true", help="delete flat messages once their session is migrated")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        stats = await migrate(args.bucket_size, args.dry_run, args.force, args.drop_source)
+    finally:
+        await close_mongo_connection()
+
+    prefix = "would migrate" if args.dry_run else "migrated"
+    print(
+        f"{prefix} {stats['messages']:,} messages from {stats['sessions']:,} sessions "
+        f"into {stats['buckets']:,} buckets; {stats['skipped_sessions']:,} sessions already bucketed"
+    )
+
+if __name__ == "__main__":
+    asyncio.run(main())
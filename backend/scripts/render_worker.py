@@ -0,0 +1,47 @@
+"""
+Render host for RENDER_BACKEND=farm: renders the jobs API nodes queue in
+MongoDB's render_jobs collection, on a local pool of render workers.
+
+    cd backend
+    python -m scripts.render_worker
+    python -m scripts.render_worker --workers 8 --id render-3
+
+Run as many as needed, on any host that reaches the same database; each
+claims jobs while its pool has a free worker. SIGTERM or SIGINT stops
+claiming, waits up to RENDER_FARM_DRAIN_SECONDS for running renders and
+hands the rest back to the queue for another host.
+"""
+import argparse
+import asyncio
+import signal
+
+from app.lib.database import connect_to_mongo, close_mongo_connection
+from app.services.render_farm import RenderFarmWorker, ensure_farm_indexes
+from app.services.render_workers import RenderWorkerPool
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=0, help="render processes (default: RENDER_WORKERS_PER_CORE per core)")
+    parser.add_argument("--id", default=None, help="name in render_hosts and lease_owner (default: host:pid)")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    await ensure_farm_indexes()
+    pool = RenderWorkerPool(args.workers or None)
+    await pool.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    farm_worker = RenderFarmWorker(pool, args.id)
+    print(f"render worker {farm_worker.worker_id} claiming jobs with {pool.size} workers")
+    try:
+        await farm_worker.run(stopping)
+    finally:
+        await pool.stop()
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
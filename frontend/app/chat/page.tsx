@@ -6,6 +6,7 @@ import { ChatMessage, MessageType } from "@/components/ChatMessage";
 import { ChatInput } from "@/components/ChatInput";
 import { ChatSidebar } from "@/components/ChatSidebar";
 import { Loader2 } from "lucide-react";
+import { Button } from "@/components/ui/button";
 import {
   SidebarProvider,
   SidebarTrigger,
@@ -28,25 +29,56 @@ interface ServerMessage {
   timestamp: string;
   animation?: {
     cloudinary_url: string;
+    poster_url?: string;
+    upload_failed?: boolean;
   };
 }
 
+interface JobResult {
+  video_url: string;
+  poster_url?: string;
+  session_id: string | null;
+  message_id: string;
+  generation_time: number;
+}
+
 const ChatContent = () => {
   const [currentSession, setCurrentSession] = useState<ChatSession | null>(
     null
   );
   const [sessions, setSessions] = useState<ChatSession[]>([]);
+  const [sessionsCursor, setSessionsCursor] = useState<string | null>(null);
   const [messages, setMessages] = useState<MessageType[]>([]);
+  const [messagesCursor, setMessagesCursor] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [progressLabel, setProgressLabel] = useState("Generating animation...");
   const { state } = useSidebar();
 
   const backendURL =
     process.env.NEXT_PUBLIC_BACKEND_URL || "http://127.0.0.1:8000";
 
+  // videos still uploading to the CDN are served by the backend's /videos mount
+  const resolveVideoUrl = (url?: string) =>
+    url && url.startsWith("/") ? `${backendURL}${url}` : url;
+
   const loadSessions = async () => {
     try {
       const response = await axios.get(`${backendURL}/api/chat/sessions`);
       setSessions(response.data.sessions);
+      setSessionsCursor(response.data.next_cursor);
+    } catch (error) {
+      console.log(error);
+    }
+  };
+
+  const loadMoreSessions = async () => {
+    if (!sessionsCursor) return;
+    try {
+      const response = await axios.get(`${backendURL}/api/chat/sessions`, {
+        params: { cursor: sessionsCursor },
+      });
+      setSessions((previous) => [...previous, ...response.data.sessions]);
+      setSessionsCursor(response.data.next_cursor);
     } catch (error) {
       console.log(error);
     }
@@ -74,31 +106,58 @@ const ChatContent = () => {
       setSessions([newSession, ...sessions]);
       setCurrentSession(newSession);
       setMessages([]);
+      setMessagesCursor(null);
     } catch (error) {
       console.log(error);
     }
   };
 
-const loadSession = async (sessionId: string) => {
-  try {
-    const response = await axios.get(`${backendURL}/api/chat/sessions/${sessionId}`);
-    const session = response.data;
-
-    const frontendMessages: MessageType[] = session.messages.map((msg: ServerMessage) => ({
+// an animation whose upload failed points at a local copy that is gone or soon will be
+const toFrontendMessages = (serverMessages: ServerMessage[]): MessageType[] =>
+  serverMessages.map((msg: ServerMessage) => {
+    const animation = msg.animation?.upload_failed ? undefined : msg.animation;
+    return {
       id: msg.message_id,
-      content: msg.content,
+      content: msg.animation?.upload_failed
+        ? "The animation was rendered but could not be uploaded. Please try again."
+        : msg.content,
       sender: msg.sender,
       timestamp: new Date(msg.timestamp),
-      animation: msg.animation?.cloudinary_url ?? undefined,
-    }));
+      animation: resolveVideoUrl(animation?.cloudinary_url),
+      poster: resolveVideoUrl(animation?.poster_url),
+    };
+  });
+
+const loadSession = async (sessionId: string) => {
+  try {
+    // only the newest page; older ones load on demand
+    const response = await axios.get(`${backendURL}/api/chat/sessions/${sessionId}`, {
+      params: { latest: true, lightweight: true },
+    });
+    const session = response.data;
 
     setCurrentSession(session);
-    setMessages(frontendMessages);
+    setMessages(toFrontendMessages(session.messages));
+    setMessagesCursor(session.previous_cursor);
   } catch (error) {
     console.error("Error loading session:", error);
   }
 };
 
+const loadEarlierMessages = async () => {
+  if (!currentSession || !messagesCursor) return;
+  try {
+    const response = await axios.get(
+      `${backendURL}/api/chat/sessions/${currentSession.session_id}`,
+      { params: { before: messagesCursor, lightweight: true } }
+    );
+    setMessages((previous) => [...toFrontendMessages(response.data.messages), ...previous]);
+    setMessagesCursor(response.data.previous_cursor);
+  } catch (error) {
+    console.error("Error loading earlier messages:", error);
+  }
+};
+
 
   const deleteSession = async (sessionId: string) => {
     try {
@@ -108,12 +167,50 @@ const loadSession = async (sessionId: string) => {
       if (currentSession?.session_id === sessionId) {
         setCurrentSession(null);
         setMessages([]);
+        setMessagesCursor(null);
       }
     } catch (error) {
       console.log(error);
     }
   };
 
+  const waitForJob = (jobId: string) =>
+    new Promise<JobResult>((resolve, reject) => {
+      // stage events stream over SSE; the final one carries the job result
+      const source = new EventSource(`${backendURL}/api/jobs/${jobId}/events`);
+      const parse = (event: Event) => JSON.parse((event as MessageEvent).data);
+
+      source.addEventListener("code_generated", () =>
+        setProgressLabel("Rendering animation...")
+      );
+      source.addEventListener("render_progress", (event) => {
+        const progress = parse(event);
+        setProgressLabel(
+          `Rendering animation ${progress.animation + 1}: ${progress.percent}%`
+        );
+      });
+      source.addEventListener("upload_started", () =>
+        setProgressLabel("Uploading video...")
+      );
+      source.addEventListener("completed", (event) => {
+        source.close();
+        resolve(parse(event).result);
+      });
+      source.addEventListener("failed", (event) => {
+        source.close();
+        reject(new Error(parse(event).error));
+      });
+      source.addEventListener("cancelled", (event) => {
+        source.close();
+        reject(new Error(parse(event).error));
+      });
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          reject(new Error("Lost connection to the job event stream."));
+        }
+      };
+    });
+
   const handleSendMessage = async (content: string) => {
     let sessionToUse = currentSession;
 
@@ -152,7 +249,7 @@ const loadSession = async (sessionId: string) => {
       if (!sessionToUse) {
         throw new Error("No session available to send the message.");
       }
-      const response = await axios.post(
+      const jobResponse = await axios.post(
         `${backendURL}/api/generate`,
         {
           prompt: content,
@@ -164,23 +261,33 @@ const loadSession = async (sessionId: string) => {
           },
         }
       );
+      setProgressLabel("Generating animation...");
+      const result = await waitForJob(jobResponse.data.job_id);
       const aiMessage: MessageType = {
-        id: response.data.message_id || `ai-${Date.now()}`,
+        id: result.message_id || `ai-${Date.now()}`,
         content: "Here's your animation!",
         sender: "ai",
         timestamp: new Date(),
-        animation: response.data.video_url,
+        animation: resolveVideoUrl(result.video_url),
+        poster: resolveVideoUrl(result.poster_url),
       };
 
       setMessages((prev) => [...prev, aiMessage]);
-      if (response.data.session_id) {
+      if (result.session_id) {
         loadSessions();
       }
     } catch (error) {
       console.log(error);
+      // 429: the server is busy or this client already has enough animations in progress
+      const retryAfter =
+        axios.isAxiosError(error) && error.response?.status === 429
+          ? error.response.headers["retry-after"]
+          : null;
       const errorMessage: MessageType = {
         id: `ai-error-${Date.now()}`,
-        content: "Oops! Something went wrong. Please try again.",
+        content: retryAfter
+          ? `Too many animations in progress right now. Please try again in ${retryAfter} seconds.`
+          : "Oops! Something went wrong. Please try again.",
         sender: "ai",
         timestamp: new Date(),
       };
@@ -198,6 +305,8 @@ const loadSession = async (sessionId: string) => {
         onCreateNewSession={createNewSession}
         onLoadSession={loadSession}
         onDeleteSession={deleteSession}
+        hasMoreSessions={sessionsCursor !== null}
+        onLoadMoreSessions={loadMoreSessions}
       />
 
       <div className="flex flex-col flex-1 h-full">
@@ -228,6 +337,14 @@ const loadSession = async (sessionId: string) => {
                 </div>
               )}
 
+              {messagesCursor && (
+                <div className="flex justify-center">
+                  <Button variant="ghost" onClick={loadEarlierMessages}>
+                    Load earlier messages
+                  </Button>
+                </div>
+              )}
+
               {messages.map((message) => (
                 <ChatMessage key={message.id} message={message} />
               ))}
@@ -236,7 +353,7 @@ const loadSession = async (sessionId: string) => {
                 <div className="flex items-center justify-center space-x-2">
                   <Loader2 className="h-4 w-4 animate-spin" />
                   <p className="text-sm text-muted-foreground">
-                    Generating animation...
+                    {progressLabel}
                   </p>
                 </div>
               )}
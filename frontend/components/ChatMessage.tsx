@@ -13,7 +13,7 @@ export type MessageType = {
   sender: "user" | "ai";
   timestamp: Date;
   animation?: string;
-
+  poster?: string;
 };
 
 interface ChatMessageProps {
@@ -98,6 +98,8 @@ export function ChatMessage({ message }: ChatMessageProps) {
             <div className="mt-2 rounded-lg overflow-hidden border border-border">
               <video
                 src={message.animation}
+                poster={message.poster}
+                preload={message.poster ? "metadata" : "auto"}
                 controls
                 autoPlay
                 className="w-full max-w-sm h-auto"
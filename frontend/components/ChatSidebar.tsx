@@ -31,6 +31,8 @@ interface ChatSidebarProps {
   onCreateNewSession: () => void
   onLoadSession: (sessionId: string) => void
   onDeleteSession: (sessionId: string) => void
+  hasMoreSessions?: boolean
+  onLoadMoreSessions?: () => void
 }
 
 export function ChatSidebar({
@@ -39,6 +41,8 @@ export function ChatSidebar({
   onCreateNewSession,
   onLoadSession,
   onDeleteSession,
+  hasMoreSessions = false,
+  onLoadMoreSessions,
 }: ChatSidebarProps) {
   const { toggleSidebar } = useSidebar()
   const [hoveredSession, setHoveredSession] = useState<string | null>(null)
@@ -115,6 +119,11 @@ export function ChatSidebar({
                 </div>
               </div>
             ))}
+            {hasMoreSessions && (
+              <Button variant="ghost" className="w-full mt-2" onClick={onLoadMoreSessions}>
+                Load more
+              </Button>
+            )}
           </SidebarGroupContent>
         </SidebarGroup>
       </SidebarContent>